@@ -5,12 +5,56 @@ Created on Wed Sep 26 08:16:36 2018
 
 @author: andrewcarroll
 """
-import requests
-from requests_toolbelt import MultipartEncoder
-from einstein_constants import LANG_BASE_URL
+import csv
+import gzip
 import json
+import os
+import shutil
+import tempfile
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from random import randint
 
+import einstein_constants
+from einstein_backoff import Backoff, jitter
+from job_journal import row_key
+
+
+def state_of_dataset(metadata):
+    """Lifecycle state (AVAILABLE, FAILED or NOT_AVAILABLE) of dataset metadata, or None."""
+    if not metadata or 'available' not in metadata:
+        return None
+    if metadata['available']:
+        return einstein_constants.DATASET_AVAILABLE
+    if str(metadata.get('statusMsg','')).startswith('FAILURE'):
+        return einstein_constants.DATASET_FAILED
+    return einstein_constants.DATASET_NOT_AVAILABLE
+
+
+def _refused(status_code):
+    """Whether a status call failed in a way that polling again will not change."""
+    # 429 is throttling, which the session's rate governor waits out
+    return 400 <= status_code < 500 and status_code != 429
+
+
+class PredictionResult(namedtuple('PredictionResult',
+                                  ['index','document','response','status_code','error'])):
+    """Outcome of one document in Model.predict_many.
+
+    Attributes:
+        index (int): Position of the document in the input.
+        document (str): The document that was classified.
+        response (dict): JSON returned by the intent endpoint, None if the call raised.
+        status_code (int): HTTP status code, None if the call raised.
+        error (Exception): Exception raised by the call, None if it completed.
+    """
+
+    @property
+    def ok(self):
+        return self.error is None and self.status_code == 200
+
+
 class Dataset:
     """The dataset class contains methods for creating and interacting with datasets.
 
@@ -18,18 +62,25 @@ class Dataset:
     and interacting with datasets in EPS. 
     """
     
-    def __init__(self,einstein_session,datasetId=None):
+    def __init__(self,einstein_session,datasetId=None,example_index=None,catalog=None):
         """Init method associates a session and, if provided a datasetId, queries the status.
 
         Note:
             If a datasetId is provided, the init method will make a call to the EPS API to query
             the status of the dataset with that ID. Othwerise, the object is returned with no data.
+            With a catalog that holds the dataset in a terminal state, its metadata is taken
+            from the catalog instead, without a call.
 
         Args:
             einstein_session (EinsteinPlatformSession): An active EinsteinPlatformSession object
                 whose information will be used for each API call.
             datasetId (:obj:`str`, optional): If provided, the a call will be made to query the
                 status of the dataset with the given ID in Einstein Intent during the initialization.
+            example_index (ExampleIndex, optional): Index of the examples known to be in the
+                dataset. It is seeded from uploaded files and accepted feedback, and add_examples
+                and FeedbackUploader skip examples it already holds.
+            catalog (EinsteinCatalog, optional): Local catalog serving the initial status
+                and get_associated_models, and recording every status fetched.
 
         Attributes:
             session (EinsteinPlatformSession): A name for the active session.
@@ -44,18 +95,22 @@ class Dataset:
         self.dataset_metadata = None
         self.labels=[]
         self.associated_models=[]
+        self.example_index = example_index
+        self.catalog = catalog
+        self.status_max_age = einstein_constants.STATUS_MAX_AGE
+        self._status_checked_at = 0
 
         if datasetId:
-            _,_ = self.update_dataset_status()
+            cached = catalog.dataset(datasetId) if catalog is not None else None
+            if state_of_dataset(cached) in einstein_constants.DATASET_TERMINAL_STATES:
+                self._accept_metadata(cached)
+            else:
+                _,_ = self.update_dataset_status()
     
     def __repr__(self):
         return '<Dataset %s, %s>'%(
                 self.datasetId,self.__class__.__name__)
         
-    def header_helper(self,multipart_data):
-        return {'Authorization': 'Bearer ' + self.session.token,
-                'Content-Type': multipart_data.content_type}
-
     def reset_token(self,session_time=3600):
         """Class method to resest an Authorization Token for access to Einstein Platform Services.
 
@@ -64,7 +119,7 @@ class Dataset:
         """
         self.session.reset_authorization_token(session_time)
 
-    def create_dataset(self,filepath=None,urlpath=None):
+    def create_dataset(self,filepath=None,urlpath=None,progress_callback=None,compress=False,max_retries=3):
         """Class method for creating a dataset in EPS.
 
         The create_dataset method, when provided with a means of accessing a data file, will
@@ -75,37 +130,145 @@ class Dataset:
             At least one of the two optional arguments must be provided. An assertion failure
             will result if the datasetId has already been provided (in this case, make a new object).
 
+            A local file is streamed from disk as a multipart file part, so memory use
+            does not depend on its size. An upload interrupted by a connection error or
+            a 5xx response is restarted from the beginning of the file, up to max_retries
+            times.
+
         Args:
             filepath (str, optional): Filepath to a comma-separated-values file to upload as dataset.
             urlpath (str, optional): url pointing to a comma-separated-values file to upload as dataset.
+            progress_callback (callable, optional): Called with (bytes_sent, total_bytes,
+                bytes_per_second) at most twice a second while a local file is uploaded.
+            compress (bool, default = False): gzip the local file (streamed through a temporary
+                file) and send it as <name>.gz with type application/gzip. Only use this with
+                an endpoint that accepts gzip uploads.
+            max_retries (int, default = 3): Times a failed upload of a local file is restarted.
         """
         
         assert not self.datasetId, """This dataset has already been populated.
 To create a new dataset, make a new Dataset object"""
         assert (filepath or urlpath), "User must provide filepath or urlpath"
         if filepath:
-            print('Warning: this has issues on Mac OS')
-            multipart_data = MultipartEncoder(
-                    fields={
-                        'data': '@'+filepath,
-                        'type': 'text-intent'})
+            res = self._upload_file('POST',self.session.LANG_PATH+'/datasets/upload',filepath,
+                                    progress_callback,compress,max_retries,{'type': 'text-intent'})
         elif urlpath:
-            multipart_data = MultipartEncoder(
-                    fields={
-                        'path': urlpath,
-                        'type': 'text-intent'})
-
-
-        res = requests.post(LANG_BASE_URL+'/datasets/upload',
-                            headers=self.header_helper(multipart_data),
-                            data=multipart_data)
+            res = self.session.request('POST',self.session.LANG_PATH+'/datasets/upload',
+                                       fields={'path': urlpath,
+                                               'type': 'text-intent'})
         if res.ok:
             self.datasetId = str(json.loads(res.text)['id'])
             self.dataset_metadata = json.loads(res.text)
+            if filepath and self.example_index is not None:
+                self.example_index.add_csv(self.datasetId,filepath)
         
         return json.loads(res.text), res.status_code
             
 
+    def add_examples(self,filepath,progress_callback=None,max_retries=3):
+        """Class method for adding the examples of a local file to the existing dataset.
+
+        Note:
+            With an example_index, only the rows it does not already hold are uploaded,
+            through a temporary file, and no call is made if every row is known.
+
+        Args:
+            filepath (str): Comma-separated-values file of (document, label) rows.
+            progress_callback (callable, optional): As for create_dataset.
+            max_retries (int, default = 3): Times a failed upload is restarted.
+
+        Returns:
+            (dict, int): The dataset metadata returned by the API and the status code, or
+                (None, None) if there was nothing new to upload.
+        """
+        assert self.datasetId, "No dataset found."
+        from dataset_validator import read_chunks  # needs numpy, imported only here
+        upload_path = filepath
+        new_rows = None
+        try:
+            if self.example_index is not None:
+                new_rows = 0
+                with open(filepath,'r',newline='',encoding='utf-8',errors='surrogateescape') as f, \
+                        tempfile.NamedTemporaryFile('w',suffix='.csv',newline='',encoding='utf-8',
+                                                    errors='surrogateescape',delete=False) as tmp:
+                    # Set at once, so the file is removed even if reading the source fails
+                    upload_path = tmp.name
+                    writer = csv.writer(tmp)
+                    for docs, labels, blank in read_chunks(f):
+                        examples = [(d, l) for d, l, b in zip(docs,labels,blank) if not b]
+                        fresh = self.example_index.filter_new(self.datasetId,examples)
+                        writer.writerows(fresh)
+                        new_rows += len(fresh)
+            if new_rows == 0:
+                return None, None
+            res = self._upload_file('PUT',self.session.LANG_PATH+'/datasets/%s/upload'%self.datasetId,
+                                    upload_path,progress_callback,False,max_retries,{})
+            if res.ok and self.example_index is not None:
+                self.example_index.add_csv(self.datasetId,upload_path)
+            return json.loads(res.text), res.status_code
+        finally:
+            if upload_path != filepath:
+                os.remove(upload_path)
+
+    def _upload_file(self,method,url,filepath,progress_callback,compress,max_retries,extra_fields):
+        upload_path = filepath
+        filename = os.path.basename(filepath)
+        content_type = 'text/csv'
+        try:
+            if compress:
+                with tempfile.NamedTemporaryFile(suffix='.gz',delete=False) as tmp:
+                    # Set at once, so the file is removed even if compressing fails
+                    upload_path = tmp.name
+                    with open(filepath,'rb') as src, gzip.GzipFile(filename=filename,fileobj=tmp,mode='wb') as gz:
+                        shutil.copyfileobj(src,gz,1<<20)
+                filename += '.gz'
+                content_type = 'application/gzip'
+            return self._send_file(method,url,upload_path,filename,content_type,
+                                   progress_callback,max_retries,extra_fields)
+        finally:
+            if upload_path != filepath:
+                os.remove(upload_path)
+
+    def _send_file(self,method,url,upload_path,filename,content_type,progress_callback,
+                   max_retries,extra_fields):
+        opened = []
+        def fields():
+            f = open(upload_path,'rb')
+            opened.append(f)
+            fields = {'data': (filename, f, content_type)}
+            fields.update(extra_fields)
+            return fields
+
+        progress = {'started': time.time(), 'reported': 0, 'bytes': None}
+        def monitor(encoder):
+            now = time.time()
+            if progress_callback is None or encoder.bytes_read == progress['bytes']:
+                return
+            if now-progress['reported'] >= 0.5 or encoder.bytes_read >= encoder.len:
+                progress['reported'] = now
+                progress['bytes'] = encoder.bytes_read
+                elapsed = now-progress['started']
+                progress_callback(encoder.bytes_read,encoder.len,
+                                  encoder.bytes_read/elapsed if elapsed else 0.0)
+
+        backoff = Backoff(initial=2,maximum=60)
+        for attempt in range(max_retries+1):
+            progress['started'] = time.time()
+            try:
+                res = self.session.request(method,url,
+                                           fields=fields,
+                                           monitor_callback=monitor)
+            except OSError:
+                if attempt == max_retries:
+                    raise
+            else:
+                if res.status_code < 500 or attempt == max_retries:
+                    return res
+            finally:
+                while opened:
+                    opened.pop().close()
+            time.sleep(backoff.next_delay())
+
     def delete_self(self):
         """Class method for deleting the dataset from EPS.
 
@@ -113,17 +276,11 @@ To create a new dataset, make a new Dataset object"""
             EPS dataset is not immediately deleted. As a result, the object stays alive
             so that the user can query the deletion status.            
         """
-        headers = {'Authorization': 'Bearer ' + self.session.token}
-        status_update = requests.delete(LANG_BASE_URL+'/datasets/'+self.datasetId,
-                                     headers=headers
-                                     )
+        status_update = self.session.request('DELETE',self.session.LANG_PATH+'/datasets/'+self.datasetId)
         return json.loads(status_update.text), status_update.status_code
 
     def update_deletion_status(self):
-        headers = {'Authorization': 'Bearer ' + self.session.token}
-        status_update = requests.delete(LANG_BASE_URL+'/deletion/'+self.datasetId,
-                                     headers=headers
-                                     )
+        status_update = self.session.request('DELETE',self.session.LANG_PATH+'/deletion/'+self.datasetId)
         return json.loads(status_update.text), status_update.status_code
         
     def update_dataset_status(self):
@@ -131,25 +288,26 @@ To create a new dataset, make a new Dataset object"""
 
         """
         assert self.datasetId, "No dataset found."
-        multipart_data = MultipartEncoder(
-                                fields={'type': 'text-intent'})
+        status_update = self.session.request('GET',self.session.LANG_PATH+'/datasets/'+self.datasetId,
+                                             fields={'type': 'text-intent'})
 
-        status_update = requests.get(LANG_BASE_URL+'/datasets/'+self.datasetId,
-                                     headers=self.header_helper(multipart_data),
-                                     data=multipart_data
-                                     )
+        self._accept_metadata(json.loads(status_update.text))
+        if status_update.status_code != 200:
+            print("There's a problem. Check the status code, %s"%status_update.status_code)
+        elif self.catalog is not None:
+            self.catalog.record_dataset(self.dataset_metadata)
+            
+        return json.loads(status_update.text), status_update.status_code
 
-        self.dataset_metadata = json.loads(status_update.text)
+    def _accept_metadata(self,metadata):
+        self.dataset_metadata = metadata
+        self._status_checked_at = time.time()
         try:
             for l in self.dataset_metadata['labelSummary']['labels']:
                 if l['name'] not in self.labels:
                     self.labels.append(l['name'])
         except:
             print("Could not find labels in %s"%self.dataset_metadata)
-        if status_update.status_code != 200:
-            print("There's a problem. Check the status code, %s"%status_update.status_code)
-            
-        return json.loads(status_update.text), status_update.status_code
 
     @property
     def dataset_isReady(self):
@@ -158,26 +316,97 @@ To create a new dataset, make a new Dataset object"""
     @dataset_isReady.getter
     def dataset_isReady(self):
         try:
-            if not self.dataset_metadata['available']:
-                _,_ = self.update_dataset_status()
-            return self.dataset_metadata['available']
+            return self.refresh_dataset_state() == einstein_constants.DATASET_AVAILABLE
         except:
             print('Make sure there is dataset_metadata')
             return False
+
+    @property
+    def dataset_state(self):
+        """Lifecycle state from the last known metadata, without calling the API.
+
+        One of AVAILABLE, FAILED or NOT_AVAILABLE, or None before any metadata is known.
+        """
+        return state_of_dataset(self.dataset_metadata)
+
+    def refresh_dataset_state(self,max_age=None):
+        """Return the dataset state, polling the API only if it may have changed.
+
+        Note:
+            Terminal states are never polled again. Other states are trusted for
+            max_age seconds, so a burst of readiness checks makes at most one call.
+
+        Args:
+            max_age (float, optional): Defaults to the status_max_age attribute.
+        """
+        if max_age is None:
+            max_age = self.status_max_age
+        state = self.dataset_state
+        if state in einstein_constants.DATASET_TERMINAL_STATES:
+            return state
+        if time.time()-self._status_checked_at >= max_age:
+            _,_ = self.update_dataset_status()
+        return self.dataset_state
+
+    def wait_until_ready(self,timeout=None,initial_delay=1,max_delay=60):
+        """Block until the dataset is available or has failed.
+
+        Polls the dataset status with exponential backoff and jitter.
+
+        Args:
+            timeout (float, optional): Seconds to wait before raising TimeoutError.
+                Waits indefinitely if None.
+            initial_delay (float, default = 1): First delay between polls, in seconds.
+            max_delay (float, default = 60): Longest delay between polls, in seconds.
+
+        Returns:
+            True if the dataset is available, False if processing failed or the status
+            call was refused with a 4xx status, e.g. 404 for an unknown dataset.
+        """
+        assert self.datasetId, "No dataset found."
+        deadline = time.time()+timeout if timeout is not None else None
+        backoff = Backoff(initial=initial_delay,maximum=max_delay)
+        while True:
+            state = self.dataset_state
+            if state not in einstein_constants.DATASET_TERMINAL_STATES:
+                _, status_code = self.update_dataset_status()
+                if _refused(status_code):
+                    return False
+                state = self.dataset_state
+            if state in einstein_constants.DATASET_TERMINAL_STATES:
+                return state == einstein_constants.DATASET_AVAILABLE
+            delay = backoff.next_delay()
+            if deadline is not None:
+                remaining = deadline-time.time()
+                if remaining <= 0:
+                    raise TimeoutError('Dataset %s is still %s after %s seconds'
+                                       %(self.datasetId,state,timeout))
+                delay = min(delay,remaining)
+            time.sleep(delay)
     
     def get_associated_models(self):
-        
-        headers={'Authorization': 'Bearer ' + self.session.token}
-        
-        assoc_models = requests.get(LANG_BASE_URL+'/datasets/%s/models'%self.datasetId,
-                                     headers=headers)
+        if self.catalog is not None:
+            # Fetches the listing only once the catalog's copy is stale
+            self.catalog.sync_models(self.datasetId)
+            return self.catalog.get_associated_models(self.datasetId)
+        assoc_models = self.session.request('GET',self.session.LANG_PATH+'/datasets/%s/models'%self.datasetId)
         
         return json.loads(assoc_models.text), assoc_models.status_code
+
+    def iter_models(self,page_size=25,prefetch=True):
+        """Yield the metadata of every model trained on the dataset, a page at a time.
+
+        See EinsteinPlatformSession.iter_pages.
+        """
+        assert self.datasetId, "No dataset found."
+        return self.session.iter_pages(self.session.LANG_PATH+'/datasets/%s/models'%self.datasetId,
+                                       page_size,prefetch)
     
     
 class Model:
 
-    def __init__(self,dataset=None,session=None,datasetId=None,modelId=None,model_name=None):
+    def __init__(self,dataset=None,session=None,datasetId=None,modelId=None,model_name=None,cache=None,
+                 catalog=None):
         """Model objects are containers for the API calls used with models.
 
         The model object can be initialized with various start data. It must be linked to
@@ -195,6 +424,13 @@ class Model:
             modelId (str, optional): Model ID if there is already an existing model in EPS.
             model_name (str, optional): Optional name for the model, will be randomly generated
                 if left empty.
+            cache (PredictionCache, optional): Cache consulted by predict before calling the
+                API. Entries are keyed on the model's version (model_version), and those
+                of this model are invalidated when a status poll sees a training or
+                retraining of it succeed.
+            catalog (EinsteinCatalog, optional): Local catalog recording every status
+                fetched, and serving the dataset linked by datasetId. The model's own
+                status is always fetched, as its version keys the prediction cache.
         
         Attributes:
             model_metadata (dict): Dictionary of model information scraped from API call,
@@ -202,6 +438,10 @@ class Model:
         """
 
         self.model_metadata = None
+        self.cache = cache
+        self.catalog = catalog
+        self.status_max_age = einstein_constants.STATUS_MAX_AGE
+        self._status_checked_at = 0
         self.modelId = modelId
 
         if dataset:
@@ -211,30 +451,33 @@ class Model:
             if not session:
                 print("Model class requires a session, which hasn't been provided")
             else:
+                self.session = session
                 if datasetId:
-                    self.dataset=Dataset(session,datasetId=datasetId)
-                else:
+                    self.dataset=Dataset(session,datasetId=datasetId,catalog=catalog)
+                elif not modelId:
+                    # An existing model can be used without its dataset, e.g. to predict
                     print("Model requires either a dataset object or a dataset ID with which to create said object.")
         
         if modelId:
             self.model_metadata, status_code = self.update_model_status()
             if status_code != 200:
                 print("Irregular status code %s. There may be no metadata." % status_code)
-            
-    def header_helper(self,multipart_data):
-        return {'Authorization': 'Bearer ' + self.session.token,
-                'Content-Type': multipart_data.content_type}
-        
+
     def update_model_status(self):
         assert self.modelId, "No model found."
-        multipart_data = MultipartEncoder(
-                                fields={'type': 'text-intent'})
-
-        status = requests.get(LANG_BASE_URL+'/train/'+self.modelId,
-                              headers=self.header_helper(multipart_data),
-                              data=multipart_data)
+        status = self.session.request('GET',self.session.LANG_PATH+'/train/'+self.modelId,
+                                      fields={'type': 'text-intent'})
         
+        previous_state = self.model_state
         self.model_metadata = json.loads(status.text)
+        self._status_checked_at = time.time()
+        if (self.cache is not None and previous_state in (einstein_constants.MODEL_QUEUED,
+                                                          einstein_constants.MODEL_RUNNING)
+                and self.model_state == einstein_constants.MODEL_SUCCEEDED):
+            # Predictions cached until now came from the previous version of the model
+            self.cache.invalidate(self.modelId)
+        if self.catalog is not None and status.status_code == 200:
+            self.catalog.record_model(self.model_metadata)
         
         return self.model_metadata, status.status_code        
 
@@ -257,35 +500,119 @@ class Model:
         except TypeError:
             return self.__modelId
 
+    @property
+    def model_version(self):
+        """updatedAt (or createdAt) of the last status seen, which changes with every retrain."""
+        if not self.model_metadata:
+            return None
+        return self.model_metadata.get('updatedAt') or self.model_metadata.get('createdAt')
+
     @property
     def model_isReady(self):
         pass
     
     @model_isReady.getter
     def model_isReady(self):
+        if not self.modelId:
+            return False
         try:
-            if self.model_metadata['status']!='SUCCEEDED':
-                _,_ = self.update_model_status()
-            return (self.model_metadata['status']=='SUCCEEDED') or (self.model_metadata['status']=='FAILED')
+            return self.refresh_model_state() in einstein_constants.MODEL_TERMINAL_STATES
         except KeyError:
             return False
         except AttributeError:
             return False
+
+    @property
+    def model_state(self):
+        """Training status from the last known metadata, without calling the API.
+
+        One of QUEUED, RUNNING, SUCCEEDED or FAILED, or None before any status is known.
+        """
+        try:
+            return self.model_metadata['status']
+        except (KeyError, TypeError):
+            return None
+
+    def refresh_model_state(self,max_age=None):
+        """Return the training status, polling the API only if it may have changed.
+
+        Note:
+            SUCCEEDED and FAILED are never polled again, so predict makes no status
+            calls once the model is trained. Other states are trusted for max_age
+            seconds, so a burst of calls during training makes at most one status call.
+
+        Args:
+            max_age (float, optional): Defaults to the status_max_age attribute.
+        """
+        if max_age is None:
+            max_age = self.status_max_age
+        state = self.model_state
+        if state in einstein_constants.MODEL_TERMINAL_STATES:
+            return state
+        if time.time()-self._status_checked_at >= max_age:
+            _,_ = self.update_model_status()
+        return self.model_state
+
+    def wait_until_ready(self,timeout=None,initial_delay=1,max_delay=60):
+        """Block until the model has finished training.
+
+        Polls the training status with exponential backoff and jitter. Once the
+        train response reports progress, the next poll is instead scheduled around
+        half of the remaining time estimated from the progress rate.
+
+        Args:
+            timeout (float, optional): Seconds to wait before raising TimeoutError.
+                Waits indefinitely if None.
+            initial_delay (float, default = 1): Shortest delay between polls, in seconds.
+            max_delay (float, default = 60): Longest delay between polls, in seconds.
+
+        Returns:
+            True if training succeeded, False if it failed or the status call was
+            refused with a 4xx status, e.g. 404 for an unknown model.
+        """
+        assert self.modelId, "No model found."
+        start = time.time()
+        deadline = start+timeout if timeout is not None else None
+        backoff = Backoff(initial=initial_delay,maximum=max_delay)
+        first_progress = None
+        while True:
+            state = self.model_state
+            if state not in einstein_constants.MODEL_TERMINAL_STATES:
+                _, status_code = self.update_model_status()
+                if _refused(status_code):
+                    return False
+                state = self.model_state
+            if state in einstein_constants.MODEL_TERMINAL_STATES:
+                return state == einstein_constants.MODEL_SUCCEEDED
+
+            delay = backoff.next_delay()
+            progress = self.model_metadata.get('progress') if self.model_metadata else None
+            if isinstance(progress,(int,float)) and 0 < progress < 1:
+                if first_progress is None:
+                    first_progress = (time.time(), progress)
+                elif progress > first_progress[1]:
+                    rate = (progress-first_progress[1])/(time.time()-first_progress[0])
+                    estimate = (1-progress)/rate
+                    delay = jitter(min(max(estimate/2,initial_delay),max_delay))
+
+            if deadline is not None:
+                remaining = deadline-time.time()
+                if remaining <= 0:
+                    raise TimeoutError('Model %s is still %s after %s seconds'
+                                       %(self.modelId,state,timeout))
+                delay = min(delay,remaining)
+            time.sleep(delay)
         
     def train_model(self,model_name=None):
         if not model_name:
             model_name = 'Model_'+str(randint(10000,99999))
-            
-        
-        multipart_data = MultipartEncoder(
-                            fields={'name': model_name,
-                                    'datasetId': self.dataset.datasetId})
 
-        post_res = requests.post(LANG_BASE_URL+'/train',
-                                     headers=self.header_helper(multipart_data),
-                                     data=multipart_data)
+        post_res = self.session.request('POST',self.session.LANG_PATH+'/train',
+                                        fields={'name': model_name,
+                                                'datasetId': self.dataset.datasetId})
 
         self.model_metadata = json.loads(post_res.text)
+        self._status_checked_at = time.time()
 
         try:
             self.modelId = self.model_metadata['modelId']
@@ -296,14 +623,13 @@ class Model:
 
     def submit_feedback(self,document,expectedLabel,verbose=False):
         assert self.modelId, "No model found."
-        multipart_data = MultipartEncoder(
-                fields={'modelId': self.modelId,
-                        'document': document,
-                        'expectedLabel': expectedLabel})
-
-        post_status = requests.post(LANG_BASE_URL+'/feedback',
-                                    headers=self.header_helper(multipart_data),
-                                    data=multipart_data)
+        post_status = self.session.request('POST',self.session.LANG_PATH+'/feedback',
+                                           fields={'modelId': self.modelId,
+                                                   'document': document,
+                                                   'expectedLabel': expectedLabel})
+        index = getattr(self.dataset,'example_index',None)
+        if post_status.ok and index is not None:
+            index.add(self.dataset.datasetId,document,expectedLabel)
         if verbose:
             if post_status.ok:
                 feedback_dict = json.loads(post_status.text)
@@ -326,15 +652,12 @@ class Model:
         else:
             feedback='false'
         
-        multipart_data = MultipartEncoder(
-                    fields={'modelId': self.modelId,
-                            'trainParams': '{"withFeedback":%s, "trainSplitRatio": 0.7}'%feedback})
-
-        post_res = requests.post(LANG_BASE_URL+'/retrain',
-                                 headers=self.header_helper(multipart_data),
-                                 data=multipart_data)
+        post_res = self.session.request('POST',self.session.LANG_PATH+'/retrain',
+                                        fields={'modelId': self.modelId,
+                                                'trainParams': '{"withFeedback":%s, "trainSplitRatio": 0.7}'%feedback})
         
         self.model_metadata = json.loads(post_res.text)
+        self._status_checked_at = time.time()
         
         return json.loads(post_res.text), post_res.status_code
     
@@ -343,36 +666,126 @@ class Model:
         assert self.modelId, "No model available."
         assert self.model_isReady, "The model hasn't completed training."
 
-        multipart_data = MultipartEncoder(
-                fields={'modelId': self.modelId,
-                        'document': document})
+        return self._request_prediction(document)
 
-        prediction_status = requests.post(LANG_BASE_URL+'/intent',
-                                   headers=self.header_helper(multipart_data),
-                                   data=multipart_data)
-            
-        return json.loads(prediction_status.text), prediction_status.status_code
+    def _request_prediction(self,document):
+        if self.cache is not None:
+            version = self.model_version
+            generation = self.cache.generation
+            cached = self.cache.get(self.modelId,document,version)
+            if cached is not None:
+                return cached, 200
+
+        prediction_status = self.session.request('POST',self.session.LANG_PATH+'/intent',
+                                                 fields={'modelId': self.modelId,
+                                                         'document': document})
+        prediction = json.loads(prediction_status.text)
+        if self.cache is not None and prediction_status.status_code == 200:
+            self.cache.put(self.modelId,document,prediction,version,generation)
+
+        return prediction, prediction_status.status_code
+
+    def _predict_item(self,index,document):
+        try:
+            response, status_code = self._request_prediction(document)
+        except Exception as e:
+            return PredictionResult(index, document, None, None, e)
+        return PredictionResult(index, document, response, status_code, None)
+
+    def predict_many(self,documents,max_workers=8,ordered=True,max_pending=None,journal=None):
+        """Classify many documents concurrently, yielding results as a stream.
+
+        Note:
+            The model's readiness is checked once for the whole batch. At most
+            max_pending documents are read from the input ahead of the results
+            consumed, so memory use does not grow with the size of the input. A
+            failing document is reported in its PredictionResult and the batch
+            carries on.
+
+        Args:
+            documents (iterable): Any iterable or generator of documents.
+            max_workers (int, default = 8): Number of concurrent prediction calls. Keep it
+                at or below the session transport's pool_maxsize.
+            ordered (bool, default = True): Yield results in input order. If False,
+                results are yielded as soon as they complete.
+            max_pending (int, optional): Maximum number of submitted but unconsumed
+                documents, defaults to twice max_workers.
+            journal (JobJournal, optional): Journal recording each document's prediction,
+                keyed on its position and text. Documents it already holds as predicted
+                are not sent again: their result is yielded from the journal, in place,
+                so a restarted job resumes where it stopped and still yields one result
+                per document.
+
+        Returns:
+            Generator of PredictionResult.
+        """
+        assert self.modelId, "No model available."
+        assert self.model_isReady, "The model hasn't completed training."
+        if not max_pending:
+            max_pending = 2*max_workers
+        assert max_pending >= max_workers, "max_pending must be at least max_workers"
+
+        return self._predict_stream(documents,max_workers,ordered,max_pending,journal)
+
+    def _journaled_result(self,journal,index,document):
+        future = Future()
+        future.set_result(PredictionResult(index, document,
+                                           journal.outcome(row_key(index,document)), 200, None))
+        return future
+
+    def _predict_stream(self,documents,max_workers,ordered,max_pending,journal=None):
+        items = enumerate(documents)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = deque() if ordered else set()
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        index, document = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if journal is not None and journal.is_done(row_key(index,document)):
+                        future = self._journaled_result(journal,index,document)
+                    else:
+                        future = executor.submit(self._predict_item,index,document)
+                    if ordered:
+                        pending.append(future)
+                    else:
+                        pending.add(future)
+                if not pending:
+                    break
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending,return_when=FIRST_COMPLETED)
+                    pending.difference_update(done)
+                for future in done:
+                    result = future.result()
+                    key = row_key(result.index,result.document) if journal is not None else None
+                    if key is not None and not journal.is_done(key):
+                        journal.record(key,result.status_code,result.response)
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if journal is not None:
+                journal.flush()
 
     
     def get_model_metrics(self):
         assert self.model_isReady, "The model hasn't completed training."
-        
-        headers = {'Authorization': 'Bearer ' + self.session.token}
 
-
-        metrics_output = requests.get(LANG_BASE_URL+'/models/'+self.modelId,
-                                         headers=headers)
+        metrics_output = self.session.request('GET',self.session.LANG_PATH+'/models/'+self.modelId)
             
         return json.loads(metrics_output.text), metrics_output.status_code
     
     def get_learning_curve(self):
         assert self.model_isReady, "The model hasn't completed training."
-        
-        headers = {'Authorization': 'Bearer ' + self.session.token}
-
 
-        lc_output = requests.get(LANG_BASE_URL+'/models/%s/lc'%self.modelId,
-                                         headers=headers)
+        lc_output = self.session.request('GET',self.session.LANG_PATH+'/models/%s/lc'%self.modelId)
             
         return json.loads(lc_output.text), lc_output.status_code
 
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local pre-flight validation and profiling of a text-intent CSV before it is
+uploaded with Dataset.create_dataset.
+
+@author: andrewcarroll
+"""
+
+import csv
+import re
+from itertools import compress, islice
+from operator import itemgetter
+
+import numpy as np
+
+import einstein_constants
+
+# Undecodable bytes are read as lone surrogates with errors='surrogateescape'
+_UNDECODABLE = re.compile('[\udc80-\udcff]')
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MAX_SAMPLES = 10
+
+
+def read_chunks(f,chunk_size=100000,delimiter=','):
+    """Yield (documents, labels, blank mask) for each chunk of records of an open CSV file.
+
+    Documents and labels are parsed as by feedback_uploader.read_examples, with a
+    fast path for the usual two-column records. Blank records are kept, flagged in
+    the mask, so positions line up between passes over the same file.
+    """
+    reader = csv.reader(f,delimiter=delimiter)
+    first, last = itemgetter(0), itemgetter(-1)
+    while True:
+        rows = list(islice(reader,chunk_size))
+        if not rows:
+            return
+        n = len(rows)
+        widths = np.fromiter(map(len,rows),np.int64,n)
+        blank = np.zeros(n,bool)
+        irregular = np.flatnonzero(widths != 2)
+        originals = [rows[i] for i in irregular]
+        for i in irregular:
+            rows[i] = ('','')
+        docs = list(map(str.strip,map(first,rows)))
+        labels = list(map(str.strip,map(last,rows)))
+        for i, row in zip(irregular,originals):
+            if not any(field.strip() for field in row):
+                blank[i] = True
+                continue
+            docs[i] = delimiter.join(row[:-1]).strip()
+            labels[i] = row[-1].strip()
+        yield docs, labels, blank
+
+
+class ValidationReport:
+
+    def __init__(self,filepath):
+        """Findings of DatasetValidator.validate for one CSV file.
+
+        Attributes:
+            rows (int): Number of non-blank rows read.
+            label_counts (dict): Examples per label among rows that are not malformed.
+            clean_label_counts (dict): Examples per label left after cleaning.
+            empty_rows, overlong_rows, missing_label_rows, encoding_error_rows (int):
+                Malformed rows by reason. A row may have several.
+            duplicate_rows (int): Repeats of an earlier (document, label) pair.
+            conflicting_documents (int): Documents that appear with more than one label.
+            conflicting_rows (int): Rows holding one of those documents.
+            labels_below_minimum (dict): Labels left with fewer than the minimum number
+                of examples, with their count after cleaning.
+            samples (dict): Up to 10 row numbers (1-based CSV records, blank ones included)
+                of rows with each kind of issue.
+        """
+        self.filepath = filepath
+        self.rows = 0
+        self.label_counts = {}
+        self.clean_label_counts = {}
+        self.empty_rows = 0
+        self.overlong_rows = 0
+        self.missing_label_rows = 0
+        self.encoding_error_rows = 0
+        self.duplicate_rows = 0
+        self.conflicting_documents = 0
+        self.conflicting_rows = 0
+        self.labels_below_minimum = {}
+        self.clean_rows = 0
+        self.samples = {}
+
+    def __repr__(self):
+        return '<%s %s, %s rows, %s labels, %s>'%(
+                self.__class__.__name__,self.filepath,self.rows,len(self.label_counts),
+                'ok' if self.ok else 'has issues')
+
+    @property
+    def ok(self):
+        return not (self.empty_rows or self.overlong_rows or self.missing_label_rows or
+                    self.encoding_error_rows or self.duplicate_rows or
+                    self.conflicting_documents or self.labels_below_minimum)
+
+    def label_summary(self,clean=False):
+        """Label counts in the shape of the 'labelSummary' of the dataset metadata."""
+        counts = self.clean_label_counts if clean else self.label_counts
+        return {'labels': [{'name': name, 'numExamples': count}
+                           for name, count in sorted(counts.items())]}
+
+    def to_dict(self):
+        report = dict(self.__dict__)
+        report['ok'] = self.ok
+        report['labelSummary'] = self.label_summary()
+        return report
+
+
+class DatasetValidator:
+
+    def __init__(self,filepath,min_examples=einstein_constants.INTENT_MIN_EXAMPLES_PER_LABEL,
+                 max_length=einstein_constants.INTENT_MAX_DOCUMENT_LENGTH,chunk_size=100000,
+                 delimiter=',',encoding='utf-8'):
+        """Streams a (document, label) CSV file in chunks and checks it for upload.
+
+        Note:
+            Each chunk is reduced to NumPy columns of document hashes, label codes and
+            issue masks; duplicates, conflicts and label counts are then computed on
+            these columns for the whole file at once. Memory use is about 20 bytes per
+            row, independent of the length of the documents.
+
+        Args:
+            filepath (str): CSV file with the document in the first columns and the label
+                in the last one, as passed to Dataset.create_dataset.
+            min_examples (int, default = 5): Fewest examples a label must have.
+            max_length (int, default = 1000): Longest document accepted, in characters.
+            chunk_size (int, default = 100000): Rows processed per chunk.
+            delimiter (str, default = ','): CSV delimiter.
+            encoding (str, default = 'utf-8'): Expected file encoding. Bytes that do not
+                decode are reported as encoding errors.
+        """
+        self.filepath = filepath
+        self.min_examples = min_examples
+        self.max_length = max_length
+        self.chunk_size = chunk_size
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.report = None
+        self._keep = None
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.filepath)
+
+    def _open(self):
+        return open(self.filepath,'r',newline='',encoding=self.encoding,errors='surrogateescape')
+
+    def _chunks(self,f):
+        return read_chunks(f,self.chunk_size,self.delimiter)
+
+    def _sample(self,report,name,lines,mask):
+        samples = report.samples.setdefault(name,[])
+        if len(samples) < MAX_SAMPLES:
+            samples.extend(lines[np.flatnonzero(mask)[:MAX_SAMPLES-len(samples)]].tolist())
+
+    def validate(self):
+        """Read the whole file and return a ValidationReport."""
+        report = ValidationReport(self.filepath)
+        label_codes = {}
+        doc_hashes, codes, bad = [], [], []
+        records = 0
+
+        with self._open() as f:
+            for docs, labels, blank in self._chunks(f):
+                n = len(docs)
+                lines = np.arange(records+1,records+n+1)
+                records += n
+                lengths = np.fromiter(map(len,docs),np.int64,n)
+                empty = (lengths == 0) & ~blank
+                overlong = lengths > self.max_length
+                missing_label = (np.fromiter(map(len,labels),np.int64,n) == 0) & ~blank
+                encoding_error = np.zeros(n,bool)
+                if _UNDECODABLE.search('\x00'.join(docs)+'\x00'.join(labels)):
+                    encoding_error = np.fromiter((bool(_UNDECODABLE.search(d) or _UNDECODABLE.search(l))
+                                                  for d, l in zip(docs,labels)),bool,n)
+
+                for name, mask in (('empty',empty),('overlong',overlong),
+                                   ('missing_label',missing_label),('encoding_error',encoding_error)):
+                    setattr(report,name+'_rows',getattr(report,name+'_rows')+int(mask.sum()))
+                    self._sample(report,name,lines,mask)
+
+                report.rows += n-int(blank.sum())
+                doc_hashes.append(np.fromiter(map(hash,docs),np.int64,n).view(np.uint64))
+                for label in set(labels).difference(label_codes):
+                    label_codes[label] = len(label_codes)
+                codes.append(np.fromiter(map(label_codes.__getitem__,labels),np.int64,n))
+                bad.append(blank | empty | overlong | missing_label | encoding_error)
+
+        if not records:
+            self.report, self._keep = report, np.zeros(0,bool)
+            return report
+
+        doc_hashes = np.concatenate(doc_hashes)
+        codes = np.concatenate(codes)
+        lines = np.arange(1,records+1)
+        valid = ~np.concatenate(bad)
+        names = np.empty(len(label_codes),object)
+        for label, code in label_codes.items():
+            names[code] = label
+
+        counts = np.bincount(codes[valid],minlength=len(names))
+        report.label_counts = dict((names[i],int(c)) for i, c in enumerate(counts) if c)
+
+        # First occurrence of every (document, label) pair among valid rows
+        pairs = doc_hashes*_GOLDEN ^ codes.astype(np.uint64)
+        valid_index = np.flatnonzero(valid)
+        _, first = np.unique(pairs[valid_index],return_index=True)
+        first_occurrence = np.zeros(records,bool)
+        first_occurrence[valid_index[first]] = True
+        duplicate = valid & ~first_occurrence
+        report.duplicate_rows = int(duplicate.sum())
+        self._sample(report,'duplicate',lines,duplicate)
+
+        # Documents whose distinct pairs carry more than one label
+        distinct_docs, doc_pairs = np.unique(doc_hashes[first_occurrence],return_counts=True)
+        conflicting_docs = distinct_docs[doc_pairs > 1]
+        conflicting = valid & np.isin(doc_hashes,conflicting_docs)
+        report.conflicting_documents = len(conflicting_docs)
+        report.conflicting_rows = int(conflicting.sum())
+        self._sample(report,'conflicting',lines,conflicting)
+
+        keep = first_occurrence & ~conflicting
+        clean_counts = np.bincount(codes[keep],minlength=len(names))
+        below = (clean_counts > 0) & (clean_counts < self.min_examples)
+        below |= (counts > 0) & (clean_counts == 0)
+        report.labels_below_minimum = dict((names[i],int(clean_counts[i])) for i in np.flatnonzero(below))
+        keep &= ~below[codes]
+        clean_counts[below] = 0
+        report.clean_label_counts = dict((names[i],int(c)) for i, c in enumerate(clean_counts) if c)
+        report.clean_rows = int(keep.sum())
+
+        self.report, self._keep = report, keep
+        return report
+
+    def write_clean(self,output_path):
+        """Write the rows left after cleaning to output_path, ready for create_dataset.
+
+        Malformed rows, repeated pairs, rows of conflicting documents and rows of labels
+        below the minimum are dropped. Calls validate first if it has not run yet.
+
+        Returns:
+            Number of rows written.
+        """
+        if self._keep is None:
+            self.validate()
+        written = 0
+        start = 0
+        with self._open() as f, open(output_path,'w',newline='',encoding='utf-8') as out:
+            writer = csv.writer(out,delimiter=self.delimiter)
+            for docs, labels, _ in self._chunks(f):
+                mask = self._keep[start:start+len(docs)]
+                start += len(docs)
+                kept = list(compress(zip(docs,labels),mask))
+                writer.writerows(kept)
+                written += len(kept)
+        return written
+
+
+def validate_dataset(filepath,clean_path=None,**options):
+    """Validate a text-intent CSV file, optionally writing a cleaned copy.
+
+    Args:
+        filepath (str): CSV file to validate.
+        clean_path (str, optional): Where to write the cleaned file.
+        **options: Passed to DatasetValidator.
+
+    Returns:
+        ValidationReport
+    """
+    validator = DatasetValidator(filepath,**options)
+    report = validator.validate()
+    if clean_path:
+        validator.write_clean(clean_path)
+    return report
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio counterparts of EinsteinPlatformSession, Dataset and Model.
+
+Requires aiohttp. Every coroutine mirrors the blocking method of the same name
+and returns the same (dict, status_code) tuple, so thousands of calls can be in
+flight on one event loop without a thread per request.
+
+@author: andrewcarroll
+"""
+
+import asyncio
+import json
+import os
+import time
+from random import randint
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import einstein_constants
+from dataset import state_of_dataset
+from einstein_session import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TOKEN_TIMEOUT, EinsteinSessionBase
+from rate_governor import endpoint_class
+
+DEFAULT_LIMIT = 100
+DEFAULT_LIMIT_PER_HOST = 100
+DEFAULT_TIMEOUT = 60
+
+
+def multipart_form(fields):
+    """Encode fields as multipart/form-data, as MultipartEncoder does.
+
+    (filename, file, content_type) tuples are streamed as file parts.
+    """
+    writer = aiohttp.MultipartWriter('form-data')
+    for name, value in fields.items():
+        if isinstance(value,tuple):
+            filename, f, content_type = value
+            part = writer.append(f,{'Content-Type': content_type})
+            part.set_content_disposition('form-data', name=name, filename=filename)
+        else:
+            part = writer.append(value)
+            part.set_content_disposition('form-data', name=name)
+    return writer
+
+
+def _as_response(method,url,response,content):
+    """requests.Response holding an aiohttp response, so the governor and telemetry
+    read both kinds of session the same way."""
+    result = requests.models.Response()
+    result.status_code = response.status
+    result.reason = response.reason
+    result.headers = CaseInsensitiveDict(response.headers)
+    result._content = content
+    result.encoding = response.charset or 'utf-8'
+    result.url = str(response.url)
+    result.request = requests.Request(method,url).prepare()
+    length = response.request_info.headers.get('Content-Length')
+    if length is not None:
+        result.request.headers['Content-Length'] = length
+    return result
+
+
+class AsyncEinsteinPlatformSession(EinsteinSessionBase):
+
+    def __init__(self,email=None,private_key=None,cert_path=None,token=None,session_duration=3600,
+                 base_url=einstein_constants.EINSTEIN_BASE_URL,limit=DEFAULT_LIMIT,
+                 limit_per_host=DEFAULT_LIMIT_PER_HOST,timeout=DEFAULT_TIMEOUT,
+                 auto_refresh=True,refresh_margin=300,governor=None,telemetry=None,single_flight=None,
+                 token_timeout=TOKEN_TIMEOUT):
+        """Session object for the Einstein Platform API on an asyncio event loop.
+
+        Note:
+            No call is made while constructing the object. Use it as an async context
+            manager (or await start()) to request an access token when none is given,
+            and to close the connection pool afterwards. Calls go through the rate
+            governor, telemetry and single-flight objects as those of
+            EinsteinPlatformSession do, and a call answered 401 is replayed once
+            with a new token. There is no background timer: with auto_refresh, a
+            token about to expire is replaced before the next call.
+
+        Args:
+            email, private_key, cert_path, token, session_duration, base_url, governor,
+                telemetry, single_flight, token_timeout: as for EinsteinPlatformSession.
+            limit (int, default = 100): Maximum number of simultaneous connections.
+                Calls beyond the limit wait on the event loop for a free connection.
+            limit_per_host (int, default = 100): Maximum simultaneous connections per host.
+            timeout (float, default = 60): Total timeout of a call, in seconds.
+            auto_refresh (bool, default = True): When the session holds a private key,
+                request a new access token before a call made within refresh_margin
+                seconds of expiration_time.
+            refresh_margin (int, default = 300): Seconds before expiration_time at which
+                the token is replaced.
+
+        Attributes:
+            http (aiohttp.ClientSession): Keep-alive connection pool, created on first use.
+        """
+        EinsteinSessionBase.__init__(self,email,private_key,cert_path,token,session_duration,
+                                     base_url,auto_refresh,refresh_margin,governor,telemetry,
+                                     single_flight,token_timeout)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.http = None
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self,*exc_info):
+        await self.close()
+
+    async def start(self):
+        if not self.token:
+            assert(self.private_key), "PrivateKey Error: There was an error in retrieving the key"
+            await self.reset_authorization_token()
+        return self
+
+    def _client(self):
+        if self.http is None or self.http.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host)
+            self.http = aiohttp.ClientSession(connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.http
+
+    async def request(self,method,url,fields=None,headers=None,authorize=True,data=None,params=None):
+        """Send a call to the API and return its (dict, status_code)."""
+        response = await self.send(method,url,fields,headers,authorize,data,params)
+        return json.loads(response.text), response.status_code
+
+    async def send(self,method,url,fields=None,headers=None,authorize=True,data=None,params=None):
+        """Send a call to the API and return its requests.Response.
+
+        Files are sent by passing fields as a callable returning the fields, which is
+        called for every attempt, as with EinsteinTransport: aiohttp closes a file
+        part once it is written, so a replay after a 401 or a retry after a 429 needs
+        the file opened again. Identical GET and prediction calls awaited concurrently with the same token
+        are sent once, and every caller receives the same response (see SingleFlight).
+        """
+        if authorize and self._token_expiring():
+            await self.refresh_stale_token(self.token)
+        token = self.token if authorize else None
+        call = lambda: self._request(method,url,fields,headers,authorize,token,data,params)
+        if not self.single_flight or headers or data is not None:
+            return await call()
+        key = self.single_flight.key(method,url,fields,token,params=params)
+        return await self.single_flight.do_async(key,call)
+
+    async def _request(self,method,url,fields,headers,authorize,token,data,params):
+        call_headers = self.authorization_header() if authorize else {}
+        call_headers.update(headers or {})
+        response = await self._send(method,url,fields,call_headers,data,params)
+        if response.status_code == 401 and authorize and self.private_key:
+            # The token expired or was revoked: refresh it once and replay the call
+            try:
+                await self.refresh_stale_token(token)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print('Error: token refresh failed with %s' %e)
+            # A failed refresh leaves the stale token, and replaying would only get another 401
+            if self.token != token:
+                call_headers.update(self.authorization_header())
+                response = await self._send(method,url,fields,call_headers,data,params,retry=True)
+        return response
+
+    async def _send(self,method,url,fields,headers,data,params,retry=False,timeout=None):
+        attempts = []
+
+        async def send():
+            attempts.append(time.time())
+            call = lambda: self._http_call(method,url,fields,headers,data,params,timeout)
+            if not self.telemetry:
+                return await call()
+            # Every attempt after the first, e.g. a governor retry after a 429, is a retry
+            return await self.telemetry.call_async(endpoint_class(method,url),call,
+                                                   retry or len(attempts) > 1)
+        if not self.governor:
+            return await send()
+        return await self.governor.send_async(method,url,send)
+
+    async def _http_call(self,method,url,fields,headers,data,params,timeout=None):
+        if callable(fields):
+            fields = fields()
+        if fields is not None:
+            data = multipart_form(fields)
+        options = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        async with self._client().request(method,url,headers=headers,data=data,params=params,
+                                          **options) as response:
+            content = await response.read()
+            return _as_response(method,url,response,content)
+
+    def _token_expiring(self):
+        return bool(self.auto_refresh and self.private_key and self.expiration_time and
+                    self.expiration_time-time.time() < self.refresh_margin)
+
+    def connection_stats(self):
+        stats = {'limit': self.limit, 'limit_per_host': self.limit_per_host}
+        if self.single_flight:
+            stats['coalesced'] = self.single_flight.stats()['shared']
+        return stats
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.close()
+
+    async def monitor_usage(self):
+        return await self.request('GET',self.API_PATH+'/apiusage')
+
+    async def get_datasets(self):
+        return await self.request('GET',self.LANG_PATH+'/datasets')
+
+    async def iter_pages(self,url,page_size=DEFAULT_PAGE_SIZE,prefetch=True):
+        """Asynchronous generator counterpart of EinsteinPlatformSession.iter_pages.
+
+        With prefetch, the next page is requested while the caller consumes the
+        current one. Use it with `async for`.
+
+        Raises:
+            requests.HTTPError: If a page is answered with an error status.
+        """
+        page_size = min(page_size,MAX_PAGE_SIZE)
+
+        async def fetch(offset):
+            response = await self.send('GET',url,params={'offset': offset, 'count': page_size})
+            response.raise_for_status()
+            return json.loads(response.text).get('data',[])
+
+        next_page = None
+        offset = 0
+        try:
+            page = await fetch(offset)
+            while page:
+                offset += len(page)
+                if len(page) >= page_size and prefetch:
+                    next_page = asyncio.ensure_future(fetch(offset))
+                for item in page:
+                    yield item
+                if len(page) < page_size:
+                    return
+                page = await (next_page if next_page is not None else fetch(offset))
+                next_page = None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    def iter_datasets(self,page_size=DEFAULT_PAGE_SIZE,prefetch=True):
+        """Asynchronously yield the metadata of every dataset of the account."""
+        return self.iter_pages(self.LANG_PATH+'/datasets',page_size,prefetch)
+
+    def _token_lock(self):
+        # Created on first use, inside the event loop running the session
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        return self._refresh_lock
+
+    async def reset_authorization_token(self,session_duration=None):
+        async with self._token_lock():
+            return await self._reset_authorization_token(session_duration)
+
+    async def refresh_stale_token(self,stale_token):
+        """Request a new token unless another task already replaced stale_token."""
+        async with self._token_lock():
+            if self.token == stale_token:
+                await self._reset_authorization_token()
+
+    async def _reset_authorization_token(self,session_duration=None):
+        expiration_time, header, body = self.token_request(session_duration)
+        # Other tasks wait on the token lock, so the call gets the shorter token timeout
+        timeout = sum(self.token_timeout) if isinstance(self.token_timeout,tuple) else self.token_timeout
+        response = await self._send('POST',self.AUTH_PATH,None,header,body,None,timeout=timeout)
+        msg = json.loads(response.text)
+        if response.status_code==200:
+            self.accept_token(msg,expiration_time)
+        else:
+            print('Error: status code %s' %response.status_code)
+        return msg, response.status_code
+
+
+class AsyncDataset:
+
+    def __init__(self,einstein_session,datasetId=None):
+        """asyncio counterpart of Dataset.
+
+        Note:
+            Unlike Dataset, no status call is made during initialization; await
+            update_dataset_status() to populate dataset_metadata and labels.
+
+        Args:
+            einstein_session (AsyncEinsteinPlatformSession): Session used for each API call.
+            datasetId (:obj:`str`, optional): EPS ID of an existing dataset.
+        """
+        self.session = einstein_session
+        self.datasetId = datasetId
+        self.dataset_metadata = None
+        self.labels=[]
+        self.associated_models=[]
+
+    def __repr__(self):
+        return '<Dataset %s, %s>'%(
+                self.datasetId,self.__class__.__name__)
+
+    async def create_dataset(self,filepath=None,urlpath=None):
+        assert not self.datasetId, """This dataset has already been populated.
+To create a new dataset, make a new Dataset object"""
+        assert (filepath or urlpath), "User must provide filepath or urlpath"
+        if filepath:
+            opened = []
+
+            def fields():
+                # Opened again for every attempt, as aiohttp closes the file it sent
+                f = open(filepath,'rb')
+                opened.append(f)
+                return {'data': (os.path.basename(filepath), f, 'text/csv'), 'type': 'text-intent'}
+            try:
+                msg, status = await self.session.request('POST',self.session.LANG_PATH+'/datasets/upload',
+                                                         fields=fields)
+            finally:
+                for f in opened:
+                    f.close()
+        elif urlpath:
+            msg, status = await self.session.request('POST',self.session.LANG_PATH+'/datasets/upload',
+                                                     fields={'path': urlpath,
+                                                             'type': 'text-intent'})
+        if 200 <= status < 400:
+            self.datasetId = str(msg['id'])
+            self.dataset_metadata = msg
+        return msg, status
+
+    async def delete_self(self):
+        return await self.session.request('DELETE',self.session.LANG_PATH+'/datasets/'+self.datasetId)
+
+    async def update_deletion_status(self):
+        return await self.session.request('DELETE',self.session.LANG_PATH+'/deletion/'+self.datasetId)
+
+    async def update_dataset_status(self):
+        assert self.datasetId, "No dataset found."
+        msg, status = await self.session.request('GET',self.session.LANG_PATH+'/datasets/'+self.datasetId,
+                                                 fields={'type': 'text-intent'})
+        self.dataset_metadata = msg
+        try:
+            for l in self.dataset_metadata['labelSummary']['labels']:
+                if l['name'] not in self.labels:
+                    self.labels.append(l['name'])
+        except (KeyError, TypeError):
+            print("Could not find labels in %s"%self.dataset_metadata)
+        if status != 200:
+            print("There's a problem. Check the status code, %s"%status)
+        return msg, status
+
+    async def dataset_isReady(self):
+        # AVAILABLE and FAILED are final, so they are never polled again
+        if state_of_dataset(self.dataset_metadata) not in einstein_constants.DATASET_TERMINAL_STATES:
+            _,_ = await self.update_dataset_status()
+        return state_of_dataset(self.dataset_metadata) == einstein_constants.DATASET_AVAILABLE
+
+    async def get_associated_models(self):
+        return await self.session.request('GET',self.session.LANG_PATH+'/datasets/%s/models'%self.datasetId)
+
+
+class AsyncModel:
+
+    def __init__(self,dataset=None,session=None,datasetId=None,modelId=None):
+        """asyncio counterpart of Model.
+
+        Note:
+            Unlike Model, no status call is made during initialization; await
+            update_model_status() to populate model_metadata.
+
+        Args:
+            dataset (AsyncDataset, optional): Dataset object for train dataset.
+            session (AsyncEinsteinPlatformSession, optional): Session object, derived from
+                the dataset if unprovided.
+            datasetId (str, optional): Dataset ID, linked if the dataset object is not provided.
+            modelId (str, optional): Model ID of an existing model in EPS.
+        """
+        self.model_metadata = None
+        self.modelId = modelId
+
+        if dataset:
+            self.dataset = dataset
+            self.session = self.dataset.session
+        else:
+            assert session, "AsyncModel requires a dataset or a session"
+            self.session = session
+            self.dataset = AsyncDataset(session,datasetId=datasetId)
+
+    @property
+    def modelId(self):
+        try:
+            return self.model_metadata['modelId']
+        except (KeyError, TypeError):
+            return self.__modelId
+
+    @modelId.setter
+    def modelId(self,idn):
+        self.__modelId = idn
+
+    async def update_model_status(self):
+        assert self.modelId, "No model found."
+        msg, status = await self.session.request('GET',self.session.LANG_PATH+'/train/'+self.modelId,
+                                                 fields={'type': 'text-intent'})
+        self.model_metadata = msg
+        return msg, status
+
+    @property
+    def model_state(self):
+        """Training status from the last known metadata, without calling the API."""
+        try:
+            return self.model_metadata['status']
+        except (KeyError, TypeError):
+            return None
+
+    async def model_isReady(self):
+        if not self.modelId:
+            return False
+        # SUCCEEDED and FAILED are final, so they are never polled again
+        if self.model_state not in einstein_constants.MODEL_TERMINAL_STATES:
+            _,_ = await self.update_model_status()
+        return self.model_state in einstein_constants.MODEL_TERMINAL_STATES
+
+    async def train_model(self,model_name=None):
+        if not model_name:
+            model_name = 'Model_'+str(randint(10000,99999))
+        msg, status = await self.session.request('POST',self.session.LANG_PATH+'/train',
+                                                 fields={'name': model_name,
+                                                         'datasetId': self.dataset.datasetId})
+        self.model_metadata = msg
+        if 'modelId' not in msg:
+            print('Status code %s when attempting to set modelId from model_metadata' %status)
+        return msg, status
+
+    async def submit_feedback(self,document,expectedLabel):
+        assert self.modelId, "No model found."
+        return await self.session.request('POST',self.session.LANG_PATH+'/feedback',
+                                          fields={'modelId': self.modelId,
+                                                  'document': document,
+                                                  'expectedLabel': expectedLabel})
+
+    async def retrain_model(self,feedback=True):
+        assert(self.modelId), "No model available."
+        assert(await self.model_isReady()), "The model is still training. Please wait."
+        feedback = 'true' if feedback else 'false'
+        msg, status = await self.session.request('POST',self.session.LANG_PATH+'/retrain',
+                                                 fields={'modelId': self.modelId,
+                                                         'trainParams': '{"withFeedback":%s, "trainSplitRatio": 0.7}'%feedback})
+        self.model_metadata = msg
+        return msg, status
+
+    async def predict(self,document):
+        assert self.modelId, "No model available."
+        assert await self.model_isReady(), "The model hasn't completed training."
+        return await self._request_prediction(document)
+
+    async def _request_prediction(self,document):
+        return await self.session.request('POST',self.session.LANG_PATH+'/intent',
+                                          fields={'modelId': self.modelId,
+                                                  'document': document})
+
+    async def predict_all(self,documents,max_concurrency=DEFAULT_LIMIT):
+        """Predict every document concurrently, returning results in input order.
+
+        Note:
+            At most max_concurrency predictions are in flight; documents are read
+            from the iterable as calls complete. The first failing call cancels the
+            rest and its exception is raised.
+
+        Args:
+            documents (iterable): Any iterable or generator of documents.
+            max_concurrency (int, default = 100): Predictions in flight at once.
+        """
+        assert self.modelId, "No model available."
+        assert await self.model_isReady(), "The model hasn't completed training."
+        results = {}
+        items = enumerate(documents)
+
+        async def worker():
+            # The workers share one iterator; only one of them resumes at a time
+            for index, document in items:
+                results[index] = await self._request_prediction(document)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(max_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        return [results[index] for index in range(len(results))]
+
+    async def get_model_metrics(self):
+        assert await self.model_isReady(), "The model hasn't completed training."
+        return await self.session.request('GET',self.session.LANG_PATH+'/models/'+self.modelId)
+
+    async def get_learning_curve(self):
+        assert await self.model_isReady(), "The model hasn't completed training."
+        return await self.session.request('GET',self.session.LANG_PATH+'/models/%s/lc'%self.modelId)
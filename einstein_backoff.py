@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exponential backoff with jitter, used wherever the wrappers wait and retry.
+
+@author: andrewcarroll
+"""
+
+import random
+
+
+def jitter(delay,fraction=0.5):
+    """Randomize delay by up to fraction of its value, keeping at least the rest.
+
+    Spreads out callers that would otherwise wake up and retry in lockstep.
+    """
+    return delay*(1-fraction) + random.uniform(0,delay*fraction)
+
+
+class Backoff:
+
+    def __init__(self,initial=1.0,maximum=60.0,factor=2.0,jitter_fraction=0.5):
+        """Exponentially growing, jittered delays.
+
+        Args:
+            initial (float, default = 1): First delay, in seconds.
+            maximum (float, default = 60): Cap on any delay, in seconds.
+            factor (float, default = 2): Growth of the delay after each attempt.
+            jitter_fraction (float, default = 0.5): Part of each delay that is randomized.
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter_fraction = jitter_fraction
+        self.attempt = 0
+
+    def __repr__(self):
+        return '<%s attempt %s>'%(self.__class__.__name__,self.attempt)
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial*self.factor**self.attempt)
+        self.attempt += 1
+        return jitter(delay,self.jitter_fraction)
+
+    def reset(self):
+        self.attempt = 0
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Repeatable benchmarks of the client against a local stand-in server
+(einstein_standin): throughput, latency percentiles and memory of predict,
+feedback, dataset uploads, token expiry and status polling, as JSON.
+
+@author: andrewcarroll
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import dataset
+import einstein_session
+from einstein_standin import StandinProcess, StandinServer
+
+DEFAULT_OPTIONS = {'requests': 500, 'concurrency': 16, 'rows': 1000, 'models': 4,
+                   'latency': 'lognormal:0.02:0.5', 'rate_limit': 0.0, 'server_error': 0.0,
+                   'slow_body': 0.0, 'slow_body_seconds': 1.0, 'retry_after': None,
+                   'token_lifetime': 3600, 'expire_every': 1.0, 'train_seconds': 2.0,
+                   'seed': 1, 'governor': True, 'coalesce': True, 'server_process': True, 'trace_memory': False}
+
+
+def percentile(values,q):
+    """Linearly interpolated q-th percentile (0-100) of sorted values."""
+    if not values:
+        return None
+    position = (len(values)-1)*q/100.0
+    lower = int(position)
+    upper = min(lower+1,len(values)-1)
+    return values[lower]+(values[upper]-values[lower])*(position-lower)
+
+
+def latency_summary(latencies):
+    """min, mean, p50, p95, p99 and max of latencies in seconds."""
+    values = sorted(latencies)
+    if not values:
+        return dict.fromkeys(('min','mean','p50','p95','p99','max'))
+    return {'min': values[0], 'mean': sum(values)/len(values), 'p50': percentile(values,50),
+            'p95': percentile(values,95), 'p99': percentile(values,99), 'max': values[-1]}
+
+
+def peak_rss_kb():
+    """Peak resident memory of the process in KB, or None where it is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak//1024 if sys.platform == 'darwin' else peak
+
+
+def run_operations(operation,items,concurrency):
+    """Call operation(item) for every item with concurrency calls in flight.
+
+    Note:
+        At most 2*concurrency calls are queued at a time, so memory does not grow
+        with the number of items.
+
+    Returns:
+        (latencies, status_codes, errors): Seconds taken by each call, count of each
+            status code returned by operation, and count of each exception raised.
+    """
+    latencies, status_codes, errors = [], {}, {}
+
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            status_code = operation(item)
+        except Exception as e:
+            return time.perf_counter()-started, e
+        return time.perf_counter()-started, status_code
+
+    def collect(futures):
+        for future in futures:
+            elapsed, outcome = future.result()
+            latencies.append(elapsed)
+            if isinstance(outcome,Exception):
+                name = outcome.__class__.__name__
+                errors[name] = errors.get(name,0)+1
+            else:
+                status_codes[str(outcome)] = status_codes.get(str(outcome),0)+1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for item in items:
+            if len(pending) >= 2*concurrency:
+                done, pending = wait(pending,return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(timed,item))
+        collect(wait(pending)[0])
+    return latencies, status_codes, errors
+
+
+# Scenarios: each prepares the stand-in and returns (operation, items, cleanup)
+
+def _trained_model(server,session):
+    datasetId = server.add_dataset()
+    return dataset.Model(session=session,datasetId=datasetId,modelId=server.add_model(datasetId))
+
+
+def scenario_predict(server,session,options):
+    """options['requests'] calls to Model.predict."""
+    model = _trained_model(server,session)
+    documents = ('benchmark document %d'%i for i in range(options['requests']))
+    return lambda document: model.predict(document)[1], documents, None
+
+
+def scenario_feedback(server,session,options):
+    """options['requests'] calls to Model.submit_feedback."""
+    model = _trained_model(server,session)
+    labels = ('billing','shipping','returns')
+    examples = (('feedback document %d'%i,labels[i % len(labels)]) for i in range(options['requests']))
+    return lambda example: model.submit_feedback(*example)[1], examples, None
+
+
+def scenario_create_dataset(server,session,options):
+    """options['requests'] uploads of an options['rows'] rows CSV with Dataset.create_dataset."""
+    f = tempfile.NamedTemporaryFile('w',suffix='.csv',delete=False,encoding='utf-8')
+    with f:
+        for i in range(options['rows']):
+            f.write('"benchmark example %d about an order",label_%d\n'%(i,i % 5))
+
+    def upload(_):
+        return dataset.Dataset(session).create_dataset(filepath=f.name)[1]
+    return upload, range(options['requests']), lambda: os.remove(f.name)
+
+
+def scenario_token_expiry(server,session,options):
+    """Model.predict while the stand-in expires every token each options['expire_every'] seconds.
+
+    The session holds a private key, so each expiry costs one token request and a
+    replay of the calls that got a 401.
+    """
+    operation, documents, _ = scenario_predict(server,session,options)
+    stop = threading.Event()
+
+    def expire():
+        while not stop.wait(options['expire_every']):
+            server.expire_tokens()
+    threading.Thread(target=expire,daemon=True).start()
+    return operation, documents, stop.set
+
+
+def scenario_status_storm(server,session,options):
+    """options['requests'] status calls spread over options['models'] models in training."""
+    datasetId = server.add_dataset()
+    models = [dataset.Model(session=session,datasetId=datasetId,
+                            modelId=server.add_model(datasetId,trained=False))
+              for _ in range(options['models'])]
+    return lambda i: models[i % len(models)].update_model_status()[1], range(options['requests']), None
+
+
+SCENARIOS = {'predict': scenario_predict,
+             'feedback': scenario_feedback,
+             'create_dataset': scenario_create_dataset,
+             'token_expiry': scenario_token_expiry,
+             'status_storm': scenario_status_storm}
+
+
+def _private_key():
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537,key_size=2048,backend=default_backend())
+    return key.private_bytes(serialization.Encoding.PEM,serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode('utf-8')
+
+
+def run_scenario(name,**options):
+    """Run one scenario against a fresh stand-in server.
+
+    Args:
+        name (str): Key of SCENARIOS.
+        **options: Overrides of DEFAULT_OPTIONS.
+
+    Returns:
+        dict of the scenario, its options, operations, status codes and errors, elapsed
+        time, throughput (operations per second), latency percentiles in seconds, memory,
+        and the per-endpoint call counts seen by the client and by the stand-in.
+    """
+    unknown = set(options)-set(DEFAULT_OPTIONS)
+    assert not unknown, "Unknown options %s"%sorted(unknown)
+    config = dict(DEFAULT_OPTIONS)
+    config.update(options)
+    faults = {'rate_limit': config['rate_limit'], 'server_error': config['server_error'],
+              'slow_body': config['slow_body']}
+    server_class = StandinProcess if config['server_process'] else StandinServer
+    server = server_class(latency=config['latency'],seed=config['seed'],
+                          token_lifetime=config['token_lifetime'],train_seconds=config['train_seconds'],
+                          slow_body_seconds=config['slow_body_seconds'],retry_after=config['retry_after'])
+    server.start()
+    session_options = {'base_url': server.base_url, 'pool_maxsize': max(config['concurrency'],16)}
+    if not config['governor']:
+        session_options['governor'] = False
+    if not config['coalesce']:
+        session_options['single_flight'] = False
+    if name == 'token_expiry':
+        session = einstein_session.EinsteinPlatformSession(email='benchmark@example.com',
+                                                           private_key=_private_key(),
+                                                           **session_options)
+    else:
+        session = einstein_session.EinsteinPlatformSession(token=server.issue_token(),**session_options)
+    cleanup = None
+    try:
+        operation, items, cleanup = SCENARIOS[name](server,session,config)
+        # Measure the scenario itself, not the setup calls
+        server.set_faults(faults)
+        session.telemetry.reset()
+        server.reset_stats()
+        if config['trace_memory']:
+            tracemalloc.start()
+        rss_before = peak_rss_kb()
+        started = time.perf_counter()
+        latencies, status_codes, errors = run_operations(operation,items,config['concurrency'])
+        elapsed = time.perf_counter()-started
+        traced_peak = tracemalloc.get_traced_memory()[1] if config['trace_memory'] else None
+        server_stats = server.stats()
+    finally:
+        if config['trace_memory']:
+            tracemalloc.stop()
+        if cleanup is not None:
+            cleanup()
+        session.close()
+        server.stop()
+    rss_after = peak_rss_kb()
+    client = dict((endpoint,dict((key,stats[key]) for key in ('calls','errors','retries','status_codes')))
+                  for endpoint, stats in session.metrics()['endpoints'].items())
+    return {'scenario': name, 'options': config, 'at': time.time(),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'operations': len(latencies), 'ok': status_codes.get('200',0),
+            'status_codes': status_codes, 'errors': errors,
+            'elapsed': elapsed, 'throughput': len(latencies)/elapsed if elapsed else None,
+            'latency': latency_summary(latencies),
+            'memory': {'peak_rss_kb': rss_after,
+                       'rss_growth_kb': rss_after-rss_before if rss_before is not None else None,
+                       'traced_peak_bytes': traced_peak},
+            'client': client, 'server': server_stats}
+
+
+def compare(results,baseline,tolerance=0.2):
+    """Regressions of results against an earlier run of the same scenarios.
+
+    Args:
+        results (list): run_scenario results.
+        baseline (list): Earlier run_scenario results; the last one of each scenario is used.
+        tolerance (float, default = 0.2): Allowed relative drop of throughput and rise of
+            p95 latency.
+
+    Returns:
+        list of messages, empty if nothing regressed.
+    """
+    previous = dict((result['scenario'],result) for result in baseline)
+    problems = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        if before['throughput'] and result['throughput'] < before['throughput']*(1-tolerance):
+            problems.append('%s: throughput %0.1f/s, was %0.1f/s'
+                            %(result['scenario'],result['throughput'],before['throughput']))
+        p95, p95_before = result['latency']['p95'], before['latency']['p95']
+        if p95_before and p95 > p95_before*(1+tolerance):
+            problems.append('%s: p95 latency %0.1f ms, was %0.1f ms'
+                            %(result['scenario'],p95*1000,p95_before*1000))
+    return problems
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the client against a local stand-in server.')
+    parser.add_argument('scenarios',nargs='*',default=['all'],
+                        metavar='scenario',help='%s or all (default)'%', '.join(sorted(SCENARIOS)))
+    for option, default in sorted(DEFAULT_OPTIONS.items()):
+        flag = '--'+option.replace('_','-')
+        if option == 'governor':
+            parser.add_argument('--no-governor',dest='governor',action='store_false',
+                                help='send calls without the rate governor')
+        elif option == 'coalesce':
+            parser.add_argument('--no-coalesce',dest='coalesce',action='store_false',
+                                help='send identical concurrent calls separately')
+        elif option == 'server_process':
+            parser.add_argument('--in-process',dest='server_process',action='store_false',
+                                help='run the stand-in server in this process')
+        elif option == 'trace_memory':
+            parser.add_argument(flag,action='store_true',help='also measure peak Python allocations')
+        elif isinstance(default,bool):
+            continue
+        else:
+            kind = type(default) if default is not None else float
+            if option == 'latency':
+                kind = str
+            parser.add_argument(flag,type=kind,default=default,help='(default: %s)'%default)
+    parser.add_argument('--repeat',type=int,default=1,help='runs of each scenario')
+    parser.add_argument('--output',help='write the results to this JSON file instead of stdout')
+    parser.add_argument('--baseline',help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance',type=float,default=0.2,
+                        help='allowed relative regression against --baseline (default: 0.2)')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios)-set(SCENARIOS)-set(['all'])
+    if unknown:
+        parser.error('unknown scenario %s, choose from %s or all'
+                     %(', '.join(sorted(unknown)),', '.join(sorted(SCENARIOS))))
+    names = sorted(SCENARIOS) if 'all' in args.scenarios else args.scenarios
+    options = dict((option,getattr(args,option)) for option in DEFAULT_OPTIONS)
+    results = []
+    for name in names:
+        for run in range(args.repeat):
+            result = run_scenario(name,**options)
+            results.append(result)
+            print('%-15s %6d ops %8.1f/s  p50 %7.1f ms  p95 %7.1f ms  p99 %7.1f ms  peak RSS %s KB'
+                  %(name,result['operations'],result['throughput'] or 0,
+                    (result['latency']['p50'] or 0)*1000,(result['latency']['p95'] or 0)*1000,
+                    (result['latency']['p99'] or 0)*1000,result['memory']['peak_rss_kb']),
+                  file=sys.stderr)
+    text = json.dumps(results,indent=1)
+    if args.output:
+        with open(args.output,'w') as f:
+            f.write(text+'\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results,json.load(f),args.tolerance)
+        for problem in problems:
+            print('Regression: %s'%problem,file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
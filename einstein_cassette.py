@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Record and replay transports: capture the calls of a session to a cassette
+file, then serve them back without a network for deterministic runs.
+
+@author: andrewcarroll
+"""
+
+import base64
+import datetime
+import gzip
+import hashlib
+import http.client
+import json
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import einstein_constants
+from einstein_transport import EinsteinTransport
+
+CASSETTE_VERSION = 1
+# Response headers kept in a cassette
+RECORDED_HEADERS = ('Content-Type', 'Retry-After')
+# Calls matched on method and path only, because their body is signed with a timestamp
+IGNORE_BODY_PATHS = (einstein_constants.OAUTH_ENDPOINT,)
+# Form fields left out of the key of calls to these paths, because the client may pick
+# them at random: Model.train_model names a model Model_<random number> unless given a name
+IGNORE_FIELDS = {einstein_constants.LANG_ENDPOINT+'/train': ('name',)}
+# Keys start at the first of these, so the base url of the API does not matter
+API_ROOTS = (einstein_constants.LANG_ENDPOINT+'/', einstein_constants.OAUTH_ENDPOINT, '/apiusage')
+
+
+class CassetteMiss(LookupError):
+    """Raised by ReplayTransport for a call that is not in the cassette."""
+
+
+def _hash_value(digest,value):
+    if isinstance(value,tuple):
+        # (filename, file or content, content_type)
+        digest.update(('%s\x00%s\x00'%(value[0],value[2] if len(value) > 2 else '')).encode('utf-8'))
+        value = value[1]
+    if hasattr(value,'read'):
+        position = value.tell()
+        for chunk in iter(lambda: value.read(1<<20),b''):
+            digest.update(chunk if isinstance(chunk,bytes) else chunk.encode('utf-8'))
+        value.seek(position)
+    elif isinstance(value,bytes):
+        digest.update(value)
+    else:
+        digest.update(str(value).encode('utf-8'))
+    digest.update(b'\x01')
+
+
+def interaction_key(method,url,fields=None,data=None,params=None):
+    """Key matching a replayed call to a recorded one.
+
+    The key is made of the method, the path and query of url, params, and a hash of
+    the form fields (file parts by name, type and content) or raw body. The base url,
+    headers and tokens are left out, so a cassette recorded against one base url
+    replays against another. So is the name of a model to train (see IGNORE_FIELDS):
+    training calls that differ only by name are answered in the order recorded.
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    for root in API_ROOTS:
+        if root in path:
+            path = path[path.index(root):]
+            break
+    path += '?'+parts.query if parts.query else ''
+    if params:
+        path += ('&' if '?' in path else '?')+'&'.join('%s=%s'%item for item in sorted(params.items()))
+    if any(parts.path.endswith(ignored) for ignored in IGNORE_BODY_PATHS):
+        return '%s %s'%(method,path)
+    ignored = IGNORE_FIELDS.get(path.split('?',1)[0],())
+    digest = hashlib.blake2b(digest_size=12)
+    for name in sorted(set(fields or {})-set(ignored)):
+        digest.update(name.encode('utf-8')+b'\x00')
+        _hash_value(digest,fields[name])
+    if data is not None:
+        _hash_value(digest,data)
+    return '%s %s #%s'%(method,path,digest.hexdigest())
+
+
+def read_cassette(path):
+    """Header and interactions of a cassette file; a truncated file yields what is complete."""
+    header, interactions = None, []
+    with gzip.open(path,'rt',encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                entry = json.loads(line)
+                if header is None:
+                    header = entry
+                else:
+                    interactions.append(entry)
+        except (EOFError, zlib.error):
+            pass
+    if header is None or header.get('version') != CASSETTE_VERSION:
+        raise ValueError('%s is not a cassette of version %s'%(path,CASSETTE_VERSION))
+    return header, interactions
+
+
+class RecordingTransport:
+
+    def __init__(self,path,transport=None,**transport_options):
+        """Transport sending calls through another one and recording them to a cassette.
+
+        Note:
+            Each call is written as one line of a gzipped JSONL file with its key (see
+            interaction_key), status code, headers, body and elapsed time. The file is
+            complete once close() is called, which EinsteinPlatformSession.close does.
+
+        Args:
+            path (str): Cassette file to write.
+            transport (EinsteinTransport, optional): Transport sending the calls. Created
+                from transport_options if unprovided.
+        """
+        self.path = path
+        self.transport = transport or EinsteinTransport(**transport_options)
+        self.recorded = 0
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._file = gzip.open(path,'wt',encoding='utf-8')
+        self._write({'version': CASSETTE_VERSION, 'created': self._started})
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.path)
+
+    def _write(self,entry):
+        line = json.dumps(entry,separators=(',',':'))+'\n'
+        with self._lock:
+            self._file.write(line)
+
+    def request(self,method,url,fields=None,headers=None,data=None,**kwargs):
+        if callable(fields):
+            fields = fields()
+        key = interaction_key(method,url,fields,data,kwargs.get('params'))
+        at = time.time()-self._started
+        started = time.perf_counter()
+        response = self.transport.request(method,url,fields=fields,headers=headers,data=data,**kwargs)
+        elapsed = time.perf_counter()-started
+        entry = {'key': key, 'method': method, 'url': url, 'at': round(at,6), 'elapsed': round(elapsed,6),
+                 'status': response.status_code,
+                 'headers': dict((name,response.headers[name]) for name in RECORDED_HEADERS
+                                 if name in response.headers),
+                 'sent': int(response.request.headers.get('Content-Length') or 0)
+                         if response.request is not None else 0}
+        try:
+            entry['body'] = response.content.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body64'] = base64.b64encode(response.content).decode('ascii')
+        self._write(entry)
+        with self._lock:
+            self.recorded += 1
+        return response
+
+    def get(self,url,**kwargs):
+        return self.request('GET',url,**kwargs)
+
+    def post(self,url,**kwargs):
+        return self.request('POST',url,**kwargs)
+
+    def delete(self,url,**kwargs):
+        return self.request('DELETE',url,**kwargs)
+
+    def connection_stats(self):
+        stats = self.transport.connection_stats()
+        stats['recorded'] = self.recorded
+        return stats
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        self.transport.close()
+
+
+class ReplayTransport:
+
+    def __init__(self,path,speed=None,fallback=None):
+        """Transport answering calls from a cassette written by RecordingTransport.
+
+        Note:
+            Calls with the same key are answered with their recorded responses in order,
+            and then with the last one again, so a status poll that went from QUEUED to
+            SUCCEEDED replays the same way. A call missing from the cassette raises
+            CassetteMiss, unless a fallback transport is given.
+
+        Args:
+            path (str): Cassette file to read.
+            speed (float, optional): None answers at once; 1 waits the recorded time of
+                each call, 2 half of it, and so on.
+            fallback (EinsteinTransport, optional): Sends the calls missing from the cassette.
+        """
+        self.path = path
+        self.speed = speed
+        self.fallback = fallback
+        self.header, interactions = read_cassette(path)
+        self._interactions = {}
+        for entry in interactions:
+            self._interactions.setdefault(entry['key'],[]).append(entry)
+        self._served = dict.fromkeys(self._interactions,0)
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.missed = 0
+
+    def __repr__(self):
+        return '<%s %s, %s calls>'%(self.__class__.__name__,self.path,
+                                   sum(map(len,self._interactions.values())))
+
+    def _next(self,key):
+        with self._lock:
+            entries = self._interactions.get(key)
+            if not entries:
+                self.missed += 1
+                return None
+            served = self._served[key]
+            self._served[key] = served+1
+            self.replayed += 1
+            return entries[min(served,len(entries)-1)]
+
+    def request(self,method,url,fields=None,headers=None,data=None,timeout=None,
+                monitor_callback=None,**kwargs):
+        if callable(fields):
+            fields = fields()
+        key = interaction_key(method,url,fields,data,kwargs.get('params'))
+        entry = self._next(key)
+        if entry is None:
+            if self.fallback is not None:
+                return self.fallback.request(method,url,fields=fields,headers=headers,data=data,
+                                             timeout=timeout,monitor_callback=monitor_callback,**kwargs)
+            raise CassetteMiss('No recorded response for %s in %s'%(key,self.path))
+        if self.speed:
+            time.sleep(entry['elapsed']/self.speed)
+        return self._response(method,url,entry)
+
+    def _response(self,method,url,entry):
+        content = entry['body'].encode('utf-8') if 'body' in entry else base64.b64decode(entry['body64'])
+        response = requests.models.Response()
+        response.status_code = entry['status']
+        response.reason = http.client.responses.get(entry['status'],'')
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.headers['Content-Length'] = str(len(content))
+        response._content = content
+        response.encoding = 'utf-8'
+        response.url = url
+        response.elapsed = datetime.timedelta(seconds=entry['elapsed'])
+        response.request = requests.Request(method,url).prepare()
+        response.request.headers['Content-Length'] = str(entry['sent'])
+        return response
+
+    def get(self,url,**kwargs):
+        return self.request('GET',url,**kwargs)
+
+    def post(self,url,**kwargs):
+        return self.request('POST',url,**kwargs)
+
+    def delete(self,url,**kwargs):
+        return self.request('DELETE',url,**kwargs)
+
+    def unused(self):
+        """Keys of recorded calls that were never replayed."""
+        with self._lock:
+            return sorted(key for key, served in self._served.items() if not served)
+
+    def connection_stats(self):
+        with self._lock:
+            return {'requests': self.replayed+self.missed, 'replayed': self.replayed, 'missed': self.missed}
+
+    def close(self):
+        if self.fallback is not None:
+            self.fallback.close()
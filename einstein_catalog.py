@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local SQLite catalog of the datasets and models of an account, synced
+incrementally from the API and queried without a call.
+
+@author: andrewcarroll
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import einstein_constants
+from dataset import state_of_dataset
+
+DEFAULT_TTL = 300
+DEFAULT_ACTIVE_TTL = 15
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS datasets ('
+    'id TEXT PRIMARY KEY, name TEXT, status TEXT, created_at TEXT, updated_at TEXT, '
+    'total_examples INTEGER, metadata TEXT, fetched_at REAL)',
+    'CREATE TABLE IF NOT EXISTS models ('
+    'id TEXT PRIMARY KEY, dataset_id TEXT, name TEXT, status TEXT, progress REAL, '
+    'created_at TEXT, updated_at TEXT, metadata TEXT, fetched_at REAL)',
+    'CREATE TABLE IF NOT EXISTS syncs (scope TEXT PRIMARY KEY, synced_at REAL)',
+    'CREATE INDEX IF NOT EXISTS datasets_created ON datasets (created_at)',
+    'CREATE INDEX IF NOT EXISTS models_dataset ON models (dataset_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS models_status ON models (status, created_at)',
+    'CREATE INDEX IF NOT EXISTS models_created ON models (created_at)',
+)
+
+
+def _models_scope(datasetId):
+    return 'models:%s'%datasetId
+
+
+def _spread(scope):
+    """Stable fraction in [0, 1) of a scope, spreading the expiry of its listing."""
+    return zlib.crc32(scope.encode('utf-8'))/2.0**32
+
+
+class EinsteinCatalog:
+
+    def __init__(self,session,path=':memory:',ttl=DEFAULT_TTL,active_ttl=DEFAULT_ACTIVE_TTL,
+                 max_workers=4):
+        """Catalog of dataset and model metadata, answering listings from a local database.
+
+        Note:
+            A listing is fetched again only once it is older than ttl seconds, or
+            active_ttl seconds while a dataset or one of its models is still being
+            processed. A model listing is fetched again at once when its dataset's
+            updatedAt changes. Otherwise it expires at its own point between ttl and
+            2*ttl, set by a hash of the dataset id. So after a full sync, each
+            refresh fetches only the few listings that have just expired, not all of
+            them at once. Only rows whose updatedAt changed are rewritten.
+            Reads never wait for the API: refresh_in_background updates the database on
+            a thread and calls back when something changed.
+
+        Args:
+            session (EinsteinPlatformSession): Session used to sync the catalog.
+            path (str, default = ':memory:'): SQLite file holding the catalog, so it
+                survives restarts.
+            ttl (float, default = 300): Seconds a listing is trusted.
+            active_ttl (float, default = 15): Seconds a listing holding a dataset or model
+                that is not in a terminal state is trusted.
+            max_workers (int, default = 4): Concurrent model listings during a refresh.
+        """
+        self.session = session
+        self.path = path
+        self.ttl = ttl
+        self.active_ttl = active_ttl
+        self.max_workers = max_workers
+        self._lock = threading.RLock()
+        self._refresh_thread = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        with self._db:
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def _query(self,sql,params=()):
+        with self._lock:
+            return self._db.execute(sql,params).fetchall()
+
+    def _synced_at(self,scope):
+        rows = self._query('SELECT synced_at FROM syncs WHERE scope=?',(scope,))
+        return rows[0][0] if rows else None
+
+    def _mark_synced(self,scope):
+        self._db.execute('INSERT OR REPLACE INTO syncs VALUES (?,?)',(scope,time.time()))
+
+    def _is_stale(self,scope,active):
+        synced_at = self._synced_at(scope)
+        if synced_at is None:
+            return True
+        if active:
+            return time.time()-synced_at > self.active_ttl
+        # The dataset listing is shared, but model listings expire spread over a ttl
+        ttl = self.ttl if scope == 'datasets' else self.ttl*(1+_spread(scope))
+        return time.time()-synced_at > ttl
+
+    # Queries
+
+    def datasets(self,status=None,name=None):
+        """Dataset metadata dicts, newest first.
+
+        Args:
+            status (str, optional): Only datasets in this state (AVAILABLE, NOT_AVAILABLE
+                or FAILED).
+            name (str, optional): Only datasets whose name contains this text.
+        """
+        sql, params = 'SELECT metadata FROM datasets WHERE 1', []
+        if status is not None:
+            sql += ' AND status=?'
+            params.append(status)
+        if name is not None:
+            sql += ' AND name LIKE ?'
+            params.append('%%%s%%'%name)
+        rows = self._query(sql+' ORDER BY created_at DESC',params)
+        return [json.loads(row[0]) for row in rows]
+
+    def dataset(self,datasetId):
+        rows = self._query('SELECT metadata FROM datasets WHERE id=?',(str(datasetId),))
+        return json.loads(rows[0][0]) if rows else None
+
+    def models(self,datasetId=None,status=None,created_after=None,created_before=None):
+        """Model metadata dicts, newest first.
+
+        Args:
+            datasetId (str, optional): Only models trained on this dataset.
+            status (str, optional): Only models with this training status.
+            created_after, created_before (str, optional): Bounds on createdAt, as the
+                ISO 8601 strings used by the API, e.g. '2018-09-26'.
+        """
+        sql, params = 'SELECT metadata FROM models WHERE 1', []
+        for column, operator, value in (('dataset_id','=',datasetId),('status','=',status),
+                                        ('created_at','>=',created_after),
+                                        ('created_at','<',created_before)):
+            if value is not None:
+                sql += ' AND %s%s?'%(column,operator)
+                params.append(str(value))
+        rows = self._query(sql+' ORDER BY created_at DESC',params)
+        return [json.loads(row[0]) for row in rows]
+
+    def model(self,modelId):
+        rows = self._query('SELECT metadata FROM models WHERE id=?',(str(modelId),))
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_datasets(self):
+        """Cached counterpart of EinsteinPlatformSession.get_datasets, without a call."""
+        return {'object': 'list', 'data': self.datasets()}, 200
+
+    def get_associated_models(self,datasetId):
+        """Cached counterpart of Dataset.get_associated_models, without a call."""
+        return {'object': 'list', 'data': self.models(datasetId=datasetId)}, 200
+
+    # Writes
+
+    def record_dataset(self,metadata):
+        """Store dataset metadata returned by any call, e.g. Dataset.update_dataset_status.
+
+        Returns:
+            True if the stored row changed.
+        """
+        with self._lock, self._db:
+            return self._upsert_dataset(metadata)
+
+    def record_model(self,metadata):
+        """Store model metadata returned by any call, e.g. Model.update_model_status.
+
+        Returns:
+            True if the stored row changed.
+        """
+        with self._lock, self._db:
+            return self._upsert_model(metadata)
+
+    def forget_dataset(self,datasetId):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM datasets WHERE id=?',(str(datasetId),))
+            self._db.execute('DELETE FROM models WHERE dataset_id=?',(str(datasetId),))
+            self._db.execute('DELETE FROM syncs WHERE scope=?',(_models_scope(datasetId),))
+
+    def _upsert_dataset(self,metadata):
+        datasetId = str(metadata['id'])
+        rows = self._db.execute('SELECT updated_at, status FROM datasets WHERE id=?',
+                                (datasetId,)).fetchall()
+        status = state_of_dataset(metadata)
+        if rows and tuple(rows[0]) == (metadata.get('updatedAt'), status):
+            return False
+        self._db.execute('INSERT OR REPLACE INTO datasets VALUES (?,?,?,?,?,?,?,?)',
+                         (datasetId, metadata.get('name'), status, metadata.get('createdAt'),
+                          metadata.get('updatedAt'), metadata.get('totalExamples'),
+                          json.dumps(metadata), time.time()))
+        return True
+
+    def _upsert_model(self,metadata):
+        modelId = str(metadata['modelId'])
+        rows = self._db.execute('SELECT updated_at, status, progress FROM models WHERE id=?',
+                                (modelId,)).fetchall()
+        if rows and tuple(rows[0]) == (metadata.get('updatedAt'), metadata.get('status'),
+                                       metadata.get('progress')):
+            return False
+        self._db.execute('INSERT OR REPLACE INTO models VALUES (?,?,?,?,?,?,?,?,?)',
+                         (modelId, str(metadata.get('datasetId')), metadata.get('name'),
+                          metadata.get('status'), metadata.get('progress'),
+                          metadata.get('createdAt'), metadata.get('updatedAt'),
+                          json.dumps(metadata), time.time()))
+        return True
+
+    # Sync
+
+    def datasets_stale(self):
+        active = bool(self._query('SELECT 1 FROM datasets WHERE status=? LIMIT 1',
+                                  (einstein_constants.DATASET_NOT_AVAILABLE,)))
+        return self._is_stale('datasets',active)
+
+    def models_stale(self,datasetId):
+        active = bool(self._query('SELECT 1 FROM models WHERE dataset_id=? AND status IN (?,?) LIMIT 1',
+                                  (str(datasetId),einstein_constants.MODEL_QUEUED,
+                                   einstein_constants.MODEL_RUNNING)))
+        return self._is_stale(_models_scope(datasetId),active)
+
+    def sync_datasets(self,force=False):
+        """Fetch the dataset listing if it is stale, storing changed rows.
+
+        Datasets missing from the listing are removed along with their models, and the
+        model listing of every dataset whose updatedAt changed is marked stale.
+
+        Returns:
+            List of ids of the datasets added, changed or removed.
+        """
+        if not force and not self.datasets_stale():
+            return []
+        try:
+            listing = list(self.session.iter_datasets())
+        except requests.HTTPError as e:
+            print('Warning: catalog could not list datasets: %s'%e)
+            return []
+        changed = []
+        with self._lock, self._db:
+            listed = set()
+            for metadata in listing:
+                listed.add(str(metadata['id']))
+                if self._upsert_dataset(metadata):
+                    changed.append(str(metadata['id']))
+                    self._db.execute('DELETE FROM syncs WHERE scope=?',
+                                     (_models_scope(metadata['id']),))
+            for row in self._db.execute('SELECT id FROM datasets').fetchall():
+                if row[0] not in listed:
+                    changed.append(row[0])
+                    self._db.execute('DELETE FROM datasets WHERE id=?',(row[0],))
+                    self._db.execute('DELETE FROM models WHERE dataset_id=?',(row[0],))
+                    self._db.execute('DELETE FROM syncs WHERE scope=?',(_models_scope(row[0]),))
+            self._mark_synced('datasets')
+        return changed
+
+    def _fetch_models(self,datasetId):
+        try:
+            return datasetId, list(self.session.iter_pages(
+                    self.session.LANG_PATH+'/datasets/%s/models'%datasetId))
+        except requests.HTTPError as e:
+            print('Warning: catalog could not list the models of dataset %s: %s'%(datasetId,e))
+            return datasetId, None
+
+    def _store_models(self,datasetId,listing):
+        if listing is None:
+            return []
+        changed = []
+        with self._lock, self._db:
+            listed = set()
+            for metadata in listing:
+                listed.add(str(metadata['modelId']))
+                if self._upsert_model(metadata):
+                    changed.append(str(metadata['modelId']))
+            for row in self._db.execute('SELECT id FROM models WHERE dataset_id=?',
+                                        (str(datasetId),)).fetchall():
+                if row[0] not in listed:
+                    changed.append(row[0])
+                    self._db.execute('DELETE FROM models WHERE id=?',(row[0],))
+            self._mark_synced(_models_scope(datasetId))
+        return changed
+
+    def sync_models(self,datasetId,force=False):
+        """Fetch the model listing of a dataset if it is stale, storing changed rows.
+
+        Returns:
+            List of ids of the models added, changed or removed.
+        """
+        if not force and not self.models_stale(datasetId):
+            return []
+        return self._store_models(*self._fetch_models(datasetId))
+
+    def refresh(self,force=False):
+        """Sync the dataset listing, then every stale model listing concurrently.
+
+        Returns:
+            dict with the ids of the changed 'datasets' and 'models'.
+        """
+        changed = {'datasets': self.sync_datasets(force), 'models': []}
+        stale = [row[0] for row in self._query('SELECT id FROM datasets')
+                 if force or self.models_stale(row[0])]
+        if stale:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for result in executor.map(self._fetch_models,stale):
+                    changed['models'].extend(self._store_models(*result))
+        return changed
+
+    def refresh_in_background(self,callback=None,force=False):
+        """Run refresh on a daemon thread unless one is already running.
+
+        Args:
+            callback (callable, optional): Called from the thread with the dict returned
+                by refresh when anything changed. A Tk app must hand it to its own
+                thread, e.g. with after().
+            force (bool, default = False): Fetch every listing, stale or not.
+
+        Returns:
+            The refresh thread.
+        """
+        def run():
+            try:
+                changed = self.refresh(force)
+            except Exception as e:
+                print('Warning: catalog refresh failed: %s'%e)
+                return
+            if callback and (changed['datasets'] or changed['models']):
+                callback(changed)
+
+        with self._lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(target=run,daemon=True)
+                self._refresh_thread.start()
+            return self._refresh_thread
+
+    def close(self):
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command-line entry point for batch jobs: sessions, dataset upload and status,
+training, streaming prediction and bulk feedback.
+
+    export EINSTEIN_EMAIL=me@example.com EINSTEIN_CERT=einstein_platform.pem
+    export EINSTEIN_TOKEN=$(python einstein_cli.py session --token-only)
+    python einstein_cli.py upload examples.csv --wait
+    python einstein_cli.py train <datasetId> --name intents --wait
+    python einstein_cli.py predict <modelId> --format csv < docs.csv > predictions.jsonl
+    python einstein_cli.py feedback <modelId> corrections.csv
+
+Results are written to stdout, one JSON document per line; progress, warnings
+and the throughput summary go to stderr.
+
+@author: andrewcarroll
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+import einstein_constants
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+
+
+class Summary:
+
+    def __init__(self,name,stream=None):
+        """Throughput counters of a command, reported on stderr."""
+        self.name = name
+        self.stream = stream or sys.stderr
+        self.counts = {'ok': 0, 'failed': 0}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def count(self,ok):
+        with self._lock:
+            self.counts['ok' if ok else 'failed'] += 1
+
+    def report(self,extra=None):
+        elapsed = time.time()-self.started_at
+        done = self.counts['ok']+self.counts['failed']
+        line = '%s: %s done, %s failed in %0.1f s (%0.1f/s)'%(
+                self.name,self.counts['ok'],self.counts['failed'],elapsed,
+                done/elapsed if elapsed else 0.0)
+        if extra:
+            line += ', '+', '.join('%s %s'%item for item in sorted(extra.items()))
+        print(line,file=self.stream)
+
+
+def write_json(out,obj):
+    out.write(json.dumps(obj)+'\n')
+
+
+def open_input(path,encoding='utf-8'):
+    """Open path for reading, or stdin for '-' or None."""
+    if path in (None,'-'):
+        return _Unclosed(sys.stdin)
+    return open(path,'r',newline='',encoding=encoding)
+
+
+class _Unclosed:
+
+    def __init__(self,f):
+        self.f = f
+
+    def __enter__(self):
+        return self.f
+
+    def __exit__(self,*exc_info):
+        pass
+
+
+def report_bad_record(line_number,error):
+    write_json(sys.stderr,{'line': line_number, 'error': 'malformed record: %s'%error})
+
+
+def read_records(f,fmt,field='document',column=0,delimiter=',',on_error=report_bad_record):
+    """Yield (record, document) from an input stream.
+
+    jsonl lines are objects holding the document under field, or bare JSON strings;
+    csv rows hold it in column; text lines are the document itself. Blank lines are
+    skipped, and so are malformed records (invalid JSON, a missing field, a row too
+    short for column), after passing their line number and the error to on_error.
+    """
+    if fmt == 'csv':
+        reader = csv.reader(f,delimiter=delimiter)
+        for row in reader:
+            if row and any(cell.strip() for cell in row):
+                try:
+                    document = row[column]
+                except IndexError:
+                    on_error(reader.line_num,'row has %s columns, no column %s'%(len(row),column))
+                    continue
+                yield row, document
+    elif fmt == 'text':
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.strip():
+                yield line, line
+    else:
+        for line_number, line in enumerate(f,1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    document = record[field] if isinstance(record,dict) else record
+                except ValueError as e:
+                    on_error(line_number,'invalid JSON: %s'%e)
+                    continue
+                except KeyError:
+                    on_error(line_number,'no %r field'%field)
+                    continue
+                yield record, document
+
+
+def make_session(args):
+    import einstein_session
+    options = {'pool_maxsize': max(getattr(args,'concurrency',0),16)}
+    if args.base_url:
+        options['base_url'] = args.base_url
+    if args.replay:
+        import einstein_cassette
+        options['transport'] = einstein_cassette.ReplayTransport(args.replay,speed=args.replay_speed)
+    elif args.record:
+        import einstein_cassette
+        options['transport'] = einstein_cassette.RecordingTransport(args.record,
+                                                                    pool_maxsize=options['pool_maxsize'])
+    if args.token:
+        return einstein_session.EinsteinPlatformSession(token=args.token,**options)
+    if not (args.email and args.cert):
+        raise SystemExit('A token (--token or EINSTEIN_TOKEN), or an email and a certificate '
+                         '(--email/--cert or EINSTEIN_EMAIL/EINSTEIN_CERT) are required.')
+    return einstein_session.EinsteinPlatformSession(email=args.email,cert_path=args.cert,
+                                                    session_duration=args.duration,**options)
+
+
+def load_model(session,modelId,with_dataset=False):
+    import dataset
+    model = dataset.Model(session=session,modelId=modelId)
+    if not model.model_metadata or 'modelId' not in model.model_metadata:
+        raise SystemExit('Model %s not found: %s'%(modelId,model.model_metadata))
+    if with_dataset:
+        model.dataset = dataset.Dataset(session,datasetId=str(model.model_metadata['datasetId']))
+    return model
+
+
+# Commands
+
+def cmd_session(args,session,out):
+    if args.token_only:
+        out.write(session.token+'\n')
+    else:
+        write_json(out,{'token': session.token, 'expiration_time': session.expiration_time})
+    return EXIT_OK
+
+
+def cmd_upload(args,session,out):
+    import dataset
+    if args.validate and args.file:
+        from dataset_validator import validate_dataset
+        report = validate_dataset(args.file)
+        if not report.ok:
+            write_json(sys.stderr,report.to_dict())
+            print('upload: %s failed validation, not uploaded'%args.file,file=sys.stderr)
+            return EXIT_FAILED
+
+    def progress(sent,total,rate):
+        print('upload: %0.1f of %0.1f MB (%0.1f MB/s)'%(sent/1e6,total/1e6,rate/1e6),
+              file=sys.stderr)
+
+    ds = dataset.Dataset(session)
+    msg, status_code = ds.create_dataset(filepath=args.file,urlpath=args.url,
+                                         progress_callback=progress,compress=args.compress)
+    if status_code != 200:
+        write_json(out,msg)
+        return EXIT_FAILED
+    if args.wait:
+        ready = ds.wait_until_ready(timeout=args.timeout)
+        msg = ds.dataset_metadata
+        write_json(out,msg)
+        return EXIT_OK if ready else EXIT_FAILED
+    write_json(out,msg)
+    return EXIT_OK
+
+
+def cmd_status(args,session,out):
+    import dataset
+    if args.kind == 'dataset':
+        ds = dataset.Dataset(session)
+        ds.datasetId = args.id
+        msg, status_code = ds.update_dataset_status()
+    else:
+        model = dataset.Model(session=session,modelId=args.id)
+        msg = model.model_metadata
+        status_code = 200 if isinstance(msg,dict) and 'modelId' in msg else None
+    write_json(out,msg)
+    return EXIT_OK if status_code == 200 else EXIT_FAILED
+
+
+def cmd_train(args,session,out):
+    import dataset
+    ds = dataset.Dataset(session,datasetId=args.dataset_id)
+    model = dataset.Model(dataset=ds)
+    if args.retrain:
+        model.modelId = args.retrain
+        msg, status_code = model.retrain_model(feedback=True)
+    else:
+        msg, status_code = model.train_model(args.name)
+    if status_code != 200:
+        write_json(out,msg)
+        return EXIT_FAILED
+    print('train: model %s %s'%(model.modelId,msg.get('status')),file=sys.stderr)
+    if args.wait:
+        succeeded = model.wait_until_ready(timeout=args.timeout)
+        write_json(out,model.model_metadata)
+        return EXIT_OK if succeeded else EXIT_FAILED
+    write_json(out,msg)
+    return EXIT_OK
+
+
+def cmd_predict(args,session,out):
+    model = load_model(session,args.model_id)
+    summary = Summary('predict')
+    # Input records of the documents in flight, so memory stays bounded by max_pending
+    records = {}
+
+    def skip(line_number, error):
+        report_bad_record(line_number,error)
+        summary.count(False)
+
+    def documents(f):
+        for index, (record, document) in enumerate(read_records(f,args.format,args.field,
+                                                                args.column,args.delimiter,skip)):
+            records[index] = record
+            yield document
+
+    journal = None
+    if args.journal:
+        from job_journal import JobJournal
+        journal = JobJournal(args.journal,'predict:%s:%s'%(model.modelId,args.input or 'stdin'))
+
+    try:
+        with open_input(args.input) as f:
+            for result in model.predict_many(documents(f),max_workers=args.concurrency,
+                                             ordered=not args.unordered,journal=journal):
+                record = records.pop(result.index)
+                output = dict(record) if isinstance(record,dict) else {'document': result.document}
+                output['index'] = result.index
+                probabilities = result.response.get('probabilities') \
+                    if result.ok and isinstance(result.response,dict) else None
+                ok = bool(probabilities)
+                if ok:
+                    output['label'] = probabilities[0]['label']
+                    output['probability'] = probabilities[0]['probability']
+                    if not args.top_only:
+                        output['probabilities'] = probabilities
+                elif result.ok:
+                    # Reported like a malformed input record, keeping the rest of the batch
+                    output['status_code'] = result.status_code
+                    output['error'] = 'malformed response: no probabilities in %s'%(result.response,)
+                else:
+                    output['status_code'] = result.status_code
+                    output['error'] = str(result.error) if result.error else result.response
+                write_json(out,output)
+                summary.count(ok)
+    finally:
+        if journal is not None:
+            journal.close()
+    out.flush()
+    summary.report(session.connection_stats() if args.verbose else None)
+    return EXIT_OK if not summary.counts['failed'] else EXIT_FAILED
+
+
+def cmd_feedback(args,session,out):
+    import feedback_uploader
+    model = load_model(session,args.model_id,with_dataset=True)
+    journal = None
+    if args.journal:
+        from job_journal import JobJournal
+        journal = JobJournal(args.journal,'feedback:%s:%s'%(model.modelId,args.input or 'stdin'))
+
+    def report_failure(line_number, document, label, response, status_code, error):
+        if error is not None or status_code != 200:
+            write_json(sys.stderr,{'line': line_number, 'status_code': status_code,
+                                   'error': str(error) if error else response})
+
+    uploader = feedback_uploader.FeedbackUploader(model,max_workers=args.concurrency,
+                                                  progress_callback=feedback_uploader.print_progress,
+                                                  progress_every=args.progress_every,
+                                                  result_callback=report_failure,journal=journal)
+    try:
+        with open_input(args.input) as f:
+            progress = uploader.upload_rows(feedback_uploader.read_examples(f,args.delimiter),
+                                            limit=args.limit)
+    finally:
+        if journal is not None:
+            journal.close()
+    write_json(out,progress)
+    return EXIT_OK if not progress['failed'] else EXIT_FAILED
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='einstein',
+                                     description='Batch client for the Einstein Intent API.')
+    parser.add_argument('--token',default=os.environ.get('EINSTEIN_TOKEN'),
+                        help='access token of an active session (default: $EINSTEIN_TOKEN)')
+    parser.add_argument('--email',default=os.environ.get('EINSTEIN_EMAIL'),
+                        help='account email, with --cert (default: $EINSTEIN_EMAIL)')
+    parser.add_argument('--cert',default=os.environ.get('EINSTEIN_CERT'),
+                        help='einstein_platform.pem certificate (default: $EINSTEIN_CERT)')
+    parser.add_argument('--duration',type=int,default=3600,
+                        help='lifetime of a new token, in seconds (default: 3600)')
+    parser.add_argument('--base-url',default=os.environ.get('EINSTEIN_BASE_URL'),
+                        help='root of the API (default: %s)'%einstein_constants.EINSTEIN_BASE_URL)
+    parser.add_argument('-v','--verbose',action='store_true',
+                        help='add connection statistics to the summary')
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record',metavar='CASSETTE',
+                          help='record every call and its response to CASSETTE')
+    cassette.add_argument('--replay',metavar='CASSETTE',
+                          help='answer every call from CASSETTE instead of the API')
+    parser.add_argument('--replay-speed',type=float,metavar='SPEED',
+                        help='with --replay, wait the recorded time of each call divided by SPEED '
+                             '(default: answer at once)')
+    parser.add_argument('--metrics',metavar='PATH',default=os.environ.get('EINSTEIN_METRICS'),
+                        help='write per-endpoint call metrics to PATH on exit, as Prometheus '
+                             'text, or JSON if PATH ends with .json (default: $EINSTEIN_METRICS)')
+    commands = parser.add_subparsers(dest='command',metavar='command')
+    commands.required = True
+
+    p = commands.add_parser('session',help='start a session and print its token')
+    p.add_argument('--token-only',action='store_true',help='print only the token')
+    p.set_defaults(run=cmd_session)
+
+    p = commands.add_parser('upload',help='create a dataset from a CSV file or url')
+    source = p.add_mutually_exclusive_group(required=True)
+    source.add_argument('file',nargs='?',help='local CSV file of (document, label) rows')
+    source.add_argument('--url',help='url of a CSV file')
+    p.add_argument('--compress',action='store_true',help='gzip the file while uploading')
+    p.add_argument('--validate',action='store_true',help='validate the file locally first')
+    p.add_argument('--wait',action='store_true',help='wait until the dataset is available')
+    p.add_argument('--timeout',type=float,help='seconds to wait, with --wait')
+    p.set_defaults(run=cmd_upload)
+
+    p = commands.add_parser('status',help='print the metadata of a dataset or model')
+    p.add_argument('kind',choices=('dataset','model'))
+    p.add_argument('id')
+    p.set_defaults(run=cmd_status)
+
+    p = commands.add_parser('train',help='train a model on a dataset')
+    p.add_argument('dataset_id')
+    p.add_argument('--name',help='model name (default: a random one)')
+    p.add_argument('--retrain',metavar='MODEL_ID',help='retrain this model with its feedback')
+    p.add_argument('--wait',action='store_true',help='wait until training has finished')
+    p.add_argument('--timeout',type=float,help='seconds to wait, with --wait')
+    p.set_defaults(run=cmd_train)
+
+    p = commands.add_parser('predict',help='classify documents from a file or stdin')
+    p.add_argument('model_id')
+    p.add_argument('input',nargs='?',help='input file (default: stdin)')
+    p.add_argument('--format',choices=('jsonl','csv','text'),default='jsonl',
+                   help='input format (default: jsonl)')
+    p.add_argument('--field',default='document',help='jsonl field holding the document')
+    p.add_argument('--column',type=int,default=0,help='csv column holding the document')
+    p.add_argument('--delimiter',default=',',help='csv delimiter')
+    p.add_argument('-c','--concurrency',type=int,default=8,help='concurrent calls (default: 8)')
+    p.add_argument('--unordered',action='store_true',
+                   help='write results as they complete instead of in input order')
+    p.add_argument('--top-only',action='store_true',help='omit the full probabilities list')
+    p.add_argument('--journal',help='SQLite journal, to resume an interrupted run without '
+                                    'predicting finished documents again')
+    p.set_defaults(run=cmd_predict)
+
+    p = commands.add_parser('feedback',help='submit (document, label) CSV rows as feedback')
+    p.add_argument('model_id')
+    p.add_argument('input',nargs='?',help='CSV file (default: stdin)')
+    p.add_argument('--delimiter',default=',',help='csv delimiter')
+    p.add_argument('-c','--concurrency',type=int,default=4,help='concurrent calls (default: 4)')
+    p.add_argument('--limit',type=int,help='stop after this many rows')
+    p.add_argument('--journal',help='SQLite journal, to resume an interrupted upload')
+    p.add_argument('--progress-every',type=int,default=500,
+                   help='rows between progress lines on stderr (default: 500)')
+    p.set_defaults(run=cmd_feedback)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+    # The library reports warnings with print: keep stdout for results only
+    with contextlib.redirect_stdout(sys.stderr):
+        session = make_session(args)
+        try:
+            return args.run(args,session,out)
+        except BrokenPipeError:
+            # The reading end of the pipe closed, e.g. `| head`
+            return EXIT_OK
+        finally:
+            session.close()
+            if args.metrics and session.telemetry:
+                session.telemetry.write(args.metrics)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,5 +7,28 @@ Created on Tue Sep 25 16:09:21 2018
 """
 
 EINSTEIN_BASE_URL = 'https://api.einstein.ai/v2'
-EINSTEIN_API_OAUTH = EINSTEIN_BASE_URL + '/oauth2/token'
-LANG_BASE_URL = EINSTEIN_BASE_URL + '/language'
+OAUTH_ENDPOINT = '/oauth2/token'
+LANG_ENDPOINT = '/language'
+EINSTEIN_API_OAUTH = EINSTEIN_BASE_URL + OAUTH_ENDPOINT
+LANG_BASE_URL = EINSTEIN_BASE_URL + LANG_ENDPOINT
+
+MODEL_QUEUED = 'QUEUED'
+MODEL_RUNNING = 'RUNNING'
+MODEL_SUCCEEDED = 'SUCCEEDED'
+MODEL_FAILED = 'FAILED'
+MODEL_TERMINAL_STATES = (MODEL_SUCCEEDED, MODEL_FAILED)
+
+DATASET_AVAILABLE = 'AVAILABLE'
+DATASET_NOT_AVAILABLE = 'NOT_AVAILABLE'
+DATASET_FAILED = 'FAILED'
+DATASET_TERMINAL_STATES = (DATASET_AVAILABLE, DATASET_FAILED)
+
+# Largest count accepted by the listing endpoints
+MAX_PAGE_SIZE = 25
+
+# Seconds a non-terminal status is trusted before the readiness checks poll again
+STATUS_MAX_AGE = 5
+
+# Limits checked locally before a text-intent dataset is uploaded
+INTENT_MIN_EXAMPLES_PER_LABEL = 5
+INTENT_MAX_DOCUMENT_LENGTH = 1000
@@ -0,0 +1,976 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Sep 26 08:16:36 2018
+
+Tk user interface, imported only when the window is opened (see main.py).
+
+@author: andrewcarroll
+"""
+
+import tkinter as tk
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+from tkinter import messagebox
+from tkinter.filedialog import askopenfilename, askdirectory
+from time import ctime,time
+import os
+import tempfile
+import einstein_session
+import einstein_catalog
+import einstein_recorder
+import dataset
+import feedback_uploader
+
+LABEL_WIDTH = 15
+CATALOG_PATH = os.path.join(os.path.expanduser('~'),'.einstein_catalog_%s.sqlite')
+POLL_INTERVAL = 50
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTasks:
+
+    def __init__(self,root,max_workers=4,poll_interval=POLL_INTERVAL,on_change=None):
+        """Runs the network calls of a Tk window on worker threads.
+
+        Note:
+            Tk widgets may only be touched from the thread running mainloop. Workers
+            never call back into Tk: their results, and any call_soon requests, are put
+            on a queue that the Tk thread drains every poll_interval milliseconds with
+            after(), running the done or error callbacks there.
+
+        Args:
+            root (tk.Tk): Window whose after() loop drains the queue.
+            max_workers (int, default = 4): Number of worker threads.
+            poll_interval (int, default = 50): Milliseconds between two polls of the queue.
+            on_change (callable, optional): Called on the Tk thread with the names of the
+                running actions whenever an action starts or finishes.
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.results = queue.Queue()
+        self.running = {}
+        self.cancelled = set()
+        self._closed = False
+        self.root.after(self.poll_interval,self._poll)
+
+    def run(self,action,work,on_done=None,on_error=None,button=None,cancellable=False):
+        """Run work on a worker thread, unless the same action is already running.
+
+        Args:
+            action (str): Name of the action, shown while it runs. A second run of an
+                action that has not finished is ignored, so double clicks send one call.
+            work (callable): Called on a worker thread, with a threading.Event set on
+                cancel as its only argument if cancellable, without arguments otherwise.
+            on_done (callable, optional): Called on the Tk thread with the result of work.
+            on_error (callable, optional): Called on the Tk thread with the exception raised
+                by work, with the action name first. Defaults to an error dialog.
+            button (tk.Button, optional): Disabled while the action runs.
+            cancellable (bool, default = False): Whether cancel() applies to the action.
+
+        Returns:
+            True if the action was started.
+        """
+        if action in self.running or self._closed:
+            self.root.bell()
+            return False
+        cancel_event = threading.Event() if cancellable else None
+        if button is not None:
+            button.configure(state='disabled')
+        self.cancelled.discard(action)
+        self.running[action] = (cancel_event, button, on_done, on_error)
+        self.executor.submit(self._call,action,work,cancel_event)
+        self._changed()
+        return True
+
+    def _call(self,action,work,cancel_event):
+        try:
+            result = work(cancel_event) if cancel_event is not None else work()
+        except Exception as e:
+            self.results.put((action,None,e))
+        else:
+            self.results.put((action,result,None))
+
+    def call_soon(self,func,*args):
+        """Have func(*args) called on the Tk thread, e.g. from a progress callback."""
+        self.results.put((None,func,args))
+
+    def cancel(self,action=None):
+        """Ask a cancellable action, or every one if action is None, to stop."""
+        for name, (cancel_event, _, _, _) in list(self.running.items()):
+            if cancel_event is not None and action in (None, name):
+                cancel_event.set()
+                self.cancelled.add(name)
+
+    def cancellable(self):
+        return [name for name, (cancel_event, _, _, _) in self.running.items()
+                if cancel_event is not None and not cancel_event.is_set()]
+
+    def was_cancelled(self,action):
+        return action in self.cancelled
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(list(self.running))
+
+    def _poll(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                action, result, error = self.results.get_nowait()
+                if action is None:
+                    result(*error)
+                    continue
+                _, button, on_done, on_error = self.running.pop(action)
+                if button is not None:
+                    button.configure(state='normal')
+                self._changed()
+                if error is not None:
+                    (on_error or self._show_error)(action,error)
+                elif on_done is not None:
+                    on_done(result)
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.poll_interval,self._poll)
+
+    def _show_error(self,action,error):
+        if isinstance(error,TaskCancelled):
+            messagebox.showinfo(title=action, message=str(error) or 'Cancelled')
+        else:
+            messagebox.showerror(title=action, message='%s: %s'%(error.__class__.__name__,error))
+
+    def shutdown(self,wait=False):
+        """Cancel the cancellable actions and stop the workers.
+
+        Args:
+            wait (bool, default = False): Return only once running actions have finished,
+                e.g. before closing what they use.
+        """
+        self._closed = True
+        self.cancel()
+        self.executor.shutdown(wait=wait)
+
+
+class EPAWindow(tk.Tk):
+    
+    def __init__(self,parent):
+        tk.Tk.__init__(self,parent)
+        self.parent = parent
+        self.session = None
+        self.catalog = None
+        self.dataset = None
+        self.model = None
+        self.record_dir = None
+        self.recorder = None
+        self._renderer = None
+        self.available_datasets = ['Not Available', '']
+        self.available_models = ['Not Available', '']
+        self.call_history = ''
+        self.tasks = BackgroundTasks(self,on_change=self.tasks_changed)
+        self.initialize()
+        self.protocol('WM_DELETE_WINDOW',self.close)
+
+
+    def initialize(self):
+        
+        self.nb = ttk.Notebook(self)
+        
+        """This block constructs the Session tab"""
+        session_page = ttk.Frame(self.nb)
+
+        (self.email_field,
+            self.cert_button,
+            self.cert_var,
+            self.time_field,
+            self.start_session_with_certificate_button,
+            self.record_button,
+            self.record_var) = make_session_frame(session_page)
+
+        self.cert_button.configure(
+                command=self.get_cert_name
+        )
+
+        self.start_session_with_certificate_button.configure(
+                command=lambda: self.start_session(email=self.email_field.get(),
+                                                cert_path=self.cert_var.get(),
+                                                session_duration=self.time_field.get()))
+
+        self.record_button.configure(
+            command=self.get_record_directory
+        )
+
+        self.time_remaining_label = tk.Label(session_page,
+                                   text='Time remaining will update when session begins')
+
+        self.time_remaining_label.pack(side='top',fill='x',padx=5,pady=5)
+        self.session_feedback = tk.Text(session_page,height=10,width=30)
+        self.session_feedback.pack(side='top',fill='x',padx=10,pady=10)
+        
+        self.usage_status_button, _ = makebuttonlabelrow(session_page,
+                                                         'Check Usage Data')
+        self.usage_status_button.configure(command=self.get_usage_status)
+    
+        self.usage_feedback = tk.Text(session_page,height=10,width=30)
+        self.usage_feedback.pack(side='top',fill='x',padx=10,pady=10)
+        
+        self.get_all_datasets_button, self.get_all_datasets_label = \
+                makebuttonlabelrow(session_page,
+                                'Get All Datasets')
+        
+        self.get_all_datasets_button.configure(
+                command=self.get_all_datasets)
+        
+        self.associated_datasets_feedback = tk.Text(session_page,
+                                                    height=10,width=30)
+        self.associated_datasets_feedback.pack(side='top', fill='x',
+                                                padx=10, pady=10)
+        
+        self.nb.add(session_page,text='Session')
+        
+        
+        """This block constructs the Dataset tab""" 
+        
+        dataset_page = ttk.Frame(self.nb)
+        
+        dataset_id_row = tk.Frame(dataset_page)
+        self.dataset_lab = tk.Label(dataset_id_row, width=LABEL_WIDTH, text='Dataset ID', anchor='w')
+        self.dataset_var = tk.StringVar(dataset_id_row)
+        self.dataset_var.set(self.available_datasets[0])
+        self.dataset_menu = tk.OptionMenu(dataset_id_row,
+                                            self.dataset_var,
+                                            *self.available_datasets)
+        self.dataset_from_id_button = tk.Button(dataset_id_row, text='Link Dataset', anchor='w')
+
+        self.dataset_lab.pack(side='left')
+        self.dataset_menu.pack(side='left',fill='x',expand='yes')
+        self.dataset_from_id_button.pack(side='right')
+        dataset_id_row.pack(side='top',fill='x',expand='yes')
+
+        self.dataset_from_id_button.configure(
+                command=lambda: self.link_dataset(self.dataset_var.get())
+                )
+        
+        self.dataset_url_field, self.upload_dataset_from_url_button = \
+            makebuttonrow(dataset_page,
+                        'Dataset URL',
+                        'Upload dataset from URL')
+
+        self.upload_dataset_from_url_button.configure(
+                command=lambda: self.dataset_from_url(
+                    self.dataset_url_field.get())
+                    )
+
+        
+        self.dataset_file_field, self.upload_dataset_from_file_button = \
+                makebuttonrow(dataset_page,
+                            'Dataset Filepath',
+                            'Upload dataset from file')
+
+        self.upload_dataset_from_file_button.configure(
+                command=self.dataset_from_file
+                )
+
+        self.dataset_status_button, self.dataset_status_label = \
+                makebuttonlabelrow(dataset_page, 'Check Dataset Status')
+        
+        self.dataset_status_button.configure(
+                command=self.update_dataset)
+        
+        self.dataset_delete_button, self.dataset_delete_label = \
+                makebuttonlabelrow(dataset_page, 'Delete Dataset')
+        
+        self.dataset_delete_button.configure(
+                command=self.delete_dataset
+                )
+        
+        self.dataset_delete_status_button, self.dataset_delete_status_label = \
+                makebuttonlabelrow(dataset_page, 'Dataset Deletion Status')
+
+        self.dataset_delete_status_button.configure(
+                command=self.delete_dataset_status)
+         
+        self.dataset_feedback = tk.Text(dataset_page, height=10, width=30)
+        self.dataset_feedback.pack(side='top', fill='x', padx=10, pady=10)
+        
+        self.get_dataset_models_button, self.get_all_models_label = \
+                makebuttonlabelrow(dataset_page, 'Get All Associated Models')
+        self.get_dataset_models_button.configure(
+                command=self.get_associated_models)
+        
+        self.associated_models_feedback = tk.Text(dataset_page, height=10, width=30)
+        self.associated_models_feedback.pack(side='top', fill='x', padx=10, pady=10)
+
+        self.nb.add(dataset_page,text='Dataset')
+        
+        
+        """This creates the model tab""" 
+        
+        self.model_page = ttk.Frame(self.nb)
+
+        model_id_row = tk.Frame(self.model_page)
+        self.model_lab = tk.Label(model_id_row, width=LABEL_WIDTH, text='Model ID', anchor='w')
+        self.model_var = tk.StringVar(model_id_row)
+        self.model_var.set(self.available_models[0])
+        self.model_menu = tk.OptionMenu(model_id_row,
+                                            self.model_var,
+                                            *self.available_models)
+        self.model_from_id_button = tk.Button(model_id_row, text='Link Model', anchor='w')
+
+        self.model_lab.pack(side='left')
+        self.model_menu.pack(side='left',fill='x',expand='yes')
+        self.model_from_id_button.pack(side='right')
+        model_id_row.pack(side='top',fill='x',expand='yes')
+    
+        self.model_from_id_button.configure(
+                command=lambda: self.link_model(self.model_var.get()))
+        
+        self.train_new_model_button = tk.Button(self.model_page,
+                                                height=3,
+                                                text='Train New Model',
+                                                command=self.train_new_model)
+        self.train_new_model_button.pack(side='top',
+                                         fill='x',
+                                         expand='yes',
+                                         padx=20,
+                                         pady=20)
+        
+        self.model_status_button, self.model_status_label = \
+                makebuttonlabelrow(self.model_page,
+                                'Check Model Status')
+        
+        self.model_status_button.configure(
+                command=self.check_model_status)
+        
+        
+        
+        self.query_field, self.query_button = makebuttonrow(self.model_page,
+                                                            'Prediction Query',
+                                                            'Predict Class')
+        
+        self.query_button.configure(
+                command=lambda: self.predict(self.query_field.get())
+                )
+        
+
+        self.feedback_row = tk.Frame(self.model_page)
+        
+        self.feedback_fields = tk.Frame(self.feedback_row)
+        
+        self.doc_row = tk.Frame(self.feedback_fields)
+        self.feedback_lab = tk.Label(self.doc_row,
+                                     width=LABEL_WIDTH,
+                                     text='Feedback Example',
+                                     anchor='w')
+
+        self.feedback_doc = tk.StringVar()
+        self.feedback_ent = tk.Entry(self.doc_row,
+                                     textvariable=self.feedback_doc)
+        self.feedback_lab.pack(side='left')
+        self.feedback_ent.pack(side='right')
+        self.doc_row.pack(side='top')
+        
+        self.class_row = tk.Frame(self.feedback_fields)
+        self.feedback_class = tk.StringVar()
+        self.feedback_class_lab = tk.Label(self.class_row,
+                                           width=LABEL_WIDTH,
+                                           text='Feedback Class',anchor='w')
+        self.feedback_class_ent = tk.Entry(self.class_row,
+                                           textvariable=self.feedback_class)
+        self.feedback_class_lab.pack(side='left')
+        self.feedback_class_ent.pack(side='right')
+        self.class_row.pack(side='top')
+     
+        self.feedback_fields.pack(side='left')
+        
+        self.feedback_button = tk.Button(self.feedback_row,
+                text='Submit Feedback',
+                command=lambda: self.submit_feedback(self.feedback_doc.get(),
+                                                    self.feedback_class.get()))
+        
+        self.feedback_button.pack(side='right')
+        self.feedback_row.pack(side='top',
+                                fill='x',
+                                expand='yes',
+                                padx=10,
+                                pady=10)
+        
+        self.feedback_file_field, self.feedback_file_button = \
+                makebuttonrow(self.model_page,
+                            'Feedback File',
+                            'Submit feedback from file')
+
+        self.feedback_file_button.configure(
+                command = self.upload_thread
+                )
+
+        self.retrain_model_button = tk.Button(self.model_page,
+                                              text='Retrain Model',
+                                              command=self.retrain_model,
+                                              height=3)
+        self.retrain_model_button.pack(side='top',
+                                       fill='x',
+                                       expand='yes',
+                                       padx=20,
+                                       pady=20)
+        
+        self.model_feedback_frame = tk.Frame(self.model_page)
+        self.model_feedback_field = tk.Label(self.model_feedback_frame,
+                                             anchor='w',
+                                             text='Updated at: ')
+        self.model_feedback_field.pack(side='top',
+                                       fill='x',
+                                       expand='yes',
+                                       padx=10,
+                                       pady=10)
+        self.model_feedback = tk.Text(self.model_feedback_frame,
+                                      height=10,
+                                      width=30)
+        self.model_feedback.pack(side='top',fill='x',padx=10,pady=10)
+        self.model_feedback_frame.pack(side='top',fill='x',padx=10,pady=10)
+        
+        self.nb.add(self.model_page,text='Model')
+        self.nb.pack(expand=1, fill="both")
+        
+        """This creates the metrics tab""" 
+        
+        self.metrics_page = ttk.Frame(self.nb)
+        
+        
+        self.get_model_metrics_button, self.get_model_metrics_label = \
+                makebuttonlabelrow(self.metrics_page,
+                                    'Get Model Metrics')
+
+        self.get_model_metrics_button.configure(
+                command=self.get_model_metrics
+                )
+        
+        
+        self.get_model_lc_button, self.get_model_lc_label =\
+                makebuttonlabelrow(self.metrics_page,
+                                    'Get Learning Curve')
+
+        self.get_model_lc_button.configure(
+                command=self.get_model_lc)
+
+        self.nb.add(self.metrics_page,text='Metrics')
+        self.nb.pack(expand=1, fill="both")
+    
+        self.nb.pack(expand=1, fill="both")
+
+        """This creates the status bar"""
+
+        status_row = tk.Frame(self)
+        self.status_label = tk.Label(status_row, text='Ready', anchor='w')
+        self.cancel_button = tk.Button(status_row, text='Cancel', state='disabled',
+                                       command=self.tasks.cancel)
+        self.status_label.pack(side='left', fill='x', expand='yes')
+        self.cancel_button.pack(side='right')
+        status_row.pack(side='bottom', fill='x', padx=10, pady=5)
+        
+
+    def get_cert_name(self):
+        cert_file = askopenfilename(title="Choose platform certificate")
+        self.cert_var.set(cert_file)
+
+    def get_record_directory(self):
+        self.record_dir = askdirectory(title="Choose a directory for record storage")
+        self.record_var.set(self.record_dir)
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if self.record_dir:
+            self.recorder = einstein_recorder.CallRecorder(self.record_dir)
+
+    def get_usage_status(self):
+        def done(result):
+            msg, status = result
+            self.write_record('Usage', 'session', msg)
+            add_feedback(self.usage_feedback, msg, 'Usage\n')
+        self.tasks.run('Usage', self.session.monitor_usage, done,
+                       button=self.usage_status_button)
+
+    def get_associated_models(self):
+        datasetId = self.dataset.datasetId
+        if self.catalog is not None:
+            self.show_models(*self.catalog.get_associated_models(datasetId))
+            if self.catalog.models_stale(datasetId):
+                self.tasks.run('Sync models', lambda: self.catalog.sync_models(datasetId),
+                               lambda changed: changed and self.models_changed(datasetId))
+        else:
+            def done(result):
+                self.write_record('Assoc_models', 'dataset', result[0])
+                self.show_models(*result)
+            self.tasks.run('Models', self.dataset.get_associated_models, done,
+                           button=self.get_dataset_models_button)
+
+    def models_changed(self,datasetId):
+        if self.dataset is not None and self.dataset.datasetId == datasetId:
+            self.show_models(*self.catalog.get_associated_models(datasetId))
+
+    def show_models(self,msg,status):
+        try:
+            self.available_models = msg['data']
+            self.model_var.set('Choose an available model')
+            self.model_menu['menu'].delete(0, 'end')
+            for model in self.available_models:
+                self.model_menu['menu'].add_command(label='%s: %s'%(model['name'][:20],model['modelId']),
+                                                    command=tk._setit(self.model_var, model['modelId']))
+        except:
+            pass
+        try:
+            add_feedback(self.associated_models_feedback,msg,'Models\n')
+        except:
+            messagebox.showinfo(title="Associated Models", message=status)
+    
+    def delete_dataset(self):
+        if messagebox.askyesno("Dataset Delete Warning",
+                           "This will PERMANENTLY delete model %s from SF Einstein. This cannot be undone. Are you sure?"%self.dataset.datasetId):
+            print('Deleting dataset...')
+            def done(result):
+                if self.catalog is not None:
+                    self.catalog.forget_dataset(self.dataset.datasetId)
+                messagebox.showinfo(title='Deletion Status', message=result[0])
+            self.tasks.run('Delete dataset', self.dataset.delete_self, done,
+                           button=self.dataset_delete_button)
+            
+    def delete_dataset_status(self):
+        self.tasks.run('Deletion status', self.dataset.update_deletion_status,
+                       lambda result: messagebox.showinfo(title='Deletion Status', message=result[0]),
+                       button=self.dataset_delete_status_button)
+            
+    def update_dataset(self):
+        def work():
+            msg, _ = self.dataset.update_dataset_status()
+            return msg, self.dataset.dataset_isReady
+        def done(result):
+            msg, ready = result
+            self.show_dataset_status(ready)
+            messagebox.showinfo(title="Dataset Update", message=msg)
+        self.tasks.run('Dataset status', work, done, button=self.dataset_status_button)
+        
+    def update_model(self):
+        def work():
+            msg, _ = self.model.update_model_status()
+            return msg, self.model.model_isReady
+        def done(result):
+            msg, ready = result
+            self.show_model_status(ready)
+            messagebox.showinfo(title="Update Model Information", message=msg)
+        self.tasks.run('Model status', work, done, button=self.model_status_button)
+    
+    def get_model_metrics(self):
+        modelId = self.model.modelId
+        def work():
+            msg, status = self.model.get_model_metrics()
+            return msg, self.renderer().report(modelId,self.plot_directory(),metrics=msg)
+        def done(result):
+            msg, paths = result
+            self.write_record('Metrics', 'model', msg)
+            self.get_model_metrics_label.configure(text='Updated at %s, plots in %s'
+                                                   %(ctime(),self.plot_directory()))
+        self.tasks.run('Metrics', work, done, button=self.get_model_metrics_button)
+
+    def get_model_lc(self):
+        modelId = self.model.modelId
+        def work():
+            msg, status = self.model.get_learning_curve()
+            return msg, self.renderer().report(modelId,self.plot_directory(),learning_curve=msg)
+        def done(result):
+            msg, paths = result
+            self.write_record('LC', 'model', msg)
+            self.get_model_lc_label.configure(text='Updated at %s, plots in %s'
+                                              %(ctime(),self.plot_directory()))
+        self.tasks.run('Learning curve', work, done, button=self.get_model_lc_button)
+
+    def renderer(self):
+        # matplotlib takes about a second to import, so it is only loaded once a plot is drawn
+        if self._renderer is None:
+            import einstein_plots
+            self._renderer = einstein_plots.MetricsRenderer()
+        return self._renderer
+
+    def plot_directory(self):
+        return self.record_dir or tempfile.gettempdir()
+  
+    def check_model_status(self):
+        def work():
+            try:
+                return self.model.model_isReady
+            except Exception:
+                return None
+        self.tasks.run('Model status', work, self.show_model_status,
+                       button=self.model_status_button)
+
+    def show_model_status(self,ready):
+        if ready is None:
+            self.model_status_label.configure(text='The model could not be found', 
+                                              background='blue')
+            messagebox.showinfo(title="Model Information", 
+                                message="Is there a model yet?")
+        elif ready:
+            self.model_status_label.configure(text='The model is ready.',
+                                              background='green2')
+        else:
+            self.model_status_label.configure(text='The model is not ready.',
+                                              background='coral')
+        try:
+            add_feedback(self.model_feedback,
+                         self.model.model_metadata,
+                         'Model Feedback')
+            self.model_feedback_field.configure(
+                    text='Responses to calls, updated at: %s'%ctime(time()))
+            self.write_record('status', 'model', self.model.model_metadata)
+        except:
+            pass
+        
+    def check_dataset_status(self):
+        self.tasks.run('Dataset status', lambda: self.dataset.dataset_isReady,
+                       self.show_dataset_status, button=self.dataset_status_button)
+
+    def show_dataset_status(self,ready):
+        if ready:
+            self.dataset_status_label.configure(text='The dataset is ready',
+                                                background='green2')
+        else:
+            self.dataset_status_label.configure(text='The dataset is not ready.', 
+                                               background='coral')
+        messagebox.showinfo(title="Dataset Update",
+                            message=str(self.dataset.dataset_metadata)+str(self.dataset.labels))
+        try:
+            add_feedback(self.dataset_feedback,
+                         self.dataset.dataset_metadata,
+                         'Dataset Feedback')
+            
+            self.write_record('status', 'dataset', self.dataset.dataset_metadata)
+        except:
+            print('Could not write dataset record')
+
+    def link_dataset(self,idn):
+        def work():
+            linked = dataset.Dataset(self.session,datasetId=idn,catalog=self.catalog)
+            return linked, linked.dataset_isReady
+        def done(result):
+            self.dataset, ready = result
+            self.show_dataset_status(ready)
+            self.get_associated_models()
+        self.tasks.run('Link dataset', work, done, button=self.dataset_from_id_button)
+
+    def link_model(self,modelId):
+        def work():
+            linked = dataset.Model(dataset=self.dataset,modelId=modelId,catalog=self.catalog)
+            return linked, linked.model_isReady
+        def done(result):
+            self.model, ready = result
+            self.show_model_status(ready)
+        self.tasks.run('Link model', work, done, button=self.model_from_id_button)
+        
+    def train_new_model(self):
+        if messagebox.askyesno("New Model Verification",
+                               "This will detatch any other models from this instance."
+                               + "Do you wish to train a new model?"):
+            def work():
+                model = dataset.Model(self.dataset,catalog=self.catalog)
+                msg, _ = model.train_model()
+                return model, msg
+            def done(result):
+                self.model, msg = result
+                self.write_record('train', 'model', msg)
+                messagebox.showinfo(title="Model Information", message=str(msg))
+                self.model_var.set(self.model.modelId)
+                self.check_model_status()
+            self.tasks.run('Train', work, done, button=self.train_new_model_button)
+        
+    def retrain_model(self):
+        if messagebox.askyesno("Retrain Verification",
+                               "This will retrain the existing model. Would you like to continue?"):
+            def done(result):
+                self.write_record('retrain', 'model', result[0])
+                messagebox.showinfo(title="Initiating Retrain",message=str(result[0]))
+                self.check_model_status()
+            self.tasks.run('Retrain', self.model.retrain_model, done,
+                           button=self.retrain_model_button)
+       
+    def predict(self,query):
+        def done(result):
+            msg, status = result
+            self.write_record('prediction', 'model', msg)
+            try: 
+                probs_string = ''
+                probs = msg['probabilities']
+                for prob in probs:
+                    probs_string+='\nLabel: %s with probability %0.2f'%(prob['label'],100*prob['probability'])
+                messagebox.showinfo(title="Predicted class of '%s'"%query, message=probs_string)
+            except:
+                messagebox.showinfo(title="Error", message="Error! %s\n%s"%(status,msg))
+        self.tasks.run('Predict', lambda: self.model.predict(query), done,
+                       button=self.query_button)
+    
+    def get_all_datasets(self):
+        """List datasets from the catalog at once, then refresh it in the background."""
+        if self.catalog is None:
+            def done(result):
+                self.write_record('list_all', 'session', result[0])
+                self.show_datasets(result[0])
+            self.tasks.run('Datasets', self.session.get_datasets, done,
+                           button=self.get_all_datasets_button)
+        else:
+            self.show_datasets(self.catalog.get_datasets()[0])
+            self.tasks.run('Refresh catalog', self.catalog.refresh, self.catalog_changed,
+                           button=self.get_all_datasets_button)
+
+    def catalog_changed(self,changed):
+        if changed['datasets']:
+            self.show_datasets(self.catalog.get_datasets()[0])
+        if self.dataset is not None and self.dataset.datasetId:
+            self.models_changed(self.dataset.datasetId)
+
+    def show_datasets(self,msg):
+        try:
+            self.available_datasets = msg['data']
+            self.dataset_var.set('Choose an available dataset')
+            self.dataset_menu['menu'].delete(0, 'end')
+            for dataset in self.available_datasets:
+                self.dataset_menu['menu'].add_command(label='%s: %s'%(dataset['name'][:20],dataset['id']),
+                                                        command=tk._setit(self.dataset_var, dataset['id']))
+        except:
+            pass
+        add_feedback(self.associated_datasets_feedback,
+                     msg,
+                     title='List of datasets') 
+        
+    def dataset_from_url(self,url):
+        def work():
+            created = dataset.Dataset(self.session)
+            msg, _ = created.create_dataset(urlpath=url)
+            return created, msg, created.dataset_isReady if created.datasetId else False
+        self.tasks.run('Upload dataset', work, self.dataset_created,
+                       button=self.upload_dataset_from_url_button)
+    
+    def dataset_from_file(self):
+        dataset_filepath = askopenfilename(title="Choose dataset file")
+        if dataset_filepath:
+            self.dataset_file_field.set(dataset_filepath)
+            def work(cancel_event):
+                def progress(sent,total,rate):
+                    if cancel_event.is_set():
+                        raise TaskCancelled('Upload of %s cancelled'%dataset_filepath)
+                    self.tasks.call_soon(self.set_status,'Uploading dataset: %0.1f of %0.1f MB (%0.1f MB/s)'
+                                         %(sent/1e6,total/1e6,rate/1e6))
+                created = dataset.Dataset(self.session)
+                msg, _ = created.create_dataset(filepath=dataset_filepath,progress_callback=progress)
+                return created, msg, created.dataset_isReady if created.datasetId else False
+            self.tasks.run('Upload dataset', work, self.dataset_created,
+                           button=self.upload_dataset_from_file_button, cancellable=True)
+
+    def dataset_created(self,result):
+        created, msg, ready = result
+        self.dataset = created
+        self.write_record('upload', 'dataset', msg)
+        self.show_dataset_status(ready)
+        self.dataset_var.set(self.dataset.datasetId)
+           
+    def submit_feedback(self,document,expectedLabel):
+        def work():
+            assert(self.dataset.dataset_isReady), "It appears the dataset is not yet ready."
+            assert(self.model.model_isReady), "It appears the model is not yet ready."
+            return self.model.submit_feedback(document,expectedLabel)
+        def done(result):
+            self.write_record('feedback_submission', 'model', result[0])
+            messagebox.showinfo(title="Feedback Status",
+                                message="The line '%s' was submitted with intended label '%s\n"%(document,expectedLabel)+str(result[0]))
+        self.tasks.run('Feedback', work, done, button=self.feedback_button)
+
+    def upload_feedback(self,feedback_filepath,limit=1000,cancel_event=None):
+        def progress(progress):
+            feedback_uploader.print_progress(progress)
+            self.tasks.call_soon(self.set_status,'Feedback: %s read, %s uploaded, %s failed'
+                                 %(progress['read'],progress['succeeded'],progress['failed']))
+        assert(self.model.model_isReady), "It appears the model is not yet ready."
+        uploader = feedback_uploader.FeedbackUploader(self.model,progress_callback=progress)
+        progress = uploader.upload(feedback_filepath,limit=limit,cancel_event=cancel_event)
+        msg, status = self.dataset.update_dataset_status()
+        return progress, msg
+
+    def start_session(self,email=None,private_key=None,cert_path=None,token=None,session_duration=None):
+        if session_duration:
+            session_duration = int(session_duration)*3600
+        else:
+            session_duration=3600
+        def work():
+            if self.session:
+                self.session.reset_authorization_token(session_duration)
+                return self.session, self.catalog
+            session = (einstein_session
+                       .EinsteinPlatformSession(email=email,
+                                                cert_path=cert_path,
+                                                token=token,
+                                                session_duration=session_duration))
+            return session, einstein_catalog.EinsteinCatalog(session, CATALOG_PATH%(email or 'default'))
+        def done(result):
+            self.session, self.catalog = result
+            try:
+                add_feedback(self.session_feedback,
+                            self.session.session_metadata,
+                            'Session Feedback')
+                self.get_all_datasets()
+            except: pass
+            self.time_remaining_label.configure(
+                text='You have until %s with this token' %ctime(self.session.expiration_time)
+                )
+        self.tasks.run('Session', work, done, button=self.start_session_with_certificate_button)
+
+    def write_record(self, call_type, object_type, message):
+        """Append a call to the recorder of the record folder, if one was chosen."""
+        if self.recorder is not None:
+            if object_type == 'session':
+                object_id = self.session.token[-10:]
+            elif object_type == 'dataset':
+                object_id = self.dataset.datasetId
+            elif object_type == 'model':
+                object_id = self.model.modelId
+            else:
+                object_id = ''
+            self.recorder.record(call_type, object_type, object_id, message)
+        
+    def upload_thread(self):
+        feedback_filepath=askopenfilename(title="Choose comma-separated-values feedback file")
+        if feedback_filepath:
+            self.feedback_file_field.set(feedback_filepath)
+            def done(result):
+                progress, msg = result
+                self.write_record('feedback_update', 'dataset', msg)
+                messagebox.showinfo(title="Upload Status",
+                                    message='Upload %s\n%s'%('Cancelled' if self.tasks.was_cancelled('Feedback upload')
+                                                             else 'Complete',progress))
+            self.tasks.run('Feedback upload',
+                           lambda cancel_event: self.upload_feedback(feedback_filepath,cancel_event=cancel_event),
+                           done, button=self.feedback_file_button, cancellable=True)
+
+    def set_status(self,text):
+        self.status_label.configure(text=text)
+
+    def tasks_changed(self,running):
+        """Show the running actions in the status bar and enable Cancel when one can be cancelled."""
+        self.set_status('Working: %s'%', '.join(sorted(running)) if running else 'Ready')
+        self.cancel_button.configure(state='normal' if self.tasks.cancellable() else 'disabled')
+        self.configure(cursor='watch' if running else '')
+
+    def close(self):
+        # Actions still running may use the catalog, recorder or session closed below
+        self.set_status('Closing...')
+        self.update_idletasks()
+        self.tasks.shutdown(wait=True)
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.catalog is not None:
+            self.catalog.close()
+        if self.session is not None:
+            self.session.close()
+        self.destroy()
+        
+
+def makebuttonrow(root,field_prompt,button_text):
+    row= tk.Frame(root)
+    lab = tk.Label(row, width=LABEL_WIDTH, text=field_prompt, anchor='w')
+    entry_var = tk.StringVar()
+    ent = tk.Entry(row,textvariable=entry_var)
+
+    row.pack(side='top', fill='x',padx=10,pady=10)
+    lab.pack(side='left')
+    ent.pack(side='left',expand='yes', fill='x')
+    but=None
+    if button_text:
+        but = tk.Button(row,text=button_text)
+        but.pack(side='right')
+    return entry_var, but
+
+def make_session_frame(root):
+    frame = tk.Frame(root)
+
+    record_row = tk.Frame(frame)
+    record_row_lab = tk.Label(record_row, width=LABEL_WIDTH, text='Record Folder', anchor='w')
+    record_var = tk.StringVar()
+    record_ent = tk.Entry(record_row, textvariable=record_var)
+    record_but = tk.Button(record_row, text='Select Directory', anchor='w')
+
+    record_row_lab.pack(side='left')
+    record_ent.pack(side='left', expand='yes', fill='x')
+    record_but.pack(side='left')
+    record_row.pack(side='top', fill='x', expand='yes')
+
+    cert_row = tk.Frame(frame)
+    cert_row_lab = tk.Label(cert_row, width=LABEL_WIDTH, text='Certificate Path', anchor='w')
+    cert_var = tk.StringVar()
+    cert_ent = tk.Entry(cert_row, textvariable=cert_var)
+    cert_but = tk.Button(cert_row, text='File Explorer', anchor='w')
+
+    cert_row_lab.pack(side='left')
+    cert_ent.pack(side='left', expand='yes', fill='x')
+    cert_but.pack(side='left')
+    cert_row.pack(side='top', fill='x', expand='yes')
+
+    email_row = tk.Frame(frame)
+    email_lab = tk.Label(email_row, width=LABEL_WIDTH, text='Email Address', anchor='w')
+    email_var = tk.StringVar()
+    email_ent = tk.Entry(email_row, textvariable=email_var)
+
+    email_lab.pack(side='left')
+    email_ent.pack(side='left', expand='yes', fill='x')
+    email_row.pack(side='top', fill='x', expand='yes')
+
+    time_row = tk.Frame(frame)
+    time_lab = tk.Label(time_row, width=LABEL_WIDTH, text='Time (in hours)', anchor='w')
+    time_var = tk.StringVar()
+    time_var.set('1')
+    time_ent = tk.Entry(time_row,textvariable=time_var)
+    session_but = tk.Button(time_row, text='Start session')
+    time_row.pack(side='left', fill='x', expand='yes')
+
+    time_lab.pack(side='left')
+    time_ent.pack(side='left',fill='x')
+    session_but.pack(side='right')
+    
+
+    frame.pack(side='top', fill='x', padx=10, pady=10)
+
+    return (email_var, cert_but, cert_var,
+            time_var, session_but, record_but,
+            record_var)
+
+def makebuttonlabelrow(root,button_text):
+    row = tk.Frame(root)
+    lab = tk.Label(row, text='', width=LABEL_WIDTH, anchor='w')
+    but = tk.Button(row,text=button_text, anchor='w')
+
+    row.pack(side='top', fill='x',padx=10,pady=10)    
+    lab.pack(side='left', fill='x',expand='yes')
+    but.pack(side='right')  
+
+    return but, lab
+
+def add_feedback(field,json_dict,title=''):
+    output_string='%s\n--------\n%s\n'%(title,str(json_dict))
+    field.insert(1.0,output_string)
+
+
+def run():
+    app = EPAWindow(None)
+    app.title('Einstein Intent')
+    app.mainloop()
+
+
+if __name__ == "__main__":
+    run()
+   
+
+
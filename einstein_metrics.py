@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NumPy views of model metrics and learning curves, and side-by-side comparison
+of the models of a dataset.
+
+@author: andrewcarroll
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import einstein_constants
+
+
+def _ratio(numerator,denominator):
+    numerator = np.asarray(numerator,dtype=float)
+    denominator = np.asarray(denominator,dtype=float)
+    return np.divide(numerator,denominator,out=np.full(np.broadcast(numerator,denominator).shape,np.nan),
+                     where=denominator > 0)
+
+
+class ModelMetrics:
+
+    def __init__(self,metrics,modelId=None):
+        """Metrics of a trained model, converted once to NumPy arrays.
+
+        Args:
+            metrics (dict): get_model_metrics response, or its metricsData.
+            modelId (str, optional): Defaults to the id of the response.
+
+        Attributes:
+            labels (ndarray): Label names, in the order of every per-label array.
+            confusion (ndarray): label x label counts, rows are the true labels.
+            reported_f1 (ndarray): Per-label F1 as reported by the API.
+            test_accuracy, training_accuracy, training_loss (float): As reported, or nan.
+            precision_curve, recall_curve (ndarray): Precision-recall curve, empty if the
+                response has none.
+        """
+        data = metrics.get('metricsData',metrics)
+        self.modelId = modelId or metrics.get('id')
+        self.raw = metrics
+        self.labels = np.asarray(data.get('labels',[]),dtype=str)
+        n = len(self.labels)
+        self.confusion = np.asarray(data.get('confusionMatrix',np.zeros((n,n))),dtype=np.int64).reshape(n,n)
+        self.reported_f1 = np.asarray(data.get('f1',np.full(n,np.nan)),dtype=float)
+        self.test_accuracy = float(data.get('testAccuracy',np.nan))
+        self.training_accuracy = float(data.get('trainingAccuracy',np.nan))
+        self.training_loss = float(data.get('trainingLoss',np.nan))
+        curve = data.get('precisionRecallCurve') or {}
+        self.precision_curve = np.asarray(curve.get('precision',[]),dtype=float)
+        self.recall_curve = np.asarray(curve.get('recall',[]),dtype=float)
+
+    def __repr__(self):
+        return '<%s %s, %s labels, accuracy %0.3f>'%(
+                self.__class__.__name__,self.modelId,len(self.labels),self.accuracy)
+
+    @classmethod
+    def from_model(cls,model):
+        """Fetch the metrics of a trained Model."""
+        msg, status_code = model.get_model_metrics()
+        if status_code != 200:
+            raise ValueError('Metrics of model %s unavailable (status %s): %s'
+                             %(model.modelId,status_code,msg))
+        return cls(msg,model.modelId)
+
+    @property
+    def support(self):
+        """Test examples of each true label."""
+        return self.confusion.sum(axis=1)
+
+    @property
+    def predicted(self):
+        """Test examples predicted as each label."""
+        return self.confusion.sum(axis=0)
+
+    @property
+    def true_positives(self):
+        return np.diagonal(self.confusion)
+
+    @property
+    def precision(self):
+        return _ratio(self.true_positives,self.predicted)
+
+    @property
+    def recall(self):
+        return _ratio(self.true_positives,self.support)
+
+    @property
+    def f1(self):
+        """Per-label F1 computed from the confusion matrix."""
+        precision, recall = self.precision, self.recall
+        return _ratio(2*precision*recall,precision+recall)
+
+    @property
+    def accuracy(self):
+        total = self.confusion.sum()
+        return float(self.true_positives.sum()/total) if total else self.test_accuracy
+
+    @property
+    def macro_f1(self):
+        f1 = self.f1
+        return float(np.nanmean(f1)) if np.isfinite(f1).any() else np.nan
+
+    @property
+    def weighted_f1(self):
+        f1, support = np.nan_to_num(self.f1), self.support
+        return float((f1*support).sum()/support.sum()) if support.sum() else np.nan
+
+    def most_confused(self,n=10):
+        """The n largest off-diagonal cells, as (true label, predicted label, count)."""
+        errors = self.confusion.copy()
+        np.fill_diagonal(errors,0)
+        flat = np.argsort(errors,axis=None,kind='stable')[::-1][:n]
+        rows, columns = np.unravel_index(flat,errors.shape)
+        return [(str(self.labels[r]),str(self.labels[c]),int(errors[r,c]))
+                for r, c in zip(rows,columns) if errors[r,c]]
+
+    def per_label(self):
+        """One dict per label with its support, precision, recall and F1."""
+        columns = (self.support,self.precision,self.recall,self.f1,self.reported_f1)
+        return [{'label': label, 'support': int(support), 'precision': float(precision),
+                 'recall': float(recall), 'f1': float(f1), 'reported_f1': float(reported)}
+                for label, support, precision, recall, f1, reported in zip(self.labels.tolist(),*columns)]
+
+    def summary(self):
+        return {'modelId': self.modelId, 'labels': len(self.labels), 'accuracy': self.accuracy,
+                'test_accuracy': self.test_accuracy, 'training_accuracy': self.training_accuracy,
+                'training_loss': self.training_loss, 'macro_f1': self.macro_f1,
+                'weighted_f1': self.weighted_f1}
+
+
+class LearningCurve:
+
+    def __init__(self,learning_curve,modelId=None):
+        """Per-epoch metrics of a get_learning_curve response, as NumPy arrays.
+
+        Attributes:
+            epochs (ndarray): Epoch numbers, in increasing order.
+            training_loss, training_accuracy, test_accuracy (ndarray): One value per epoch.
+            labels (ndarray): Label names of the per-label arrays.
+            f1 (ndarray): epoch x label F1.
+        """
+        self.modelId = modelId
+        self.raw = learning_curve
+        epochs = sorted(learning_curve.get('data',[]),key=lambda epoch: epoch['epoch'])
+        data = [epoch.get('metricsData',{}) for epoch in epochs]
+        self.labels = np.asarray(data[0].get('labels',[]) if data else [],dtype=str)
+        n = len(self.labels)
+        self.epochs = np.fromiter((epoch['epoch'] for epoch in epochs),float,len(epochs))
+        self.training_loss = np.asarray([d.get('trainingLoss',np.nan) for d in data],dtype=float)
+        self.training_accuracy = np.asarray([d.get('trainingAccuracy',np.nan) for d in data],dtype=float)
+        self.test_accuracy = np.asarray([d.get('testAccuracy',np.nan) for d in data],dtype=float)
+        self.f1 = np.asarray([d.get('f1',[np.nan]*n) for d in data],dtype=float).reshape(len(data),n)
+
+    def __repr__(self):
+        return '<%s %s, %s epochs>'%(self.__class__.__name__,self.modelId,len(self.epochs))
+
+    @classmethod
+    def from_model(cls,model):
+        """Fetch the learning curve of a trained Model."""
+        msg, status_code = model.get_learning_curve()
+        if status_code != 200:
+            raise ValueError('Learning curve of model %s unavailable (status %s): %s'
+                             %(model.modelId,status_code,msg))
+        return cls(msg,model.modelId)
+
+    @property
+    def macro_f1(self):
+        """Mean F1 over labels, per epoch."""
+        if not self.f1.size:
+            return np.full(len(self.epochs),np.nan)
+        return np.nanmean(self.f1,axis=1)
+
+    @property
+    def generalization_gap(self):
+        """Training minus test accuracy, per epoch."""
+        return self.training_accuracy-self.test_accuracy
+
+    @property
+    def best_epoch(self):
+        """Epoch with the highest test accuracy, or None without any."""
+        if not np.isfinite(self.test_accuracy).any():
+            return None
+        return float(self.epochs[np.nanargmax(self.test_accuracy)])
+
+
+class ModelComparison:
+
+    def __init__(self,metrics,learning_curves=None,errors=None):
+        """Metrics of several models aligned on the union of their labels.
+
+        Attributes:
+            modelIds (list): Ids of the compared models, in input order.
+            labels (ndarray): Union of the labels of every model.
+            f1 (ndarray): model x label F1, nan where a model lacks the label.
+            support (ndarray): model x label test examples.
+            errors (dict): Exception raised for each model whose metrics could not be loaded.
+        """
+        self.metrics = list(metrics)
+        self.learning_curves = learning_curves or {}
+        self.errors = errors or {}
+        self.modelIds = [m.modelId for m in self.metrics]
+        self.labels = np.unique(np.concatenate([m.labels for m in self.metrics])) \
+            if self.metrics else np.asarray([],dtype=str)
+        self.f1 = np.full((len(self.metrics),len(self.labels)),np.nan)
+        self.support = np.zeros((len(self.metrics),len(self.labels)),dtype=np.int64)
+        for row, m in enumerate(self.metrics):
+            columns = np.searchsorted(self.labels,m.labels)
+            self.f1[row,columns] = m.f1
+            self.support[row,columns] = m.support
+        self.accuracy = np.asarray([m.accuracy for m in self.metrics],dtype=float)
+        self.macro_f1 = np.asarray([m.macro_f1 for m in self.metrics],dtype=float)
+        self.weighted_f1 = np.asarray([m.weighted_f1 for m in self.metrics],dtype=float)
+
+    def __repr__(self):
+        return '<%s %s models, %s labels>'%(self.__class__.__name__,len(self.metrics),len(self.labels))
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def ranking(self,by='macro_f1'):
+        """modelIds from best to worst by 'macro_f1', 'weighted_f1' or 'accuracy'."""
+        scores = getattr(self,by)
+        # Models without a score rank last (np.nan_to_num only takes nan= from numpy 1.17)
+        scores = np.where(np.isnan(scores),-np.inf,scores)
+        return [self.modelIds[i] for i in np.argsort(-scores,kind='stable')]
+
+    def best(self,by='macro_f1'):
+        ranking = self.ranking(by)
+        return self.metrics[self.modelIds.index(ranking[0])] if ranking else None
+
+    def best_by_label(self):
+        """For every label, the modelId with the highest F1 on it."""
+        if not len(self.metrics):
+            return {}
+        f1 = np.where(np.isnan(self.f1),-np.inf,self.f1)
+        best = np.argmax(f1,axis=0)
+        found = np.isfinite(f1[best,np.arange(len(self.labels))])
+        return dict((label,self.modelIds[i]) for label, i in zip(self.labels[found].tolist(),best[found]))
+
+    def table(self):
+        """One summary dict per model, best first by macro F1."""
+        by_id = dict((m.modelId,m) for m in self.metrics)
+        rows = []
+        for modelId in self.ranking():
+            row = by_id[modelId].summary()
+            curve = self.learning_curves.get(modelId)
+            if curve is not None:
+                row['best_epoch'] = curve.best_epoch
+            rows.append(row)
+        return rows
+
+
+def compare_models(models,max_workers=8,learning_curves=False):
+    """Load the metrics of several trained models concurrently and compare them.
+
+    Args:
+        models (iterable): Model objects.
+        max_workers (int, default = 8): Concurrent metrics calls.
+        learning_curves (bool, default = False): Also load each model's learning curve.
+
+    Returns:
+        ModelComparison. Models whose metrics could not be loaded are left out and
+        their exceptions kept in its errors attribute.
+    """
+    models = list(models)
+
+    def load(model):
+        metrics = ModelMetrics.from_model(model)
+        curve = LearningCurve.from_model(model) if learning_curves else None
+        return metrics, curve
+
+    loaded, curves, errors = [], {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(model, executor.submit(load,model)) for model in models]
+        for model, future in futures:
+            try:
+                metrics, curve = future.result()
+            except Exception as e:
+                errors[model.modelId] = e
+                continue
+            loaded.append(metrics)
+            if curve is not None:
+                curves[model.modelId] = curve
+    return ModelComparison(loaded,curves,errors)
+
+
+def compare_dataset_models(dataset,max_workers=8,learning_curves=False):
+    """Compare every successfully trained model of a Dataset."""
+    from dataset import Model
+    models = []
+    for metadata in dataset.iter_models():
+        if metadata.get('status') != einstein_constants.MODEL_SUCCEEDED:
+            continue
+        model = Model(dataset=dataset)
+        model.modelId = metadata['modelId']
+        model.model_metadata = metadata
+        models.append(model)
+    return compare_models(models,max_workers,learning_curves)
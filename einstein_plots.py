@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offscreen (Agg) rendering of model metrics and learning curves to image files,
+without pyplot, so it works on hosts without a display.
+
+@author: andrewcarroll
+"""
+
+import os
+import threading
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from einstein_metrics import LearningCurve, ModelMetrics
+
+KINDS = ('pr_curve', 'confusion_matrix', 'f1', 'learning_curve')
+
+
+def _as_metrics(metrics):
+    if isinstance(metrics,ModelMetrics):
+        return metrics
+    return ModelMetrics(metrics)
+
+
+def _as_learning_curve(learning_curve):
+    if isinstance(learning_curve,LearningCurve):
+        return learning_curve
+    return LearningCurve(learning_curve)
+
+
+class MetricsRenderer:
+
+    def __init__(self,figsize=(6.4,4.8),dpi=100,image_format='png'):
+        """Renders metrics plots to files, reusing one figure per kind of plot.
+
+        Note:
+            Figures are created once, without pyplot, and cleared before each render,
+            so rendering reports for many models does not grow memory. A lock
+            serializes renders, so one renderer can be shared by worker threads.
+
+        Args:
+            figsize (tuple, default = (6.4, 4.8)): Figure size in inches.
+            dpi (int, default = 100): Resolution of the images.
+            image_format (str, default = 'png'): Format of the image files.
+        """
+        self.figsize = figsize
+        self.dpi = dpi
+        self.image_format = image_format
+        self._figures = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.image_format)
+
+    def _figure(self,kind):
+        if kind not in self._figures:
+            figure = Figure(figsize=self.figsize,dpi=self.dpi)
+            FigureCanvasAgg(figure)
+            self._figures[kind] = figure
+        figure = self._figures[kind]
+        figure.clear()
+        return figure
+
+    def _save(self,figure,path):
+        figure.savefig(path,format=self.image_format)
+        return path
+
+    def pr_curve(self,metrics,path,title=None):
+        metrics = _as_metrics(metrics)
+        with self._lock:
+            figure = self._figure('pr_curve')
+            axes = figure.add_subplot(111)
+            if metrics.precision_curve.size:
+                order = np.argsort(metrics.recall_curve,kind='stable')
+                axes.plot(metrics.recall_curve[order],metrics.precision_curve[order],marker='.')
+            axes.set_xlim(-0.05,1.05)
+            axes.set_ylim(-0.05,1.05)
+            axes.set_xlabel('Recall')
+            axes.set_ylabel('Precision')
+            axes.set_title(title or 'Precision-recall')
+            return self._save(figure,path)
+
+    def confusion_matrix(self,metrics,path,title=None,normalize=True):
+        metrics = _as_metrics(metrics)
+        confusion = metrics.confusion.astype(float)
+        if normalize:
+            totals = confusion.sum(axis=1,keepdims=True)
+            confusion = np.divide(confusion,totals,out=np.zeros_like(confusion),where=totals > 0)
+        with self._lock:
+            figure = self._figure('confusion_matrix')
+            axes = figure.add_subplot(111)
+            image = axes.imshow(confusion,cmap='Blues',vmin=0,vmax=1 if normalize else None)
+            figure.colorbar(image,ax=axes)
+            ticks = np.arange(len(metrics.labels))
+            axes.set_xticks(ticks)
+            axes.set_yticks(ticks)
+            axes.set_xticklabels(metrics.labels,rotation=90,fontsize='small')
+            axes.set_yticklabels(metrics.labels,fontsize='small')
+            axes.set_xlabel('Predicted label')
+            axes.set_ylabel('True label')
+            axes.set_title(title or 'Confusion matrix')
+            figure.tight_layout()
+            return self._save(figure,path)
+
+    def f1(self,metrics,path,title=None):
+        metrics = _as_metrics(metrics)
+        f1 = metrics.reported_f1
+        order = np.argsort(f1,kind='stable')
+        with self._lock:
+            figure = self._figure('f1')
+            axes = figure.add_subplot(111)
+            axes.barh(np.arange(len(order)),f1[order])
+            axes.set_yticks(np.arange(len(order)))
+            axes.set_yticklabels(metrics.labels[order],fontsize='small')
+            axes.set_xlim(0,1)
+            axes.set_xlabel('F1')
+            axes.set_title(title or 'F1 by label')
+            figure.tight_layout()
+            return self._save(figure,path)
+
+    def learning_curve(self,learning_curve,path,title=None):
+        curve = _as_learning_curve(learning_curve)
+        with self._lock:
+            figure = self._figure('learning_curve')
+            accuracy = figure.add_subplot(111)
+            accuracy.plot(curve.epochs,curve.training_accuracy,marker='.',label='Training accuracy')
+            accuracy.plot(curve.epochs,curve.test_accuracy,marker='.',label='Test accuracy')
+            if curve.f1.size:
+                accuracy.plot(curve.epochs,curve.macro_f1,marker='.',label='Mean F1')
+            accuracy.set_xlabel('Epoch')
+            accuracy.set_ylabel('Accuracy')
+            accuracy.set_ylim(-0.05,1.05)
+            loss = accuracy.twinx()
+            loss.plot(curve.epochs,curve.training_loss,color='grey',linestyle='--',
+                      label='Training loss')
+            loss.set_ylabel('Loss')
+            lines = accuracy.get_legend_handles_labels()
+            loss_lines = loss.get_legend_handles_labels()
+            accuracy.legend(lines[0]+loss_lines[0],lines[1]+loss_lines[1],loc='center right',
+                            fontsize='small')
+            accuracy.set_title(title or 'Learning curve')
+            return self._save(figure,path)
+
+    def report(self,modelId,directory,metrics=None,learning_curve=None):
+        """Render every plot available for one model into directory.
+
+        Args:
+            modelId (str): Used in titles and as the file name prefix.
+            directory (str): Folder receiving <kind>_<modelId>.<format> files.
+            metrics (dict or ModelMetrics, optional): get_model_metrics response.
+            learning_curve (dict or LearningCurve, optional): get_learning_curve response.
+
+        Returns:
+            dict of the paths written, by kind.
+        """
+        os.makedirs(directory,exist_ok=True)
+        path = lambda kind: os.path.join(directory,'%s_%s.%s'%(kind,modelId,self.image_format))
+        paths = {}
+        if metrics is not None:
+            metrics = _as_metrics(metrics)
+            if metrics.precision_curve.size:
+                paths['pr_curve'] = self.pr_curve(metrics,path('pr_curve'),
+                                                  'Precision-recall for %s'%modelId)
+            paths['confusion_matrix'] = self.confusion_matrix(metrics,path('confusion_matrix'),
+                                                              'Confusion matrix for %s'%modelId)
+            paths['f1'] = self.f1(metrics,path('f1'),'F1 by label for %s'%modelId)
+        if learning_curve is not None:
+            paths['learning_curve'] = self.learning_curve(learning_curve,path('learning_curve'),
+                                                          'Learning curve for %s'%modelId)
+        return paths
+
+    def reports(self,models,directory):
+        """Render reports for many models, given (modelId, metrics, learning_curve) tuples.
+
+        Yields:
+            (modelId, paths) as each report is written.
+        """
+        for modelId, metrics, learning_curve in models:
+            yield modelId, self.report(modelId,directory,metrics,learning_curve)
+
+    def close(self):
+        with self._lock:
+            for figure in self._figures.values():
+                figure.clear()
+            self._figures = {}
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only record of API calls and their responses, kept as buffered JSONL
+segments with a small SQLite index of the objects each segment holds.
+
+@author: andrewcarroll
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+INDEX_NAME = 'index.sqlite'
+DEFAULT_SEGMENT_BYTES = 16*1024*1024
+DEFAULT_SEGMENT_AGE = 3600
+
+
+class CallRecorder:
+
+    def __init__(self,directory,segment_bytes=DEFAULT_SEGMENT_BYTES,segment_age=DEFAULT_SEGMENT_AGE,
+                 compress=True,flush_interval=1.0,buffer_size=1000):
+        """Records calls to JSONL segment files under directory.
+
+        Note:
+            record only appends to an in-memory buffer, so it is cheap enough to call from
+            a UI thread. A background thread writes the buffer every flush_interval seconds
+            (or as soon as buffer_size records are waiting) and rotates the segment once it
+            is segment_bytes long or segment_age seconds old. The index keeps, for every
+            segment, the objects it holds records of, so history only reads the segments
+            of the object asked for.
+
+        Args:
+            directory (str): Folder holding the segments and index.sqlite.
+            segment_bytes (int, default = 16 MB): Size after which a segment is rotated.
+            segment_age (float, default = 3600): Seconds after which a segment is rotated.
+            compress (bool, default = True): gzip segments once they are rotated.
+            flush_interval (float, default = 1): Seconds between two writes of the buffer.
+            buffer_size (int, default = 1000): Buffered records that trigger a write.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        os.makedirs(directory,exist_ok=True)
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._segment = None
+        self._segment_file = None
+        self._segment_started = None
+        self._sequence = 0
+
+        self._db = sqlite3.connect(os.path.join(directory,INDEX_NAME),check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS segments ('
+                             'name TEXT PRIMARY KEY, started_at REAL, closed_at REAL, '
+                             'records INTEGER, bytes INTEGER)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS objects ('
+                             'segment TEXT, object_type TEXT, object_id TEXT, records INTEGER, '
+                             'first_at REAL, last_at REAL, '
+                             'PRIMARY KEY (object_type, object_id, segment))')
+            # Segments left open by a process that did not close its recorder
+            self._db.execute('UPDATE segments SET closed_at=? WHERE closed_at IS NULL',(time.time(),))
+
+        self._thread = threading.Thread(target=self._run,daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def record(self,call_type,object_type,object_id,message):
+        """Buffer one call.
+
+        Args:
+            call_type (str): What was called, e.g. 'train' or 'prediction'.
+            object_type (str): 'session', 'dataset' or 'model'.
+            object_id (str): Id of the object the call was about.
+            message: JSON-serializable response of the call.
+        """
+        entry = {'at': time.time(), 'call': call_type, 'object': object_type,
+                 'id': None if object_id is None else str(object_id), 'message': message}
+        with self._lock:
+            if self._closed:
+                raise ValueError('Recorder is closed')
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.buffer_size:
+                self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print('Warning: could not write call records to %s: %s'%(self.directory,e))
+
+    def flush(self):
+        """Write the buffered records, rotating the segment when it is due."""
+        with self._write_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            if self._segment is not None and self._rotation_due():
+                self._close_segment()
+            if not entries:
+                return
+            if self._segment is None:
+                self._open_segment()
+            lines = [json.dumps(entry,default=str)+'\n' for entry in entries]
+            self._segment_file.write(''.join(lines))
+            self._segment_file.flush()
+
+            objects = {}
+            for entry in entries:
+                key = (entry['object'],entry['id'])
+                count, first_at, _ = objects.get(key,(0,entry['at'],None))
+                objects[key] = (count+1,first_at,entry['at'])
+            with self._db:
+                self._db.execute('UPDATE segments SET records=records+?, bytes=? WHERE name=?',
+                                 (len(entries),self._segment_file.tell(),self._segment))
+                for (object_type, object_id), (count, first_at, last_at) in objects.items():
+                    self._db.execute('INSERT OR IGNORE INTO objects VALUES (?,?,?,0,?,?)',
+                                     (self._segment,object_type,object_id,first_at,last_at))
+                    self._db.execute('UPDATE objects SET records=records+?, last_at=? '
+                                     'WHERE object_type=? AND object_id=? AND segment=?',
+                                     (count,last_at,object_type,object_id,self._segment))
+
+    def _rotation_due(self):
+        return self._segment_file.tell() >= self.segment_bytes or \
+            time.time()-self._segment_started >= self.segment_age
+
+    def _open_segment(self):
+        self._sequence += 1
+        self._segment_started = time.time()
+        self._segment = 'calls-%s-%d-%03d.jsonl'%(time.strftime('%Y%m%dT%H%M%S'),os.getpid(),
+                                                 self._sequence)
+        self._segment_file = open(os.path.join(self.directory,self._segment),'a',encoding='utf-8')
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO segments VALUES (?,?,NULL,0,0)',
+                             (self._segment,self._segment_started))
+
+    def _close_segment(self):
+        self._segment_file.close()
+        name = self._segment
+        if self.compress:
+            path = os.path.join(self.directory,name)
+            with open(path,'rb') as f, gzip.open(path+'.gz','wb') as out:
+                shutil.copyfileobj(f,out)
+            with self._db:
+                self._db.execute('UPDATE segments SET name=? WHERE name=?',(name+'.gz',name))
+                self._db.execute('UPDATE objects SET segment=? WHERE segment=?',(name+'.gz',name))
+            os.remove(path)
+            name += '.gz'
+        with self._db:
+            self._db.execute('UPDATE segments SET closed_at=? WHERE name=?',(time.time(),name))
+        self._segment = None
+        self._segment_file = None
+
+    def rotate(self):
+        """Flush and close the current segment now."""
+        self.flush()
+        with self._write_lock:
+            if self._segment is not None:
+                self._close_segment()
+
+    def segments(self,object_type=None,object_id=None):
+        """Names of the segments, oldest first, optionally only those holding an object."""
+        with self._write_lock:
+            if object_type is None:
+                rows = self._db.execute('SELECT name FROM segments ORDER BY started_at').fetchall()
+            else:
+                rows = self._db.execute('SELECT s.name FROM objects o JOIN segments s ON s.name=o.segment '
+                                        'WHERE o.object_type=? AND o.object_id=? ORDER BY s.started_at',
+                                        (object_type,str(object_id))).fetchall()
+        return [row[0] for row in rows]
+
+    def _open_for_reading(self,name):
+        path = os.path.join(self.directory,name)
+        if name.endswith('.gz'):
+            return gzip.open(path,'rt',encoding='utf-8')
+        try:
+            return open(path,'r',encoding='utf-8')
+        except FileNotFoundError:
+            if not self.compress:
+                raise
+            # Rotated since the segment list was read: the file is only removed once
+            # its compressed copy is complete, so read that instead
+            return gzip.open(path+'.gz','rt',encoding='utf-8')
+
+    def _read_segment(self,name):
+        # A segment still being written may end with a partial line, which is skipped.
+        # Once opened, a segment rotated meanwhile stays readable until it is closed.
+        with self._open_for_reading(name) as f:
+            for line in f:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+
+    def history(self,object_type,object_id,call_type=None,since=None):
+        """Yield the recorded calls about one object, oldest first.
+
+        Args:
+            object_type (str): 'session', 'dataset' or 'model'.
+            object_id (str): Id of the object.
+            call_type (str, optional): Only calls of this type.
+            since (float, optional): Only calls recorded at or after this time.
+        """
+        self.flush()
+        object_id = str(object_id)
+        # Segment names are read under the write lock, so each is either the segment
+        # being written, which _read_segment finds even if it is rotated meanwhile, or
+        # a rotated segment that no longer changes
+        for name in self.segments(object_type,object_id):
+            for entry in self._read_segment(name):
+                if entry['object'] == object_type and entry['id'] == object_id and \
+                        (call_type is None or entry['call'] == call_type) and \
+                        (since is None or entry['at'] >= since):
+                    yield entry
+
+    def objects(self,object_type=None):
+        """(object_type, object_id, records, first_at, last_at) of every recorded object."""
+        with self._write_lock:
+            sql = ('SELECT object_type, object_id, SUM(records), MIN(first_at), MAX(last_at) '
+                   'FROM objects %sGROUP BY object_type, object_id ORDER BY MAX(last_at)')
+            if object_type is None:
+                return self._db.execute(sql%'').fetchall()
+            return self._db.execute(sql%'WHERE object_type=? ',(object_type,)).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._write_lock:
+            if self._segment is not None:
+                self._close_segment()
+            self._db.close()
@@ -7,16 +7,125 @@ Created on Wed Sep 26 08:16:36 2018
 """
 
 
-import requests
-import jwt
 import time
+import threading
 import einstein_constants
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from requests import RequestException
+from einstein_backoff import Backoff
+from einstein_transport import EinsteinTransport
+from einstein_telemetry import Telemetry
+from rate_governor import RateGovernor, endpoint_class
+from single_flight import SingleFlight
 
-class EinsteinPlatformSession:
+MAX_PAGE_SIZE = einstein_constants.MAX_PAGE_SIZE
+DEFAULT_PAGE_SIZE = MAX_PAGE_SIZE
+# (connect, read) timeout of token requests, which hold the refresh lock
+TOKEN_TIMEOUT = (5, 15)
 
-    def __init__(self,email=None,private_key=None,cert_path=None,token=None,session_duration=3600):
+
+class EinsteinSessionBase:
+
+    def __init__(self,email=None,private_key=None,cert_path=None,token=None,session_duration=3600,
+                 base_url=einstein_constants.EINSTEIN_BASE_URL,auto_refresh=True,refresh_margin=300,
+                 governor=None,telemetry=None,single_flight=None,token_timeout=TOKEN_TIMEOUT):
+        """State and token handling shared by the blocking and the asyncio sessions.
+
+        Note:
+            Nothing here sends a call. EinsteinPlatformSession and
+            AsyncEinsteinPlatformSession (einstein_async.py) each send calls their own
+            way, through the same kinds of rate governor, telemetry and single-flight
+            objects, so one governor or telemetry can be shared by both.
+
+        Args:
+            See EinsteinPlatformSession.
+        """
+        self.API_PATH = base_url
+        self.AUTH_PATH = base_url + einstein_constants.OAUTH_ENDPOINT
+        self.LANG_PATH = base_url + einstein_constants.LANG_ENDPOINT
+        self.email = email
+        self.private_key = private_key
+        self.cert_path = cert_path
+        self.session_duration = session_duration
+        self.expiration_time = None
+        self.session_metadata = None
+        self.token = token
+        self.governor = RateGovernor() if governor is None else governor
+        self.telemetry = Telemetry() if telemetry is None else telemetry
+        self.single_flight = SingleFlight() if single_flight is None else single_flight
+        self.auto_refresh = auto_refresh
+        self.refresh_margin = refresh_margin
+        self.token_timeout = token_timeout
+        self._signing_key = None
+
+        if cert_path:
+            self.provide_certificate()
+
+    def authorization_header(self):
+        return {'Authorization': 'Bearer ' + self.token}
+
+    def metrics(self):
+        """Snapshot of the session's call metrics by endpoint class, see Telemetry.snapshot."""
+        return self.telemetry.snapshot() if self.telemetry else {}
+
+    def time_remaining(self):
+        return (self.expiration_time-time.time())/60
+
+    def provide_certificate(self):
+        with open(self.cert_path,'r') as f:
+            self.private_key = f.read()
+        self._signing_key = None
+
+    def signing_key(self):
+        """Private key object used to sign token requests, parsed from the PEM once."""
+        if self._signing_key is None:
+            # cryptography and jwt are imported on first use, so a session started from
+            # a token (e.g. in a short-lived worker) never loads them
+            from cryptography.hazmat.backends import default_backend
+            from cryptography.hazmat.primitives import serialization
+            self._signing_key = serialization.load_pem_private_key(self.private_key.encode('utf-8'),
+                                                                   password=None,
+                                                                   backend=default_backend())
+        return self._signing_key
+
+    def token_request(self,session_duration=None):
+        """Build the signed JWT bearer assertion used to request an access token.
+
+        Returns:
+            (float, dict, str): Expiration time of the requested token, the request
+                headers and the form-encoded request body.
+        """
+        if not session_duration:
+            session_duration=self.session_duration
+        payload = {
+                'aud': self.AUTH_PATH,
+                'exp': time.time()+session_duration,
+                'sub': self.email}
+        if not self.private_key:
+            self.provide_certificate()
+        header = {'Content-type': 'application/x-www-form-urlencoded'}
+        import jwt
+        assertion = jwt.encode(payload, self.signing_key(), algorithm='RS256')
+        if isinstance(assertion,bytes):
+            assertion = assertion.decode('utf-8')
+        return payload['exp'], header, 'grant_type=urn:ietf:params:oauth:grant-type:jwt-bearer&assertion='+assertion
+
+    def accept_token(self,session_metadata,expiration_time):
+        """Start using the access token of a successful token response."""
+        # Callers read self.token without locking; a single assignment swaps it atomically
+        self.session_metadata = session_metadata
+        self.expiration_time = expiration_time
+        self.token = session_metadata['access_token']
+
+
+class EinsteinPlatformSession(EinsteinSessionBase):
+
+    def __init__(self,email=None,private_key=None,cert_path=None,token=None,session_duration=3600,
+                 transport=None,base_url=einstein_constants.EINSTEIN_BASE_URL,
+                 auto_refresh=True,refresh_margin=300,governor=None,telemetry=None,
+                 single_flight=None,token_timeout=TOKEN_TIMEOUT,**transport_options):
         """
         Session object containing calls to the Einstein Platform Session API related to activity.
 
@@ -30,74 +139,235 @@ class EinsteinPlatformSession:
             cert_path (str, optional): Absolute path to einstein_platform.pem certificate
             token (str, optional): Access token of currently-active session
             session_duration (int, default = 3600): Amount of time (in minutes) to keep access token active
+            transport (EinsteinTransport, optional): Connection pool to use for every call. If
+                unprovided, a new one is created from transport_options (pool_connections,
+                pool_maxsize, pool_block, timeout).
+            base_url (str, optional): Root of the API, defaults to the Einstein Platform v2 API.
+            auto_refresh (bool, default = True): When the session holds a private key, request
+                a new access token in the background refresh_margin seconds before the
+                current one expires.
+            refresh_margin (int, default = 300): Seconds before expiration_time at which the
+                background refresh runs.
+            governor (RateGovernor, optional): Rate governor shared by every call of the
+                session. A RateGovernor with the default limits is created if unprovided;
+                pass False to send calls unthrottled.
+            telemetry (Telemetry, optional): Collects the latency, status code and bytes of
+                every call of the session. A Telemetry is created if unprovided; pass False
+                to record nothing.
+            single_flight (SingleFlight, optional): Shares one call among concurrent
+                identical GET and prediction calls. A SingleFlight is created if
+                unprovided; pass False to send every call on its own.
+            token_timeout (tuple, default = (5, 15)): (connect, read) timeout of token
+                requests. Other callers needing a token wait for them, so they get a
+                shorter timeout than other calls.
         Attributes:
             API_PATH (str): base path for the API calls
             AUTH_PATH (str): path for authorization
+            LANG_PATH (str): base path for the language (intent) API calls
             email (str): Email address of user (used to start a session with a certificate)
             private_key (str): Private key, derived from einstein_platform.pem certificate
             cert_path (str): File path for einstein_platform.pem certificate.
             expiration_time (int): Requested duration 
             session_metadata (dict): JSON data returned from the call to "start session"
+            transport (EinsteinTransport): Keep-alive connection pool shared by this session
+                and every Dataset and Model created from it.
+            governor (RateGovernor): Throttles the calls of this session by endpoint class.
+            telemetry (Telemetry): Per endpoint class metrics of the calls of this session.
+            single_flight (SingleFlight): Coalesces identical concurrent calls of this session.
         """
-        self.API_PATH = einstein_constants.EINSTEIN_BASE_URL
-        self.AUTH_PATH = einstein_constants.EINSTEIN_API_OAUTH
-        self.email = email
-        self.private_key = private_key
-        self.cert_path = cert_path
-        self.session_duration = session_duration
-        self.expiration_time = None
-        self.session_metadata = None
+        EinsteinSessionBase.__init__(self,email,private_key,cert_path,token,session_duration,
+                                     base_url,auto_refresh,refresh_margin,governor,telemetry,
+                                     single_flight,token_timeout)
+        self.transport = transport or EinsteinTransport(**transport_options)
+        self._refresh_lock = threading.RLock()
+        self._refresh_timer = None
+        self._refresh_backoff = Backoff(initial=5,maximum=120)
 
-        if cert_path:
-            self.provide_certificate()
-            
-        if token:
-            self.token = token
-        else:
+        if not token:
             assert(self.private_key), "PrivateKey Error: There was an error in retrieving the key"
             self.reset_authorization_token()
 
+    def request(self,method,url,fields=None,headers=None,authorize=True,**kwargs):
+        """Send a call to the API through the session's transport.
+
+        Every Dataset and Model call is routed through this method so they share
+        the session's connection pool and rate governor. Identical GET and prediction
+        calls made concurrently with the same token are sent once, and every caller
+        receives the same response (see SingleFlight).
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute url of the endpoint.
+            fields (dict, optional): Form fields, sent as multipart/form-data.
+            headers (dict, optional): Extra request headers.
+            authorize (bool, default = True): Add the bearer token to the headers.
+
+        Returns:
+            requests.Response
+        """
+        token = self.token if authorize else None
+        if not self.single_flight:
+            return self._request(method,url,fields,headers,authorize,token,**kwargs)
+        key = self.single_flight.key(method,url,fields,token,**kwargs) if not headers else None
+        return self.single_flight.do(key,lambda: self._request(method,url,fields,headers,
+                                                               authorize,token,**kwargs))
+
+    def _request(self,method,url,fields,headers,authorize,token,**kwargs):
+        call_headers = self.authorization_header() if authorize else {}
+        call_headers.update(headers or {})
+        response = self._send(method,url,fields,call_headers,**kwargs)
+        if response.status_code == 401 and authorize and self.private_key:
+            # The token expired or was revoked: refresh it once and replay the call
+            try:
+                self.refresh_stale_token(token)
+            except RequestException as e:
+                print('Error: token refresh failed with %s' %e)
+            # A failed refresh leaves the stale token, and replaying would only get another 401
+            if self.token != token:
+                call_headers.update(self.authorization_header())
+                response = self._send(method,url,fields,call_headers,retry=True,**kwargs)
+        return response
+
+    def _send(self,method,url,fields,headers,retry=False,**kwargs):
+        attempts = []
+
+        def send():
+            call = lambda: self.transport.request(method,url,
+                                                  fields=fields,
+                                                  headers=headers,
+                                                  **kwargs)
+            attempts.append(time.time())
+            if not self.telemetry:
+                return call()
+            # Every attempt after the first, e.g. a governor retry after a 429, is a retry
+            return self.telemetry.call(endpoint_class(method,url),call,retry or len(attempts) > 1)
+        if not self.governor:
+            return send()
+        return self.governor.send(method,url,send)
+
+    def connection_stats(self):
+        stats = self.transport.connection_stats()
+        if self.single_flight:
+            stats['coalesced'] = self.single_flight.stats()['shared']
+        return stats
+
+    def close(self):
+        self.cancel_refresh()
+        self.transport.close()
+
     def monitor_usage(self):
-        headers = {'Authorization': 'Bearer ' + self.token}
-        response = requests.get(url=self.API_PATH+'/apiusage',
-                                 headers=headers)        
+        response = self.request('GET',self.API_PATH+'/apiusage')
         return json.loads(response.text), response.status_code
                 
-    def time_remaining(self):
-        return (self.expiration_time-time.time())/60
-        
-    def provide_certificate(self):
-        with open(self.cert_path,'r') as f:
-            self.private_key = f.read()
-            
     def get_datasets(self):
-        response = requests.get(einstein_constants.LANG_BASE_URL+'/datasets',
-                     headers={'Authorization': 'Bearer ' + self.token})
+        response = self.request('GET',self.LANG_PATH+'/datasets')
 
         dataset_dict = json.loads(response.text)
 
         return dataset_dict, response.status_code
+
+    def iter_pages(self,url,page_size=DEFAULT_PAGE_SIZE,prefetch=True):
+        """Yield the items of a paged listing, fetching pages by offset and count.
+
+        Note:
+            Pages are fetched lazily. With prefetch, the next page is requested on a
+            background thread while the caller consumes the current one; a caller that
+            stops early abandons at most that one page.
+
+        Args:
+            url (str): Absolute url of the listing, e.g. LANG_PATH+'/datasets'.
+            page_size (int, default = 25): Items requested per page, at most MAX_PAGE_SIZE.
+                The server answers a larger count with MAX_PAGE_SIZE items, which would
+                otherwise read as the last page.
+            prefetch (bool, default = True): Fetch the next page ahead of the caller.
+
+        Raises:
+            requests.HTTPError: If a page is answered with an error status.
+        """
+        page_size = min(page_size,MAX_PAGE_SIZE)
+
+        def fetch(offset):
+            response = self.request('GET',url,params={'offset': offset, 'count': page_size})
+            response.raise_for_status()
+            return json.loads(response.text).get('data',[])
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        next_page = None
+        offset = 0
+        try:
+            page = fetch(offset)
+            while page:
+                offset += len(page)
+                if len(page) >= page_size and executor is not None:
+                    next_page = executor.submit(fetch,offset)
+                for item in page:
+                    yield item
+                if len(page) < page_size:
+                    return
+                page = next_page.result() if next_page is not None else fetch(offset)
+                next_page = None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def iter_datasets(self,page_size=DEFAULT_PAGE_SIZE,prefetch=True):
+        """Yield the metadata of every dataset of the account, a page at a time."""
+        return self.iter_pages(self.LANG_PATH+'/datasets',page_size,prefetch)
     
     def reset_authorization_token(self,session_duration=None):
-        if not session_duration:
-            session_duration=self.session_duration
-        payload = {
-                'aud': self.AUTH_PATH,
-                'exp': time.time()+session_duration,
-                'sub': self.email}
-        if not self.private_key:
-            self.provide_certificate()                
-        header = {'Content-type': 'application/x-www-form-urlencoded'}
-        assertion = jwt.encode(payload, self.private_key, algorithm='RS256')
-        assertion = assertion.decode('utf-8')
-        response = requests.post(url=self.AUTH_PATH,
-                                 headers=header,
-                                 data='grant_type=urn:ietf:params:oauth:grant-type:jwt-bearer&assertion='+assertion)
-
-        if response.status_code==200:
-            self.expiration_time = payload['exp']
-            self.token = response.json()['access_token']
-            self.session_metadata = json.loads(response.text)
-        else:
-            print('Error: status code %s' %response.status_code)
-        return json.loads(response.text), response.status_code
\ No newline at end of file
+        with self._refresh_lock:
+            expiration_time, header, body = self.token_request(session_duration)
+            response = self.request('POST',self.AUTH_PATH,
+                                    headers=header,
+                                    authorize=False,
+                                    data=body,
+                                    timeout=self.token_timeout)
+
+            if response.status_code==200:
+                self.accept_token(json.loads(response.text),expiration_time)
+                self._refresh_backoff.reset()
+                self.schedule_refresh()
+            else:
+                print('Error: status code %s' %response.status_code)
+            return json.loads(response.text), response.status_code
+
+    def refresh_stale_token(self,stale_token):
+        """Request a new token unless another thread already replaced stale_token."""
+        with self._refresh_lock:
+            if self.token == stale_token:
+                self.reset_authorization_token()
+
+    def schedule_refresh(self,delay=None):
+        """Arrange for the token to be refreshed in the background.
+
+        Args:
+            delay (float, optional): Seconds until the refresh. Defaults to refresh_margin
+                seconds before expiration_time.
+        """
+        if not (self.auto_refresh and self.private_key and self.expiration_time):
+            return
+        if delay is None:
+            delay = self.expiration_time-self.refresh_margin-time.time()
+        self.cancel_refresh()
+        self._refresh_timer = threading.Timer(max(delay,1),self._background_refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def cancel_refresh(self):
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+
+    def _background_refresh(self):
+        try:
+            _, status = self.reset_authorization_token()
+        except Exception as e:
+            print('Error: background token refresh failed with %s' %e)
+            status = None
+        if status != 200:
+            delay = self._refresh_backoff.next_delay()
+            if self.expiration_time:
+                delay = min(delay,max(self.expiration_time-time.time(),1))
+            self.schedule_refresh(delay)
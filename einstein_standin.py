@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Einstein Intent API, for benchmarks and offline runs:
+oauth, apiusage, datasets, train, models, intent and feedback endpoints with
+configurable latency and injected 429, 5xx and slow-body responses.
+
+@author: andrewcarroll
+"""
+
+import base64
+import hashlib
+import json
+import math
+import multiprocessing
+import random
+import socketserver
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import einstein_constants
+from rate_governor import endpoint_class
+
+DEFAULT_LABELS = ('billing', 'shipping', 'returns', 'account', 'other')
+FAULT_KINDS = ('rate_limit', 'server_error', 'slow_body')
+# Methods of StandinServer callable by POST /_standin/<method>, for StandinProcess
+CONTROL_PATH = '/_standin/'
+CONTROL_METHODS = ('issue_token', 'expire_tokens', 'add_dataset', 'add_model', 'set_faults',
+                   'reset_stats', 'stats')
+
+
+def latency_sampler(spec,rng=None):
+    """Build a function returning one response delay in seconds.
+
+    Args:
+        spec (float or str): A fixed delay, or 'fixed:<s>', 'uniform:<low>:<high>',
+            'exponential:<mean>' or 'lognormal:<median>:<sigma>'.
+        rng (random.Random, optional): Source of randomness, for repeatable runs.
+    """
+    rng = rng or random.Random()
+    if spec is None:
+        return lambda: 0.0
+    try:
+        delay = float(spec)
+        return lambda: delay
+    except ValueError:
+        pass
+    name, _, args = str(spec).partition(':')
+    args = [float(a) for a in args.split(':')] if args else []
+    if name == 'fixed' and len(args) == 1:
+        return lambda: args[0]
+    if name == 'uniform' and len(args) == 2:
+        return lambda: rng.uniform(args[0],args[1])
+    if name == 'exponential' and len(args) == 1:
+        return lambda: rng.expovariate(1/args[0]) if args[0] > 0 else 0.0
+    if name == 'lognormal' and len(args) == 2:
+        return lambda: rng.lognormvariate(math.log(args[0]),args[1]) if args[0] > 0 else 0.0
+    raise ValueError('Unknown latency %r: expected a number, fixed:<s>, uniform:<low>:<high>, '
+                     'exponential:<mean> or lognormal:<median>:<sigma>'%(spec,))
+
+
+def _by_endpoint(config):
+    """Split a config given for every endpoint class, or as {endpoint class or '*': value}."""
+    if isinstance(config,dict) and not (set(config) & set(FAULT_KINDS)):
+        return dict(config)
+    return {'*': config}
+
+
+def parse_multipart(body,content_type):
+    """Fields of a multipart/form-data body, as {name: bytes}."""
+    boundary = content_type.split('boundary=',1)[-1].strip('"').encode('latin-1')
+    fields = {}
+    for part in body.split(b'--'+boundary)[1:]:
+        if part.startswith(b'--'):
+            break
+        head, _, value = part.partition(b'\r\n\r\n')
+        for line in head.decode('latin-1').split('\r\n'):
+            if line.lower().startswith('content-disposition') and ' name="' in line:
+                name = line.split(' name="',1)[1].split('"',1)[0]
+                fields[name] = value[:-2] if value.endswith(b'\r\n') else value
+    return fields
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer only exists from Python 3.7
+    daemon_threads = True
+
+
+class StandinServer:
+
+    def __init__(self,host='127.0.0.1',port=0,latency=None,faults=None,seed=None,
+                 token_lifetime=3600,dataset_seconds=0.5,train_seconds=1.0,require_auth=True,
+                 slow_body_seconds=2.0,retry_after=None,error_status=503):
+        """HTTP server mimicking the Einstein Intent API on a local port.
+
+        Note:
+            latency and faults are given for every endpoint class at once, or as a dict
+            keyed by endpoint class ('auth', 'predict', 'feedback', 'train', 'status',
+            see rate_governor.endpoint_class) with '*' as the default. Faults are the
+            probability of each kind of fault, e.g. {'predict': {'rate_limit': 0.05},
+            '*': {'server_error': 0.01}}:
+                rate_limit: answer 429, with Retry-After if retry_after is set.
+                server_error: answer error_status.
+                slow_body: send the normal response over slow_body_seconds.
+            Datasets become available dataset_seconds after their upload, and models
+            succeed train_seconds after train or retrain is called.
+
+        Args:
+            host (str, default = '127.0.0.1'): Interface to listen on.
+            port (int, default = 0): Port to listen on; 0 picks a free one.
+            latency (optional): Delay before each response, see latency_sampler.
+            faults (dict, optional): Probabilities of injected faults.
+            seed (int, optional): Seed of the latency and fault draws, for repeatable runs.
+            token_lifetime (float, default = 3600): Seconds an issued token stays valid.
+            dataset_seconds (float, default = 0.5): Upload processing time.
+            train_seconds (float, default = 1): Training time.
+            require_auth (bool, default = True): Answer 401 to calls without a valid token.
+            slow_body_seconds (float, default = 2): Duration of a slow-body response.
+            retry_after (float, optional): Retry-After of the injected 429 responses.
+            error_status (int, default = 503): Status code of injected server errors.
+
+        Attributes:
+            base_url (str): Root of the stand-in API, to pass as EinsteinPlatformSession base_url.
+        """
+        self.token_lifetime = token_lifetime
+        self.dataset_seconds = dataset_seconds
+        self.train_seconds = train_seconds
+        self.require_auth = require_auth
+        self.slow_body_seconds = slow_body_seconds
+        self.retry_after = retry_after
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._latency = dict((name,latency_sampler(spec,self._rng))
+                             for name, spec in _by_endpoint(latency).items())
+        self.set_faults(faults)
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._datasets = {}
+        self._models = {}
+        self._feedback = 0
+        self._next_id = 1000000
+        self._stats = {}
+
+        self.httpd = _Server((host,port),_Handler)
+        self.httpd.standin = self
+        self.base_url = 'http://%s:%s/v2'%(self.httpd.server_address[0],self.httpd.server_address[1])
+        self._thread = None
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.base_url)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,*exc_info):
+        self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever,daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    # State
+
+    def issue_token(self,lifetime=None):
+        """Register and return a new access token."""
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens[token] = time.time()+(self.token_lifetime if lifetime is None else lifetime)
+        return token
+
+    def expire_tokens(self):
+        """Make every issued token invalid, as if they had all expired."""
+        with self._lock:
+            self._tokens = dict.fromkeys(self._tokens,0.0)
+
+    def token_valid(self,token):
+        with self._lock:
+            return self._tokens.get(token,0.0) > time.time()
+
+    def add_dataset(self,labels=DEFAULT_LABELS,examples=100,name='standin'):
+        """Create an available dataset without an upload, returning its id."""
+        with self._lock:
+            datasetId = self._new_id()
+            self._datasets[datasetId] = {'id': datasetId, 'name': name, 'created': time.time()-self.dataset_seconds,
+                                         'labels': list(labels), 'examples': examples, 'deleted': False}
+        return str(datasetId)
+
+    def add_model(self,datasetId,trained=True):
+        """Create a model of a dataset, already trained unless trained is False, returning its id."""
+        with self._lock:
+            modelId = self._new_model(int(datasetId),'Model_standin')
+            if trained:
+                self._models[modelId]['started'] -= self.train_seconds
+        return modelId
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _new_model(self,datasetId,name):
+        modelId = 'SI%sM%s'%(datasetId,self._new_id())
+        self._models[modelId] = {'modelId': modelId, 'datasetId': datasetId, 'name': name,
+                                 'started': time.time(), 'created': time.time()}
+        return modelId
+
+    def _dataset_json(self,dataset):
+        available = time.time()-dataset['created'] >= self.dataset_seconds
+        return {'id': dataset['id'], 'name': dataset['name'], 'type': 'text-intent',
+                'object': 'dataset', 'available': available,
+                'statusMsg': 'SUCCEEDED' if available else 'UPLOADING',
+                'totalExamples': dataset['examples'], 'totalLabels': len(dataset['labels']),
+                'labelSummary': {'labels': [{'name': label, 'datasetId': dataset['id'],
+                                             'numExamples': dataset['examples']//max(len(dataset['labels']),1)}
+                                            for label in dataset['labels']]}}
+
+    def _model_json(self,model):
+        elapsed = time.time()-model['started']
+        if elapsed >= self.train_seconds:
+            status, progress = einstein_constants.MODEL_SUCCEEDED, 1.0
+        elif elapsed >= self.train_seconds/10:
+            status, progress = einstein_constants.MODEL_RUNNING, round(elapsed/self.train_seconds,2)
+        else:
+            status, progress = einstein_constants.MODEL_QUEUED, 0.0
+        return {'modelId': model['modelId'], 'datasetId': model['datasetId'], 'name': model['name'],
+                'status': status, 'progress': progress, 'object': 'training',
+                'createdAt': time.strftime('%Y-%m-%dT%H:%M:%S.000+0000',time.gmtime(model['created'])),
+                'updatedAt': time.strftime('%Y-%m-%dT%H:%M:%S.000+0000',time.gmtime(model['started'])),
+                'modelType': 'text-intent'}
+
+    def _labels_of_model(self,modelId):
+        model = self._models.get(modelId)
+        dataset = self._datasets.get(model['datasetId']) if model else None
+        return dataset['labels'] if dataset else list(DEFAULT_LABELS)
+
+    # Faults and statistics
+
+    def set_faults(self,faults):
+        """Replace the fault probabilities, e.g. to start injecting faults after a setup."""
+        self._faults = _by_endpoint(faults or {})
+
+    def _draw(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def delay(self,endpoint):
+        sampler = self._latency.get(endpoint,self._latency.get('*'))
+        if sampler is None:
+            return 0.0
+        with self._rng_lock:
+            return max(sampler(),0.0)
+
+    def fault(self,endpoint):
+        """Kind of fault to inject in a call of endpoint, or None."""
+        faults = self._faults.get(endpoint,self._faults.get('*',{}))
+        for kind in FAULT_KINDS:
+            if faults.get(kind) and self._draw() < faults[kind]:
+                return kind
+        return None
+
+    def count(self,endpoint,status_code,fault=None):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint,{'requests': 0, 'status_codes': {},
+                                                     'faults': dict.fromkeys(FAULT_KINDS,0)})
+            stats['requests'] += 1
+            stats['status_codes'][str(status_code)] = stats['status_codes'].get(str(status_code),0)+1
+            if fault:
+                stats['faults'][fault] += 1
+
+    def stats(self):
+        """Calls served by endpoint class, with their status codes and injected faults."""
+        with self._lock:
+            stats = json.loads(json.dumps(self._stats))
+            stats['_state'] = {'datasets': len(self._datasets), 'models': len(self._models),
+                               'feedback': self._feedback, 'tokens': len(self._tokens)}
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+
+    # Endpoints, each returning (status_code, body)
+
+    def handle(self,method,path,query,headers,body):
+        path = path.rstrip('/')
+        if path.startswith('/v2'):
+            path = path[3:]
+        if path == einstein_constants.OAUTH_ENDPOINT and method == 'POST':
+            return self.oauth(body)
+        if self.require_auth:
+            authorization = headers.get('Authorization') or ''
+            if not self.token_valid(authorization.replace('Bearer ','',1)):
+                return 401, {'message': 'Invalid access token'}
+        fields = {}
+        content_type = headers.get('Content-Type') or ''
+        if content_type.startswith('multipart/form-data'):
+            fields = dict((name,value.decode('utf-8','replace'))
+                          for name, value in parse_multipart(body,content_type).items())
+        parts = path.split('/')[1:]
+        if parts == ['apiusage']:
+            return 200, {'object': 'list', 'data': [{'id': '1', 'organizationId': 'standin',
+                                                     'planData': [{'plan': 'FREE', 'amount': 1, 'source': 'standin'}],
+                                                     'licenseId': 'standin', 'predictionsRemaining': 1000000,
+                                                     'predictionsUsed': 0, 'predictionsMax': 1000000}]}
+        if not parts or parts[0] != einstein_constants.LANG_ENDPOINT.strip('/'):
+            return 404, {'message': 'Not found: %s'%path}
+        return self.language(method,parts[1:],query,fields)
+
+    def oauth(self,body):
+        assertion = dict(item.split('=',1) for item in body.decode('utf-8').split('&') if '=' in item) \
+            .get('assertion','')
+        try:
+            payload = assertion.split('.')[1]
+            json.loads(base64.urlsafe_b64decode(payload+'='*(-len(payload)%4)))
+        except (IndexError, ValueError):
+            return 400, {'message': 'Invalid JWT assertion'}
+        token = self.issue_token()
+        return 200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': self.token_lifetime}
+
+    def language(self,method,parts,query,fields):
+        with self._lock:
+            if parts == ['datasets'] and method == 'GET':
+                data = [self._dataset_json(d) for d in self._datasets.values() if not d['deleted']]
+                return 200, {'object': 'list', 'data': self._page(data,query)}
+            if parts == ['datasets','upload'] and method == 'POST':
+                labels, examples = self._read_csv(fields.get('data'))
+                datasetId = self._new_id()
+                self._datasets[datasetId] = {'id': datasetId, 'name': 'standin_%s'%datasetId,
+                                             'created': time.time(), 'labels': labels or list(DEFAULT_LABELS),
+                                             'examples': examples, 'deleted': False}
+                return 200, self._dataset_json(self._datasets[datasetId])
+            if parts[:1] in (['datasets'], ['deletion']) and len(parts) >= 2:
+                dataset = self._datasets.get(int(parts[1])) if parts[1].isdigit() else None
+                if dataset is None:
+                    return 404, {'message': 'Dataset %s not found'%parts[1]}
+                if parts[0] == 'deletion':
+                    return 200, {'id': str(dataset['id']), 'status': 'SUCCEEDED' if dataset['deleted'] else 'QUEUED',
+                                 'object': 'deletion'}
+                if len(parts) == 2 and method == 'GET':
+                    return 200, self._dataset_json(dataset)
+                if len(parts) == 2 and method == 'DELETE':
+                    dataset['deleted'] = True
+                    return 200, {'id': str(dataset['id']), 'status': 'QUEUED', 'object': 'deletion'}
+                if parts[2:] == ['upload'] and method == 'PUT':
+                    labels, examples = self._read_csv(fields.get('data'))
+                    dataset['labels'] = sorted(set(dataset['labels']) | set(labels))
+                    dataset['examples'] += examples
+                    dataset['created'] = time.time()
+                    return 200, self._dataset_json(dataset)
+                if parts[2:] == ['models'] and method == 'GET':
+                    data = [self._model_json(m) for m in self._models.values() if m['datasetId'] == dataset['id']]
+                    return 200, {'object': 'list', 'data': self._page(data,query)}
+            if parts == ['train'] and method == 'POST':
+                datasetId = int(fields.get('datasetId') or 0)
+                if datasetId not in self._datasets:
+                    return 400, {'message': 'Dataset %s not found'%datasetId}
+                return 200, self._model_json(self._models[self._new_model(datasetId,fields.get('name'))])
+            if parts == ['retrain'] and method == 'POST':
+                model = self._models.get(fields.get('modelId'))
+                if model is None:
+                    return 400, {'message': 'Model %s not found'%fields.get('modelId')}
+                model['started'] = time.time()
+                return 200, self._model_json(model)
+            if parts[:1] in (['train'], ['models']) and len(parts) >= 2 and method == 'GET':
+                model = self._models.get(parts[1])
+                if model is None:
+                    return 404, {'message': 'Model %s not found'%parts[1]}
+                if parts[0] == 'train':
+                    return 200, self._model_json(model)
+                if len(parts) == 2:
+                    return 200, self._metrics(model)
+                if parts[2:] == ['lc']:
+                    return 200, self._learning_curve(model)
+            if parts == ['intent'] and method == 'POST':
+                if fields.get('modelId') not in self._models:
+                    return 400, {'message': 'Model %s not found'%fields.get('modelId')}
+                return 200, self._prediction(fields.get('modelId'),fields.get('document',''))
+            if parts == ['feedback'] and method == 'POST':
+                model = self._models.get(fields.get('modelId'))
+                if model is None:
+                    return 400, {'message': 'Model %s not found'%fields.get('modelId')}
+                self._feedback += 1
+                return 200, {'id': self._new_id(), 'name': 'standin', 'object': 'example',
+                             'label': {'datasetId': model['datasetId'], 'name': fields.get('expectedLabel')}}
+        return 404, {'message': 'Not found: %s %s'%(method,'/'.join(parts))}
+
+    def _page(self,data,query):
+        offset = int(query.get('offset',0))
+        # Like the API, a larger count is answered with a full page
+        count = min(int(query.get('count',einstein_constants.MAX_PAGE_SIZE)),
+                    einstein_constants.MAX_PAGE_SIZE)
+        return data[offset:offset+count]
+
+    def _read_csv(self,text):
+        if not text:
+            return [], 0
+        rows = [row.rsplit(',',1) for row in text.splitlines() if ',' in row]
+        return sorted(set(row[1].strip().strip('"') for row in rows)), len(rows)
+
+    def _scores(self,modelId,document):
+        labels = self._labels_of_model(modelId)
+        digest = hashlib.blake2b(('%s\x00%s'%(modelId,document)).encode('utf-8'),digest_size=16).digest()
+        weights = [digest[i % len(digest)]+1 for i in range(len(labels))]
+        total = float(sum(weights))
+        return sorted(((label,weight/total) for label, weight in zip(labels,weights)),key=lambda s: -s[1])
+
+    def _prediction(self,modelId,document):
+        return {'probabilities': [{'label': label, 'probability': round(p,6)}
+                                  for label, p in self._scores(modelId,document)],
+                'object': 'predictresponse'}
+
+    def _metrics_data(self,model,rng,epoch_scale=1.0):
+        labels = self._labels_of_model(model['modelId'])
+        n = len(labels)
+        confusion = [[rng.randint(0,5) if i != j else int(rng.randint(20,60)*epoch_scale)
+                      for j in range(n)] for i in range(n)]
+        f1 = [round(2*row[i]/(sum(row)+sum(c[i] for c in confusion)),4) for i, row in enumerate(confusion)]
+        correct = sum(confusion[i][i] for i in range(n))
+        return {'labels': labels, 'f1': f1, 'confusionMatrix': confusion,
+                'testAccuracy': round(correct/float(sum(map(sum,confusion))),4),
+                'trainingAccuracy': round(min(1.0,0.5+0.5*epoch_scale),4),
+                'trainingLoss': round(1.0/(1+5*epoch_scale),4)}
+
+    def _metrics(self,model):
+        rng = random.Random(model['modelId'])
+        data = self._metrics_data(model,rng)
+        data['precisionRecallCurve'] = {'precision': [round(1-0.3*i/20.0,3) for i in range(21)],
+                                        'recall': [round(i/20.0,3) for i in range(21)],
+                                        'threshold': [round(1-i/20.0,3) for i in range(21)]}
+        return {'id': model['modelId'], 'metricsData': data, 'object': 'metrics'}
+
+    def _learning_curve(self,model):
+        rng = random.Random(model['modelId'])
+        data = [{'epoch': epoch, 'metricsData': self._metrics_data(model,rng,epoch/10.0),
+                 'epochResults': [], 'object': 'learningcurve'} for epoch in range(1,11)]
+        return {'object': 'list', 'data': data}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately: without TCP_NODELAY each response waits
+    # for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        standin = self.server.standin
+        path, _, query_string = self.path.partition('?')
+        query = dict(item.split('=',1) for item in query_string.split('&') if '=' in item)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if path.startswith(CONTROL_PATH):
+            return self._control(standin,path[len(CONTROL_PATH):],body)
+        endpoint = endpoint_class(self.command,path)
+        delay = standin.delay(endpoint)
+        if delay:
+            time.sleep(delay)
+        fault = standin.fault(endpoint)
+        extra_headers = {}
+        if fault == 'rate_limit':
+            status_code, response = 429, {'message': 'Too many requests'}
+            if standin.retry_after is not None:
+                extra_headers['Retry-After'] = '%g'%standin.retry_after
+        elif fault == 'server_error':
+            status_code, response = standin.error_status, {'message': 'Injected server error'}
+        else:
+            try:
+                status_code, response = standin.handle(self.command,path,query,self.headers,body)
+            except Exception as e:
+                status_code, response = 500, {'message': 'Stand-in error: %s'%e}
+        standin.count(endpoint,status_code,fault)
+        out = b'' if response is None else json.dumps(response).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(out)))
+        for name, value in extra_headers.items():
+            self.send_header(name,value)
+        self.end_headers()
+        if fault == 'slow_body' and out:
+            chunks = 10
+            size = -(-len(out)//chunks)
+            for i in range(0,len(out),size):
+                self.wfile.write(out[i:i+size])
+                self.wfile.flush()
+                time.sleep(standin.slow_body_seconds/chunks)
+        else:
+            self.wfile.write(out)
+
+    def _control(self,standin,name,body):
+        if name not in CONTROL_METHODS:
+            status_code, response = 404, {'message': 'Unknown control method %s'%name}
+        else:
+            call = json.loads(body.decode('utf-8')) if body else {}
+            status_code, response = 200, getattr(standin,name)(*call.get('args',()),**call.get('kwargs',{}))
+        out = json.dumps(response).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+    def log_message(self,format,*args):
+        pass
+
+
+def _serve_in_process(options,connection):
+    server = StandinServer(**options)
+    connection.send(server.base_url)
+    connection.close()
+    server.httpd.serve_forever()
+
+
+class StandinProcess:
+
+    def __init__(self,**options):
+        """StandinServer running in a child process.
+
+        Note:
+            The stand-in spends as much CPU on each call as the client. In its own process
+            it does not compete with the client under test for the GIL, so benchmarks
+            measure the client. The methods in CONTROL_METHODS are forwarded to the
+            server over HTTP.
+
+        Args:
+            **options: Arguments of StandinServer.
+        """
+        self.options = options
+        self.process = None
+        self.base_url = None
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.base_url)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,*exc_info):
+        self.stop()
+
+    def __getattr__(self,name):
+        if name not in CONTROL_METHODS:
+            raise AttributeError("%r object has no attribute %r"%(self.__class__.__name__,name))
+        return lambda *args, **kwargs: self._control(name,args,kwargs)
+
+    def _control(self,name,args,kwargs):
+        root = self.base_url.rsplit('/v2',1)[0]
+        request = urllib.request.Request(root+CONTROL_PATH+name,method='POST',
+                                         data=json.dumps({'args': args, 'kwargs': kwargs}).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def start(self):
+        if self.process is None:
+            context = multiprocessing.get_context('spawn')
+            receiver, sender = context.Pipe(duplex=False)
+            self.process = context.Process(target=_serve_in_process,args=(self.options,sender),daemon=True)
+            self.process.start()
+            self.base_url = receiver.recv()
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Local stand-in for the Einstein Intent API.')
+    parser.add_argument('--port',type=int,default=8765)
+    parser.add_argument('--latency',help='e.g. 0.02 or lognormal:0.05:0.5 (see latency_sampler)')
+    parser.add_argument('--rate-limit',type=float,default=0.0,help='probability of a 429')
+    parser.add_argument('--server-error',type=float,default=0.0,help='probability of a 503')
+    parser.add_argument('--slow-body',type=float,default=0.0,help='probability of a slow response')
+    parser.add_argument('--seed',type=int)
+    args = parser.parse_args(argv)
+    server = StandinServer(port=args.port,latency=args.latency,seed=args.seed,
+                           faults={'rate_limit': args.rate_limit, 'server_error': args.server_error,
+                                   'slow_body': args.slow_body})
+    datasetId = server.add_dataset()
+    print('Serving %s'%server.base_url)
+    print('token %s, dataset %s, model %s'%(server.issue_token(),datasetId,server.add_model(datasetId)))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
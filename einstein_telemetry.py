@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-endpoint call metrics of a session: latency histograms, status codes,
+bytes, retries and calls in flight, exported as Prometheus text or JSON.
+
+@author: andrewcarroll
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_PREFIX = 'einstein'
+
+
+class EndpointStats:
+
+    def __init__(self,buckets):
+        """Counters of one endpoint class. Updated only under the Telemetry lock."""
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.status_codes = {}
+        self.latency_sum = 0.0
+        # One count per bucket plus the +Inf bucket; not cumulative
+        self.latency_counts = [0]*(len(buckets)+1)
+
+    def snapshot(self,buckets):
+        cumulative, total = [], 0
+        for count in self.latency_counts:
+            total += count
+            cumulative.append(total)
+        stats = {'calls': self.calls, 'errors': self.errors, 'retries': self.retries,
+                 'in_flight': self.in_flight, 'bytes_sent': self.bytes_sent,
+                 'bytes_received': self.bytes_received,
+                 'status_codes': dict((str(code),count) for code, count in sorted(self.status_codes.items())),
+                 'latency_sum': self.latency_sum,
+                 'latency_buckets': dict(zip([str(b) for b in buckets]+['+Inf'],cumulative)),
+                 'latency_mean': self.latency_sum/total if total else None}
+        for q in (50, 95, 99):
+            stats['latency_p%d'%q] = _quantile(buckets,cumulative,q/100.0)
+        return stats
+
+
+def _quantile(buckets,cumulative,q):
+    """Estimate a latency quantile from cumulative bucket counts, as Prometheus does."""
+    total = cumulative[-1]
+    if not total:
+        return None
+    rank = q*total
+    i = bisect_left(cumulative,rank)
+    if i >= len(buckets):
+        return float(buckets[-1])
+    lower = buckets[i-1] if i else 0.0
+    below = cumulative[i-1] if i else 0
+    in_bucket = cumulative[i]-below
+    return lower+(buckets[i]-lower)*((rank-below)/in_bucket if in_bucket else 1.0)
+
+
+class Telemetry:
+
+    def __init__(self,buckets=LATENCY_BUCKETS,prefix=METRIC_PREFIX):
+        """Collects the metrics of every call sent by a session, by endpoint class.
+
+        Note:
+            EinsteinPlatformSession times each attempt of each call with call(), so
+            retries by the rate governor and token-refresh replays are counted as
+            separate calls and also in the retries counter. Recording a call takes a
+            few microseconds under a single lock.
+
+        Args:
+            buckets (tuple, default = LATENCY_BUCKETS): Upper bounds of the latency
+                histogram buckets, in seconds.
+            prefix (str, default = 'einstein'): Prefix of the exported metric names.
+        """
+        self.buckets = tuple(float(b) for b in buckets)
+        self.prefix = prefix
+        self.started_at = time.time()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,sorted(self._endpoints))
+
+    def _stats(self,endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats(self.buckets)
+        return stats
+
+    def call(self,endpoint,send,retry=False):
+        """Send a call with send() and record its latency, status code and bytes.
+
+        Args:
+            endpoint (str): Endpoint class of the call, see rate_governor.endpoint_class.
+            send (callable): Sends the call and returns a requests.Response.
+            retry (bool, default = False): The call repeats an earlier attempt.
+
+        Returns:
+            The response of send(). Exceptions are counted as errors and re-raised.
+        """
+        stats = self._begin(endpoint,retry)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = send()
+            return response
+        finally:
+            self._end(stats,started,response)
+
+    async def call_async(self,endpoint,send,retry=False):
+        """Coroutine counterpart of call, where send() returns an awaitable."""
+        stats = self._begin(endpoint,retry)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await send()
+            return response
+        finally:
+            self._end(stats,started,response)
+
+    def _begin(self,endpoint,retry):
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.in_flight += 1
+            if retry:
+                stats.retries += 1
+        return stats
+
+    def _end(self,stats,started,response):
+        elapsed = time.perf_counter()-started
+        sent = received = 0
+        if response is not None:
+            sent = int(response.request.headers.get('Content-Length') or 0) \
+                if response.request is not None else 0
+            length = response.headers.get('Content-Length')
+            received = int(length) if length is not None else len(response.content or b'')
+        bucket = bisect_left(self.buckets,elapsed)
+        with self._lock:
+            stats.in_flight -= 1
+            stats.calls += 1
+            stats.latency_sum += elapsed
+            stats.latency_counts[bucket] += 1
+            if response is None:
+                stats.errors += 1
+            else:
+                code = response.status_code
+                stats.status_codes[code] = stats.status_codes.get(code,0)+1
+                stats.bytes_sent += sent
+                stats.bytes_received += received
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = dict((name,EndpointStats(self.buckets)) for name in self._endpoints)
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """Metrics of every endpoint class seen so far, as a JSON-serializable dict."""
+        with self._lock:
+            endpoints = dict((name,stats.snapshot(self.buckets))
+                             for name, stats in sorted(self._endpoints.items()))
+        return {'started_at': self.started_at, 'at': time.time(), 'endpoints': endpoints}
+
+    def to_json(self,indent=None):
+        return json.dumps(self.snapshot(),indent=indent)
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()['endpoints']
+        p = self.prefix
+        lines = []
+
+        def family(name,kind,description,samples):
+            lines.append('# HELP %s_%s %s'%(p,name,description))
+            lines.append('# TYPE %s_%s %s'%(p,name,kind))
+            for suffix, labels, value in samples:
+                label_text = ','.join('%s="%s"'%(key,_escape(text)) for key, text in labels)
+                lines.append('%s_%s%s{%s} %s'%(p,name,suffix,label_text,_number(value)))
+
+        family('requests_total','counter','Calls sent to the API, by endpoint class and status code.',
+               [('',(('endpoint',name),('code',code)),count)
+                for name, stats in snapshot.items() for code, count in stats['status_codes'].items()])
+        family('request_errors_total','counter','Calls that failed without a response.',
+               [('',(('endpoint',name),),stats['errors']) for name, stats in snapshot.items()])
+        family('request_retries_total','counter','Calls repeating an earlier attempt.',
+               [('',(('endpoint',name),),stats['retries']) for name, stats in snapshot.items()])
+        family('requests_in_flight','gauge','Calls waiting for a response.',
+               [('',(('endpoint',name),),stats['in_flight']) for name, stats in snapshot.items()])
+        family('request_sent_bytes_total','counter','Request body bytes sent.',
+               [('',(('endpoint',name),),stats['bytes_sent']) for name, stats in snapshot.items()])
+        family('response_received_bytes_total','counter','Response body bytes received.',
+               [('',(('endpoint',name),),stats['bytes_received']) for name, stats in snapshot.items()])
+        samples = []
+        for name, stats in snapshot.items():
+            for le, count in stats['latency_buckets'].items():
+                samples.append(('_bucket',(('endpoint',name),('le',le)),count))
+            samples.append(('_sum',(('endpoint',name),),stats['latency_sum']))
+            samples.append(('_count',(('endpoint',name),),stats['calls']))
+        family('request_duration_seconds','histogram','Latency of the calls, in seconds.',samples)
+        return '\n'.join(lines)+'\n'
+
+    def write(self,path):
+        """Write the metrics to path, as Prometheus text unless it ends with .json.
+
+        Note:
+            The file is replaced atomically, so a textfile collector never reads a
+            partial file.
+        """
+        text = self.to_json(indent=1) if path.endswith('.json') else self.prometheus()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory,prefix='.'+os.path.basename(path))
+        try:
+            with os.fdopen(fd,'w',encoding='utf-8') as f:
+                f.write(text)
+            os.chmod(temporary,0o644)
+            os.replace(temporary,path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return path
+
+
+def _escape(value):
+    return str(value).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+
+
+def _number(value):
+    if isinstance(value,float):
+        return repr(value)
+    return str(value)
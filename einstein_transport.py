@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pooled HTTP transport shared by an EinsteinPlatformSession and every Dataset
+and Model created from it.
+
+@author: andrewcarroll
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+
+
+class EinsteinTransport:
+
+    def __init__(self,pool_connections=DEFAULT_POOL_CONNECTIONS,pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 pool_block=False,timeout=(DEFAULT_CONNECT_TIMEOUT,DEFAULT_READ_TIMEOUT)):
+        """Keep-alive connection pool for calls to the Einstein Platform Services API.
+
+        Note:
+            A single requests.Session is shared by every thread using the transport,
+            so TCP+TLS connections to api.einstein.ai are reused between calls instead
+            of being opened for each one.
+
+        Args:
+            pool_connections (int, default = 4): Number of per-host connection pools to cache.
+            pool_maxsize (int, default = 16): Maximum number of kept-alive connections per host.
+            pool_block (bool, default = False): If True, callers wait for a free connection
+                once pool_maxsize connections are in use instead of opening a throwaway one.
+            timeout (float or tuple, default = (5, 60)): Default (connect, read) timeout
+                in seconds, used whenever a call does not provide its own.
+
+        Attributes:
+            http (requests.Session): Underlying pooled session.
+            timeout (float or tuple): Default timeout for calls.
+        """
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.http = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_connections,
+                                   pool_maxsize=pool_maxsize,
+                                   pool_block=pool_block)
+        self.http.mount('https://', self.adapter)
+        self.http.mount('http://', self.adapter)
+        self._lock = threading.Lock()
+        self._requests_sent = 0
+
+    def __repr__(self):
+        return '<%s pool_maxsize=%s>'%(self.__class__.__name__,self.pool_maxsize)
+
+    def request(self,method,url,fields=None,headers=None,data=None,timeout=None,
+                monitor_callback=None,**kwargs):
+        """Send a request through the connection pool.
+
+        Args:
+            method (str): HTTP method, e.g. 'GET' or 'POST'.
+            url (str): Absolute url of the endpoint.
+            fields (dict or callable, optional): Form fields, sent as multipart/form-data
+                and streamed from any file objects among the values. A callable returning
+                the fields is called for every attempt, so a retried call reopens its files.
+            headers (dict, optional): Request headers.
+            data (optional): Raw request body, used when fields is not provided.
+            timeout (float or tuple, optional): Overrides the default timeout.
+            monitor_callback (callable, optional): Called with a MultipartEncoderMonitor
+                as the multipart body is read.
+
+        Returns:
+            requests.Response
+        """
+        headers = dict(headers or {})
+        if callable(fields):
+            fields = fields()
+        if fields is not None:
+            data = MultipartEncoder(fields=fields)
+            if monitor_callback is not None:
+                data = MultipartEncoderMonitor(data,monitor_callback)
+            headers['Content-Type'] = data.content_type
+        with self._lock:
+            self._requests_sent += 1
+        return self.http.request(method,url,
+                                 headers=headers,
+                                 data=data,
+                                 timeout=timeout or self.timeout,
+                                 **kwargs)
+
+    def get(self,url,**kwargs):
+        return self.request('GET',url,**kwargs)
+
+    def post(self,url,**kwargs):
+        return self.request('POST',url,**kwargs)
+
+    def delete(self,url,**kwargs):
+        return self.request('DELETE',url,**kwargs)
+
+    def connection_stats(self):
+        """Report how often pooled connections were reused.
+
+        Returns:
+            dict with the number of requests sent, connections opened and the
+            fraction of requests served on an already-open connection.
+        """
+        opened = 0
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        with self._lock:
+            sent = self._requests_sent
+        reused = max(sent-opened,0)
+        return {'requests': sent,
+                'connections_opened': opened,
+                'connections_reused': reused,
+                'reuse_ratio': reused/sent if sent else 0.0}
+
+    def close(self):
+        self.http.close()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent, hash-keyed index of the (document, label) examples known to be in
+each dataset, used to skip examples that were already uploaded or submitted.
+
+@author: andrewcarroll
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from dataset_validator import read_chunks
+
+COMPACT_THRESHOLD = 1000000
+
+
+def example_key(document,label):
+    """Stable 64-bit key of a (document, label) pair, ignoring surrounding whitespace."""
+    digest = hashlib.blake2b(('%s\x1f%s'%(document.strip(),label.strip())).encode('utf-8',
+                                                                                 'surrogateescape'),
+                             digest_size=8).digest()
+    return int.from_bytes(digest,'little')
+
+
+class _KeyTable:
+
+    def __init__(self,keys):
+        """Open-addressing hash table of uint64 keys held in a NumPy array.
+
+        Keys are already uniformly distributed hashes, so the low bits of a key give
+        its home slot, and collisions go to the next free slot (linear probing). The
+        table is at most half full, so a lookup reads about two slots. Probing does
+        not wrap around: the array extends past the last home slot as far as needed,
+        and always ends with an empty slot. 0 marks an empty slot; the key 0 itself
+        is kept in a flag.
+        """
+        keys = np.asarray(keys,'<u8')
+        self.has_zero = bool((keys == 0).any())
+        keys = np.sort(keys[keys != 0])
+        keys = keys[np.concatenate(([True],keys[1:] != keys[:-1]))] if len(keys) else keys
+        self.size = len(keys)+self.has_zero
+        capacity = 16
+        while capacity < 2*len(keys):
+            capacity *= 2
+        self.mask = capacity-1
+        homes = (keys & np.uint64(self.mask)).astype(np.int64)
+        order = np.argsort(homes)
+        keys, homes = keys[order], homes[order]
+        # Placing keys in order of home slot, key i lands on max(home i, slot of key
+        # i-1 + 1), which is i + the running maximum of (home - rank)
+        rank = np.arange(len(keys))
+        positions = rank+np.maximum.accumulate(homes-rank) if len(keys) else rank
+        end = max(capacity,int(positions[-1])+1) if len(keys) else capacity
+        self.slots = np.zeros(end+1,'<u8')
+        self.slots[positions] = keys
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self,key):
+        if key == 0:
+            return self.has_zero
+        i = key & self.mask
+        while True:
+            # int() keeps the comparison exact, where NumPy may compare as float64
+            slot = int(self.slots[i])
+            if slot == key:
+                return True
+            if slot == 0:
+                return False
+            i += 1
+
+    def contains_many(self,keys):
+        """Boolean mask of the keys in the table, probing all of them at once."""
+        found = np.zeros(len(keys),bool)
+        active = np.flatnonzero(keys != 0)
+        positions = (keys[active] & np.uint64(self.mask)).astype(np.int64)
+        while len(active):
+            slots = self.slots[positions]
+            hit = slots == keys[active]
+            found[active[hit]] = True
+            searching = ~hit & (slots != 0)
+            active = active[searching]
+            positions = positions[searching]+1
+        if self.has_zero:
+            found[keys == 0] = True
+        return found
+
+    def keys(self):
+        keys = self.slots[self.slots != 0]
+        return np.append(keys,np.uint64(0)) if self.has_zero else keys
+
+
+class _DatasetKeys:
+
+    def __init__(self,path):
+        # Sorted keys in <datasetId>.idx (kept in memory as a _KeyTable), keys added
+        # since the last compaction in <datasetId>.log (kept in memory as a set), both
+        # as raw little-endian uint64
+        self.base_path = path+'.idx'
+        self.log_path = path+'.log'
+        self.base = _KeyTable(np.fromfile(self.base_path,'<u8') if os.path.exists(self.base_path)
+                              else np.zeros(0,'<u8'))
+        logged = np.fromfile(self.log_path,'<u8') if os.path.exists(self.log_path) else np.zeros(0,'<u8')
+        self.recent = set(logged.tolist())
+        self.unlogged = []
+
+    def __len__(self):
+        return len(self.base)+len(self.recent)
+
+    def contains(self,key):
+        return key in self.recent or key in self.base
+
+    def contains_many(self,keys):
+        known = self.base.contains_many(keys)
+        if self.recent:
+            known |= np.fromiter(map(self.recent.__contains__,keys.tolist()),bool,len(keys))
+        return known
+
+    def add(self,keys):
+        for key in keys:
+            if not self.contains(key):
+                self.recent.add(key)
+                self.unlogged.append(key)
+
+    def flush(self):
+        if self.unlogged:
+            with open(self.log_path,'ab') as f:
+                f.write(np.array(self.unlogged,'<u8').tobytes())
+            self.unlogged = []
+
+    def compact(self):
+        self.flush()
+        if not self.recent:
+            return
+        merged = np.union1d(self.base.keys(),np.fromiter(self.recent,'<u8',len(self.recent)))
+        tmp_path = self.base_path+'.tmp'
+        merged.tofile(tmp_path)
+        os.replace(tmp_path,self.base_path)
+        os.remove(self.log_path)
+        self.base = _KeyTable(merged)
+        self.recent = set()
+
+
+class ExampleIndex:
+
+    def __init__(self,directory,compact_threshold=COMPACT_THRESHOLD):
+        """Index of the examples known to be in each dataset, stored under directory.
+
+        Note:
+            Each example is an 8-byte key, so tens of millions of examples take a few
+            hundred MB on disk and two to four times as much in memory. The keys of a
+            dataset are a hash table in a NumPy array, giving O(1) lookups one at a time
+            or in bulk, plus a set of keys added since the last compaction, appended to
+            a log file as they are flushed. On disk the compacted keys are a sorted array.
+
+        Args:
+            directory (str): Folder holding one <datasetId>.idx/.log pair per dataset.
+            compact_threshold (int, default = 1000000): Keys added since the last
+                compaction after which they are merged into the sorted array on flush.
+        """
+        self.directory = directory
+        self.compact_threshold = compact_threshold
+        self._datasets = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory,exist_ok=True)
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,self.directory)
+
+    def _keys(self,datasetId):
+        datasetId = str(datasetId)
+        if datasetId not in self._datasets:
+            self._datasets[datasetId] = _DatasetKeys(os.path.join(self.directory,datasetId))
+        return self._datasets[datasetId]
+
+    def size(self,datasetId):
+        with self._lock:
+            return len(self._keys(datasetId))
+
+    def contains(self,datasetId,document,label):
+        with self._lock:
+            return self._keys(datasetId).contains(example_key(document,label))
+
+    def add(self,datasetId,document,label):
+        self.add_many(datasetId,[(document,label)])
+
+    def add_many(self,datasetId,examples):
+        """Record (document, label) pairs as present in the dataset."""
+        keys = [example_key(document,label) for document, label in examples]
+        with self._lock:
+            self._keys(datasetId).add(keys)
+
+    def known_mask(self,datasetId,examples):
+        """Boolean NumPy mask of the (document, label) pairs already in the dataset."""
+        keys = np.fromiter((example_key(document,label) for document, label in examples),'<u8')
+        with self._lock:
+            return self._keys(datasetId).contains_many(keys)
+
+    def filter_new(self,datasetId,examples):
+        """Return the (document, label) pairs not yet in the dataset, in input order."""
+        examples = list(examples)
+        known = self.known_mask(datasetId,examples)
+        return [example for example, seen in zip(examples,known) if not seen]
+
+    def add_csv(self,datasetId,filepath,chunk_size=100000,delimiter=',',encoding='utf-8'):
+        """Seed the dataset's keys from a CSV file of examples, e.g. one just uploaded."""
+        with open(filepath,'r',newline='',encoding=encoding,errors='surrogateescape') as f:
+            for docs, labels, blank in read_chunks(f,chunk_size,delimiter):
+                self.add_many(datasetId,[(d, l) for d, l, b in zip(docs,labels,blank) if not b])
+                self.flush(datasetId)
+
+    def flush(self,datasetId=None):
+        """Append unflushed keys to the log files, compacting logs past the threshold."""
+        with self._lock:
+            datasets = [self._keys(datasetId)] if datasetId is not None else list(self._datasets.values())
+            for keys in datasets:
+                if len(keys.recent) >= self.compact_threshold:
+                    keys.compact()
+                else:
+                    keys.flush()
+
+    def compact(self,datasetId):
+        with self._lock:
+            self._keys(datasetId).compact()
+
+    def forget(self,datasetId):
+        """Drop every key of a dataset, e.g. once it has been deleted."""
+        with self._lock:
+            keys = self._keys(datasetId)
+            for path in (keys.base_path, keys.log_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            del self._datasets[str(datasetId)]
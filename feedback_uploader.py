@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming, concurrent upload of feedback examples from a CSV file.
+
+@author: andrewcarroll
+"""
+
+import csv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from einstein_backoff import Backoff
+from job_journal import row_key
+
+# Failures after which the example may or may not have been stored. 429 and 503 are
+# not among them: the session's RateGovernor already waits and retries those.
+UNCONFIRMED_STATUS_CODES = (500, 502, 504)
+
+
+def read_examples(f,delimiter=','):
+    """Yield (line_number, document, label) from an open CSV file of examples.
+
+    The label is the last column. Documents may contain the delimiter when they
+    are quoted; unquoted extra columns are joined back into the document.
+    """
+    reader = csv.reader(f,delimiter=delimiter)
+    for row in reader:
+        if not row or not any(field.strip() for field in row):
+            continue
+        yield reader.line_num, delimiter.join(row[:-1]).strip(), row[-1].strip()
+
+
+def print_progress(progress):
+    """Progress callback printing a one-line summary of FeedbackUploader.progress()."""
+    print('%s records read, %s uploaded, %s failed, %s with unknown labels (%0.2f rows/s)'
+          %(progress['read'],progress['succeeded'],progress['failed'],
+            progress['invalid_label'],progress['rows_per_second']))
+
+
+class FeedbackUploader:
+
+    def __init__(self,model,max_workers=4,max_retries=5,initial_delay=1,max_delay=30,
+                 progress_callback=None,progress_every=50,result_callback=None,journal=None,
+                 retry_unconfirmed=False):
+        """Submits feedback examples for a model from a CSV file.
+
+        Note:
+            Rows are streamed from the file and at most twice max_workers rows are held
+            in memory at once. Rows whose label is not one of the dataset's labels are
+            skipped without a call, as are rows already in the dataset's example_index
+            when it has one (counted as 'known_example').
+
+            Throttling (429 and 503) is left to the session's RateGovernor. Feedback is
+            not idempotent: after a connection error, a timeout or a 500/502/504 status
+            the example may already be stored, and sending it again would add it twice.
+            Such rows are reported as failed unless retry_unconfirmed is set.
+
+        Args:
+            model (Model): Trained model receiving the feedback.
+            max_workers (int, default = 4): Number of concurrent submit_feedback calls.
+            max_retries (int, default = 5): Attempts after the first one for a row that
+                fails with a connection error or a 500/502/504 status, when
+                retry_unconfirmed is set.
+            initial_delay (float, default = 1): First retry delay, in seconds. Delays grow
+                exponentially with jitter.
+            max_delay (float, default = 30): Longest retry delay, in seconds.
+            progress_callback (callable, optional): Called with the progress dict (see
+                progress()) every progress_every finished rows and when the upload ends.
+            progress_every (int, default = 50): Rows between two progress callbacks.
+            result_callback (callable, optional): Called for every finished row with
+                (line_number, document, label, response, status_code, error).
+            journal (JobJournal, optional): Journal recording the outcome of every row.
+                Examples it already holds as successfully submitted are skipped, so an
+                interrupted upload resumes without resubmitting them.
+            retry_unconfirmed (bool, default = False): Resubmit rows whose outcome is
+                unknown, accepting possible duplicates. A row is not resubmitted once
+                the dataset's example_index holds it: it then counts as succeeded, with a
+                None response, and is journaled as done.
+        """
+        self.model = model
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.progress_callback = progress_callback
+        self.progress_every = progress_every
+        self.result_callback = result_callback
+        self.journal = journal
+        self.retry_unconfirmed = retry_unconfirmed
+        self._lock = threading.Lock()
+        self._reset_counts()
+
+    def __repr__(self):
+        return '<%s for model %s>'%(self.__class__.__name__,self.model.modelId)
+
+    def _reset_counts(self):
+        self.counts = {'read': 0, 'submitted': 0, 'succeeded': 0, 'failed': 0,
+                       'invalid_label': 0, 'already_done': 0, 'known_example': 0,
+                       'retries': 0}
+        self.started_at = time.time()
+
+    def progress(self):
+        """Counts of rows so far, with elapsed seconds and rows finished per second."""
+        with self._lock:
+            progress = dict(self.counts)
+        progress['elapsed'] = time.time()-self.started_at
+        finished = progress['succeeded']+progress['failed']
+        progress['rows_per_second'] = finished/progress['elapsed'] if progress['elapsed'] else 0.0
+        return progress
+
+    def _count(self,key,n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def _report(self):
+        if self.progress_callback:
+            self.progress_callback(self.progress())
+
+    def labels(self):
+        dataset = self.model.dataset
+        if not dataset.labels and dataset.datasetId:
+            _,_ = dataset.update_dataset_status()
+        return set(dataset.labels)
+
+    def submit(self,line_number,document,label):
+        """Submit one example, retrying failures of unknown outcome if retry_unconfirmed is set."""
+        backoff = Backoff(initial=self.initial_delay,maximum=self.max_delay)
+        index = getattr(self.model.dataset,'example_index',None)
+        response, status_code, error = None, None, None
+        for attempt in range(self.max_retries+1 if self.retry_unconfirmed else 1):
+            if attempt:
+                if index is not None and index.contains(self.model.dataset.datasetId,document,label):
+                    # Stored after all: a success without a response of its own
+                    return line_number, document, label, None, 200, None
+                self._count('retries')
+                time.sleep(backoff.next_delay())
+            try:
+                response, status_code = self.model.submit_feedback(document,label)
+                error = None
+            except (OSError, ValueError) as e:
+                # Connection errors and timeouts, or a body that was not JSON such as
+                # an error page from a proxy
+                response, status_code, error = None, None, e
+                continue
+            if status_code not in UNCONFIRMED_STATUS_CODES:
+                break
+        return line_number, document, label, response, status_code, error
+
+    def _finish(self,result):
+        line_number, document, label, response, status_code, error = result
+        with self._lock:
+            self.counts['succeeded' if error is None and status_code == 200 else 'failed'] += 1
+            finished = self.counts['succeeded']+self.counts['failed']
+        if self.journal is not None:
+            self.journal.record(row_key(document,label),
+                                status_code if error is None else None,
+                                {'line': line_number,
+                                 'id': response.get('id') if isinstance(response,dict) else None})
+        if self.result_callback:
+            self.result_callback(*result)
+        if self.progress_every and finished % self.progress_every == 0:
+            self._report()
+
+    def upload_rows(self,rows,limit=None,cancel_event=None):
+        """Submit examples from an iterable of (line_number, document, label).
+
+        Args:
+            rows (iterable): Examples to submit.
+            limit (int, optional): Stop after reading this many rows.
+            cancel_event (threading.Event, optional): Stop reading new rows once set.
+                Rows already submitted are allowed to finish.
+
+        Returns:
+            The final progress dict.
+        """
+        assert self.model.modelId, "No model found."
+        assert self.model.model_isReady, "It appears the model is not yet ready."
+        self._reset_counts()
+        labels = self.labels()
+        index = getattr(self.model.dataset,'example_index',None)
+        datasetId = self.model.dataset.datasetId
+        max_pending = 2*self.max_workers
+        pending = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for line_number, document, label in rows:
+                if (limit is not None and self.counts['read'] >= limit) or \
+                        (cancel_event is not None and cancel_event.is_set()):
+                    break
+                self._count('read')
+                if label not in labels:
+                    self._count('invalid_label')
+                    continue
+                if self.journal is not None and self.journal.is_done(row_key(document,label)):
+                    self._count('already_done')
+                    continue
+                if index is not None and index.contains(datasetId,document,label):
+                    self._count('known_example')
+                    continue
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending,return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(future.result())
+                pending.add(executor.submit(self.submit,line_number,document,label))
+                self._count('submitted')
+            for future in pending:
+                self._finish(future.result())
+            pending = set()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if self.journal is not None:
+                self.journal.flush()
+            if index is not None:
+                index.flush(datasetId)
+        self._report()
+        return self.progress()
+
+    def upload(self,filepath,limit=None,cancel_event=None,delimiter=',',encoding='utf-8'):
+        """Stream a CSV file of (document, label) rows and submit them as feedback.
+
+        Returns:
+            The final progress dict.
+        """
+        with open(filepath,'r',newline='',encoding=encoding) as f:
+            return self.upload_rows(read_examples(f,delimiter),limit=limit,cancel_event=cancel_event)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-time budget of the headless entry path, measured with `python -X importtime`.
+
+    python import_budget.py                      # check the default modules
+    python import_budget.py dataset --budget 150
+
+@author: andrewcarroll
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Modules a headless worker imports, and the budget of each, in milliseconds
+HEADLESS_MODULES = {'einstein_session': 250, 'dataset': 300, 'main': 300}
+# Modules that must never be loaded by the headless entry path
+FORBIDDEN_MODULES = ('tkinter', 'matplotlib', 'numpy', 'seaborn', 'jwt', 'cryptography')
+
+
+def measure_import(module,python=sys.executable):
+    """Import module in a fresh interpreter and return its import-time profile.
+
+    Returns:
+        (float, dict): Cumulative import time of module in milliseconds, and the
+            cumulative milliseconds of every module loaded along with it.
+
+    Raises:
+        RuntimeError: If python prints no import times, as before Python 3.7.
+    """
+    result = subprocess.run([python,'-X','importtime','-c','import %s'%module],
+                            stdout=subprocess.PIPE,stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode:
+        raise ImportError('Could not import %s:\n%s'%(module,result.stderr))
+    loaded = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        loaded[name.strip()] = int(cumulative)/1000
+    if module not in loaded:
+        raise RuntimeError('%s printed no import times; -X importtime needs Python 3.7 or later'
+                           %python)
+    return loaded[module], loaded
+
+
+def check_budget(module,budget_ms,forbidden=FORBIDDEN_MODULES,repeat=3,python=sys.executable):
+    """Check the import of module against its budget, keeping the fastest of repeat runs.
+
+    Returns:
+        (float, list): Import time in milliseconds and the problems found, if any.
+    """
+    elapsed, loaded = min((measure_import(module,python) for _ in range(max(repeat,1))),
+                          key=lambda run: run[0])
+    problems = ['%s imports %s'%(module,name)
+                for name in sorted(set(name.split('.')[0] for name in loaded)) if name in forbidden]
+    if elapsed > budget_ms:
+        slowest = sorted(loaded.items(),key=lambda item: -item[1])[1:6]
+        problems.append('%s took %0.0f ms to import, over its %0.0f ms budget (slowest: %s)'
+                        %(module,elapsed,budget_ms,
+                          ', '.join('%s %0.0f ms'%item for item in slowest)))
+    return elapsed, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('modules',nargs='*',help='modules to check (default: %s)'
+                        %', '.join(sorted(HEADLESS_MODULES)))
+    parser.add_argument('--budget',type=float,help='budget of every module, in milliseconds')
+    parser.add_argument('--repeat',type=int,default=3,
+                        help='runs per module; the fastest one is checked (default: 3)')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules or sorted(HEADLESS_MODULES):
+        budget = args.budget or HEADLESS_MODULES.get(module,300)
+        elapsed, problems = check_budget(module,budget,repeat=args.repeat)
+        print('%-20s %6.0f ms (budget %0.0f ms) %s'%(module,elapsed,budget,
+                                                    'ok' if not problems else 'FAILED'))
+        for problem in problems:
+            print('    '+problem)
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only SQLite journal of finished rows, used to resume long batch jobs.
+
+@author: andrewcarroll
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def row_key(*parts):
+    """16-byte digest identifying an input row, e.g. row_key(document, label)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.digest()
+
+
+class JobJournal:
+
+    def __init__(self,path,job,batch_size=500,flush_interval=2.0):
+        """Journal of the outcome of each row of a named job.
+
+        Note:
+            Keys of rows that completed successfully are loaded into memory when the
+            journal is opened, so is_done is a set lookup. Outcomes are buffered and
+            written in one transaction every batch_size rows or flush_interval seconds;
+            a crash loses at most the unflushed rows, which are then simply redone.
+
+        Args:
+            path (str): SQLite file holding the journal. Several jobs can share one file.
+            job (str): Name of the job, e.g. 'feedback:<modelId>:<csv name>'.
+            batch_size (int, default = 500): Rows buffered before a flush.
+            flush_interval (float, default = 2): Seconds after which buffered rows are
+                flushed by the next record call.
+        """
+        self.path = path
+        self.job = job
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.time()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS journal ('
+                         'job TEXT, key BLOB, status INTEGER, outcome TEXT, recorded_at REAL, '
+                         'PRIMARY KEY (job, key))')
+        self._db.commit()
+        self._done = set(row[0] for row in self._db.execute(
+                'SELECT key FROM journal WHERE job=? AND status=200', (job,)))
+
+    def __repr__(self):
+        return '<%s %s, %s done>'%(self.__class__.__name__,self.job,len(self._done))
+
+    def __len__(self):
+        return len(self._done)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def is_done(self,key):
+        return key in self._done
+
+    def outcome(self,key):
+        """The outcome recorded with the latest status of a row, or None."""
+        with self._lock:
+            for job, buffered_key, _, outcome, _ in reversed(self._buffer):
+                if buffered_key == key:
+                    break
+            else:
+                row = self._db.execute('SELECT outcome FROM journal WHERE job=? AND key=?',
+                                       (self.job,key)).fetchone()
+                outcome = row[0] if row else None
+        return json.loads(outcome) if outcome is not None else None
+
+    def record(self,key,status_code,outcome=None):
+        """Buffer the outcome of a row. Only status 200 marks the row as done.
+
+        Args:
+            key (bytes): Row key from row_key.
+            status_code (int): HTTP status of the row's call, None if it raised.
+            outcome (optional): JSON-serializable detail kept with the row.
+        """
+        with self._lock:
+            if status_code == 200:
+                self._done.add(key)
+            self._buffer.append((self.job, key, status_code,
+                                 json.dumps(outcome) if outcome is not None else None,
+                                 time.time()))
+            if len(self._buffer) >= self.batch_size or \
+                    time.time()-self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO journal VALUES (?,?,?,?,?)',
+                                     self._buffer)
+            self._buffer = []
+        self._last_flush = time.time()
+
+    def counts(self):
+        """Number of journaled rows of the job by status code, including unflushed rows."""
+        self.flush()
+        return dict(self._db.execute('SELECT status, COUNT(*) FROM journal WHERE job=? '
+                                     'GROUP BY status', (self.job,)).fetchall())
+
+    def reset(self):
+        """Forget every row of the job."""
+        with self._lock:
+            self._buffer = []
+            self._done.clear()
+            with self._db:
+                self._db.execute('DELETE FROM journal WHERE job=?', (self.job,))
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LRU/TTL cache of intent predictions, with an optional SQLite tier on disk.
+
+@author: andrewcarroll
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_whitespace(document):
+    """Default key normalization: trim and collapse runs of whitespace."""
+    return _WHITESPACE.sub(' ', document).strip()
+
+
+def normalize_casefold(document):
+    """Normalization that also ignores case, for models trained on case-insensitive data."""
+    return normalize_whitespace(document).casefold()
+
+
+class PredictionCache:
+
+    def __init__(self,maxsize=10000,ttl=3600,normalize=normalize_whitespace,path=None,
+                 flush_size=256,flush_interval=1.0):
+        """Cache of prediction responses keyed on modelId, model version and normalized document.
+
+        Note:
+            A cache is shared by passing it to any number of Model objects. Only
+            successful (status 200) responses are stored. The version of a model is
+            the updatedAt (or createdAt) of its status, so once a retrain is seen by
+            any Model, in any process sharing the disk tier, the entries of the
+            previous version are no longer served. Entries of a model are also
+            dropped when a Model using the cache sees a training or retraining of
+            that model succeed. A put passing the generation read before its call
+            is ignored if an invalidation happened meanwhile.
+
+            Writes to the disk tier are buffered and committed in batches, by the
+            put that fills the buffer to flush_size or finds it older than
+            flush_interval, and by flush() and close(). Disk reads and writes never
+            hold the lock of the memory tier, so memory hits do not wait for SQLite.
+            Buffered entries are lost if the process dies before they are flushed.
+
+        Args:
+            maxsize (int, default = 10000): Maximum number of entries held in memory. The
+                least recently used entry is evicted first.
+            ttl (float, default = 3600): Seconds an entry stays valid. None keeps entries
+                until they are evicted or invalidated.
+            normalize (callable, default = normalize_whitespace): Maps a document to the
+                string used in its key.
+            path (str, optional): SQLite file for a second tier, so warm entries survive
+                restarts. The disk tier is not bounded by maxsize, only by the ttl.
+            flush_size (int, default = 256): Buffered disk writes that trigger a commit.
+            flush_interval (float, default = 1): Seconds after which buffered disk writes
+                are committed by the next put.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.normalize = normalize
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()
+        self._pending = []
+        self._flushed_at = time.time()
+        # Bumped by invalidate, so a disk read racing with it is not stored in memory
+        self._generation = 0
+        # Lock order: _db_lock before _lock
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0,
+                       'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS predictions ('
+                             'model_id TEXT, version TEXT, document TEXT, expires_at REAL, '
+                             'response TEXT, PRIMARY KEY (model_id, version, document))')
+            self._db.commit()
+
+    def __repr__(self):
+        return '<%s %s/%s entries>'%(self.__class__.__name__,len(self._entries),self.maxsize)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expiry(self):
+        return time.time()+self.ttl if self.ttl is not None else None
+
+    @property
+    def generation(self):
+        """Number of invalidations so far, to pass to put for a call started now."""
+        with self._lock:
+            return self._generation
+
+    def _key(self,modelId,version,document):
+        # SQLite does not consider two NULLs equal, so a missing version is stored as ''
+        return (modelId, '' if version is None else str(version), self.normalize(document))
+
+    def get(self,modelId,document,version=None):
+        """Return the cached response for document from this version of the model, or None."""
+        key = self._key(modelId,version,document)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, response = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return response
+                del self._entries[key]
+                self._stats['expirations'] += 1
+            generation = self._generation
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute('SELECT expires_at, response FROM predictions '
+                                       'WHERE model_id=? AND version=? AND document=?', key).fetchone() \
+                    if self._db is not None else None
+            if row and (row[0] is None or row[0] > now):
+                response = json.loads(row[1])
+                with self._lock:
+                    if generation == self._generation:
+                        self._store(key, row[0], response)
+                    self._stats['disk_hits'] += 1
+                return response
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self,modelId,document,response,version=None,generation=None):
+        """Store a response, unless generation is given and the cache was invalidated since."""
+        key = self._key(modelId,version,document)
+        expires_at = self._expiry()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._store(key, expires_at, response)
+            if self._db is None:
+                return
+            self._pending.append(key + (expires_at, json.dumps(response)))
+            due = (len(self._pending) >= self.flush_size or
+                   time.time()-self._flushed_at >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Commit the buffered writes to the disk tier."""
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._flushed_at = time.time()
+            if pending and self._db is not None:
+                self._db.executemany('INSERT OR REPLACE INTO predictions VALUES (?,?,?,?,?)', pending)
+                self._db.commit()
+
+    def _store(self,key,expires_at,response):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def invalidate(self,modelId=None):
+        """Drop the entries of one model, or every entry if modelId is None."""
+        with self._db_lock:
+            with self._lock:
+                if modelId is None:
+                    self._entries.clear()
+                    self._pending = []
+                else:
+                    for key in [k for k in self._entries if k[0] == modelId]:
+                        del self._entries[key]
+                    self._pending = [row for row in self._pending if row[0] != modelId]
+                self._generation += 1
+                self._stats['invalidations'] += 1
+            if self._db is not None:
+                if modelId is None:
+                    self._db.execute('DELETE FROM predictions')
+                else:
+                    self._db.execute('DELETE FROM predictions WHERE model_id=?', (modelId,))
+                self._db.commit()
+
+    def purge_expired(self):
+        """Remove expired entries from both tiers."""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._entries.items()
+                        if expires_at is not None and expires_at <= now]:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+        if self._db is not None:
+            self.flush()
+            with self._db_lock:
+                self._db.execute('DELETE FROM predictions WHERE expires_at <= ?', (now,))
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['disk_hits'])/lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            with self._db_lock:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Session-wide request rate governor: a token bucket and an AIMD concurrency
+limit per endpoint class, backing off on 429/503 and honoring Retry-After.
+
+@author: andrewcarroll
+"""
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import einstein_constants
+from einstein_backoff import Backoff
+
+CONGESTION_STATUS_CODES = (429, 503)
+
+# rate: sustained calls per second, burst: bucket size, concurrency: initial
+# concurrent calls, max_concurrency: ceiling reached by additive increase
+DEFAULT_LIMITS = {
+    'predict': {'rate': 50, 'burst': 50, 'concurrency': 16, 'max_concurrency': 64},
+    'feedback': {'rate': 20, 'burst': 20, 'concurrency': 8, 'max_concurrency': 32},
+    'train': {'rate': 1, 'burst': 5, 'concurrency': 2, 'max_concurrency': 4},
+    'status': {'rate': 10, 'burst': 20, 'concurrency': 8, 'max_concurrency': 32},
+}
+
+
+def endpoint_class(method,url):
+    """Classify a call as 'predict', 'feedback', 'train', 'status' or 'auth'."""
+    path = url.split('?',1)[0]
+    if path.endswith(einstein_constants.OAUTH_ENDPOINT):
+        return 'auth'
+    if path.endswith('/intent'):
+        return 'predict'
+    if path.endswith('/feedback'):
+        return 'feedback'
+    if method != 'GET' and (path.endswith('/train') or path.endswith('/retrain')):
+        return 'train'
+    return 'status'
+
+
+def retry_after_seconds(value):
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value),0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp()-time.time(),0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+
+    def __init__(self,rate,burst):
+        """Token bucket allowing burst calls at once and rate calls per second after."""
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens+(now-self.updated_at)*self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens/self.rate
+
+    def adjust(self,congested):
+        with self._lock:
+            if congested:
+                self.rate = max(self.max_rate/20, self.rate/2)
+            else:
+                self.rate = min(self.max_rate, self.rate+self.max_rate/100)
+
+
+class AIMDLimiter:
+
+    def __init__(self,concurrency,max_concurrency,min_concurrency=1):
+        """Concurrency limit with additive increase and multiplicative decrease.
+
+        The limit grows by about one call per limit's worth of successful calls and
+        is halved by every congestion response.
+        """
+        self.limit = float(concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= max(int(self.limit),self.min_concurrency):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """Take a slot if one is free, without waiting."""
+        with self._condition:
+            if self.in_flight >= max(int(self.limit),self.min_concurrency):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self,congested):
+        with self._condition:
+            self.in_flight -= 1
+            if congested:
+                self.limit = max(float(self.min_concurrency), self.limit/2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit+1/self.limit)
+            self._condition.notify_all()
+
+
+class RateGovernor:
+
+    def __init__(self,limits=None,max_retries=3):
+        """Throttles every call of a session by endpoint class.
+
+        Note:
+            Calls classified as 'auth' are never throttled, so a token refresh cannot be
+            starved by the calls waiting for it.
+
+        Args:
+            limits (dict, optional): Per endpoint class overrides of DEFAULT_LIMITS, e.g.
+                {'predict': {'rate': 100, 'max_concurrency': 128}}.
+            max_retries (int, default = 3): Times a call answered with 429 or 503 is sent
+                again, after waiting for Retry-After or a jittered backoff.
+        """
+        self.max_retries = max_retries
+        self.limits = {}
+        for name, default in DEFAULT_LIMITS.items():
+            self.limits[name] = dict(default)
+            self.limits[name].update((limits or {}).get(name,{}))
+        self.buckets = {}
+        self.limiters = {}
+        for name, limit in self.limits.items():
+            self.buckets[name] = TokenBucket(limit['rate'],limit['burst'])
+            self.limiters[name] = AIMDLimiter(limit['concurrency'],limit['max_concurrency'])
+        self._blocked_until = dict.fromkeys(self.limits,0.0)
+        self._counts = dict((name,{'calls': 0, 'congested': 0, 'retries': 0}) for name in self.limits)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__,sorted(self.limits))
+
+    def acquire(self,name):
+        """Wait for a pause, a rate token and a concurrency slot of the endpoint class."""
+        if name not in self.limits:
+            return
+        pause = self._blocked_until[name]-time.time()
+        if pause > 0:
+            time.sleep(pause)
+        wait = self.buckets[name].reserve()
+        if wait > 0:
+            time.sleep(wait)
+        self.limiters[name].acquire()
+
+    async def acquire_async(self,name):
+        """Coroutine counterpart of acquire, waiting on the event loop instead of a thread."""
+        import asyncio
+        if name not in self.limits:
+            return
+        pause = self._blocked_until[name]-time.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        wait = self.buckets[name].reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        # The limiter is shared with blocking callers, so a free slot is polled for
+        delay = 0.001
+        while not self.limiters[name].try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay*2,0.05)
+
+    def release(self,name,status_code,retry_after=None):
+        """Feed back the outcome of a call acquired with acquire(name).
+
+        Returns:
+            Seconds to wait before retrying, if the call was throttled by the API.
+        """
+        if name not in self.limits:
+            return None
+        congested = status_code in CONGESTION_STATUS_CODES
+        self.limiters[name].release(congested)
+        self.buckets[name].adjust(congested)
+        with self._lock:
+            self._counts[name]['calls'] += 1
+            if congested:
+                self._counts[name]['congested'] += 1
+                pause = retry_after_seconds(retry_after)
+                if pause is not None:
+                    self._blocked_until[name] = max(self._blocked_until[name],time.time()+pause)
+                return pause
+        return None
+
+    def send(self,method,url,send):
+        """Send a call through the governor, retrying it when the API answers 429 or 503.
+
+        Args:
+            method (str): HTTP method, used to classify the call.
+            url (str): Url of the call, used to classify the call.
+            send (callable): Sends the call and returns a requests.Response. It is called
+                again for each retry, so it must rebuild any streamed body.
+        """
+        name = endpoint_class(method,url)
+        if name not in self.limits:
+            return send()
+        backoff = Backoff(initial=1,maximum=30)
+        attempt = 0
+        while True:
+            self.acquire(name)
+            response = None
+            try:
+                response = send()
+            finally:
+                pause = self._released(name,response)
+            if not self._should_retry(name,response,attempt):
+                return response
+            attempt += 1
+            if pause is None:
+                # No Retry-After: back off this caller; a Retry-After pause is applied
+                # to every caller of the class by acquire
+                time.sleep(backoff.next_delay())
+
+    async def send_async(self,method,url,send):
+        """Coroutine counterpart of send, where send() returns an awaitable."""
+        import asyncio
+        name = endpoint_class(method,url)
+        if name not in self.limits:
+            return await send()
+        backoff = Backoff(initial=1,maximum=30)
+        attempt = 0
+        while True:
+            await self.acquire_async(name)
+            response = None
+            try:
+                response = await send()
+            finally:
+                pause = self._released(name,response)
+            if not self._should_retry(name,response,attempt):
+                return response
+            attempt += 1
+            if pause is None:
+                await asyncio.sleep(backoff.next_delay())
+
+    def _released(self,name,response):
+        status_code = response.status_code if response is not None else None
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        return self.release(name,status_code,retry_after)
+
+    def _should_retry(self,name,response,attempt):
+        if response.status_code not in CONGESTION_STATUS_CODES or attempt >= self.max_retries:
+            return False
+        with self._lock:
+            self._counts[name]['retries'] += 1
+        return True
+
+    def stats(self):
+        """Current rate, concurrency limit and call counts of every endpoint class."""
+        with self._lock:
+            stats = dict((name,dict(counts)) for name, counts in self._counts.items())
+        for name in stats:
+            stats[name]['rate'] = self.buckets[name].rate
+            stats[name]['concurrency'] = self.limiters[name].limit
+            stats[name]['in_flight'] = self.limiters[name].in_flight
+            stats[name]['paused_for'] = max(self._blocked_until[name]-time.time(),0.0)
+        return stats
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local TF-IDF and softmax regression classifier trained from an intent CSV,
+used to answer confident documents without calling /intent.
+
+@author: andrewcarroll
+"""
+
+import re
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from dataset import PredictionResult
+from dataset_validator import read_chunks
+
+_TOKEN = re.compile(r'\w+',re.UNICODE)
+DEFAULT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def tokenize(document,ngrams=2):
+    """Lowercased word tokens of document, followed by its word n-grams up to ngrams."""
+    words = _TOKEN.findall(document.lower())
+    tokens = list(words)
+    for n in range(2,ngrams+1):
+        tokens.extend(' '.join(words[i:i+n]) for i in range(len(words)-n+1))
+    return tokens
+
+
+def _softmax(scores):
+    scores = scores-scores.max(axis=1,keepdims=True)
+    np.exp(scores,out=scores)
+    scores /= scores.sum(axis=1,keepdims=True)
+    return scores
+
+
+class ShadowClassifier:
+
+    def __init__(self,ngrams=2,min_df=1,max_features=100000,l2=1e-4,epochs=150,learning_rate=0.2):
+        """TF-IDF features and a softmax regression, trained and evaluated with NumPy.
+
+        Note:
+            Documents are converted to L2-normalized TF-IDF rows kept as sparse
+            (indptr, indices, data) arrays, so a batch is scored with a few vectorized
+            operations and no per-feature Python loop. Training runs full-batch Adam
+            on the cross-entropy with an L2 penalty.
+
+        Args:
+            ngrams (int, default = 2): Longest word n-gram used as a feature.
+            min_df (int, default = 1): Documents a feature must appear in to be kept.
+            max_features (int, default = 100000): Most frequent features kept.
+            l2 (float, default = 1e-4): Weight of the L2 penalty.
+            epochs (int, default = 150): Gradient steps of the training.
+            learning_rate (float, default = 0.2): Step size of Adam.
+
+        Attributes:
+            labels (ndarray): Label names, in the column order of predict_proba.
+            vocabulary (dict): Index of each feature.
+            idf (ndarray): Inverse document frequency of each feature.
+            weights (ndarray): feature x label weights; bias (ndarray): one per label.
+        """
+        self.ngrams = ngrams
+        self.min_df = min_df
+        self.max_features = max_features
+        self.l2 = l2
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.labels = None
+        self.vocabulary = None
+        self.idf = None
+        self.weights = None
+        self.bias = None
+
+    def __repr__(self):
+        if self.labels is None:
+            return '<%s not fitted>'%self.__class__.__name__
+        return '<%s %s labels, %s features>'%(self.__class__.__name__,len(self.labels),len(self.vocabulary))
+
+    @classmethod
+    def from_csv(cls,filepath,labels=None,delimiter=',',encoding='utf-8',**options):
+        """Train on a (document, label) CSV, such as the one given to Dataset.create_dataset.
+
+        Args:
+            filepath (str): CSV file of (document, label) rows.
+            labels (list, optional): Label set of the dataset, e.g. Dataset.labels. Rows
+                with another label are left out, and labels without rows still get a
+                column, so the classifier answers with the dataset's labels.
+            **options: Arguments of ShadowClassifier.
+        """
+        documents, row_labels = [], []
+        with open(filepath,'r',newline='',encoding=encoding) as f:
+            for docs, chunk_labels, blank in read_chunks(f,delimiter=delimiter):
+                for document, label, empty in zip(docs,chunk_labels,blank):
+                    if not empty and document and label:
+                        documents.append(document)
+                        row_labels.append(label)
+        return cls(**options).fit(documents,row_labels,labels)
+
+    # Features
+
+    def _document_features(self,documents):
+        """Sparse term counts of documents over the vocabulary, as (indptr, indices, counts)."""
+        vocabulary = self.vocabulary
+        indptr, indices, counts = [0], [], []
+        for document in documents:
+            row = Counter(vocabulary[t] for t in tokenize(document,self.ngrams) if t in vocabulary)
+            indices.extend(row.keys())
+            counts.extend(row.values())
+            indptr.append(len(indices))
+        return (np.asarray(indptr,dtype=np.int64),np.asarray(indices,dtype=np.int64),
+                np.asarray(counts,dtype=np.float32))
+
+    def transform(self,documents):
+        """L2-normalized TF-IDF rows of documents, as sparse (indptr, indices, data) arrays."""
+        indptr, indices, data = self._document_features(documents)
+        data = (1+np.log(data))*self.idf[indices]
+        lengths = np.diff(indptr)
+        rows = np.repeat(np.arange(len(lengths)),lengths)
+        norms = np.sqrt(np.bincount(rows,weights=data*data,minlength=len(lengths)))
+        data /= np.where(norms > 0,norms,1)[rows]
+        return indptr, indices, data.astype(np.float32)
+
+    def _scores(self,features):
+        indptr, indices, data = features
+        n = len(indptr)-1
+        scores = np.tile(self.bias,(n,1))
+        nonempty = np.flatnonzero(np.diff(indptr) > 0)
+        if len(nonempty):
+            products = self.weights[indices]*data[:,None]
+            scores[nonempty] += np.add.reduceat(products,indptr[nonempty],axis=0)
+        return scores
+
+    # Training
+
+    def fit(self,documents,labels,label_set=None):
+        """Learn the vocabulary, IDF and weights from documents and their labels.
+
+        Args:
+            documents (list): Training documents.
+            labels (list): Label of each document.
+            label_set (list, optional): Labels to answer with, see from_csv.
+        """
+        documents, labels = list(documents), list(labels)
+        assert len(documents) == len(labels), "Every document needs a label"
+        if label_set is not None:
+            allowed = set(label_set)
+            kept = [i for i, label in enumerate(labels) if label in allowed]
+            if len(kept) < len(labels):
+                print('Warning: %s rows with labels outside the dataset were left out'%(len(labels)-len(kept)))
+            documents = [documents[i] for i in kept]
+            labels = [labels[i] for i in kept]
+            self.labels = np.asarray(sorted(allowed),dtype=str)
+        else:
+            self.labels = np.asarray(sorted(set(labels)),dtype=str)
+        assert documents, "No training documents"
+
+        document_frequency = Counter()
+        for document in documents:
+            document_frequency.update(set(tokenize(document,self.ngrams)))
+        kept = [(count, token) for token, count in document_frequency.items() if count >= self.min_df]
+        kept.sort(key=lambda item: (-item[0],item[1]))
+        kept = kept[:self.max_features]
+        self.vocabulary = dict((token,i) for i, (_, token) in enumerate(kept))
+        frequencies = np.fromiter((count for count, _ in kept),np.float64,len(kept))
+        self.idf = (np.log((1+len(documents))/(1+frequencies))+1).astype(np.float32)
+
+        label_index = dict((label,i) for i, label in enumerate(self.labels))
+        targets = np.zeros((len(documents),len(self.labels)),dtype=np.float32)
+        targets[np.arange(len(documents)),[label_index[label] for label in labels]] = 1
+        self._train(self.transform(documents),targets)
+        return self
+
+    def _train(self,features,targets):
+        indptr, indices, data = features
+        n, k = targets.shape
+        rows = np.repeat(np.arange(n),np.diff(indptr))
+        # Entries sorted by feature, so the gradient X'E is one reduceat per step
+        order = np.argsort(indices,kind='stable')
+        feature_rows, feature_data = rows[order], data[order][:,None]
+        sorted_indices = indices[order]
+        starts = np.flatnonzero(np.r_[True,sorted_indices[1:] != sorted_indices[:-1]]) if len(order) else order
+        present = sorted_indices[starts]
+
+        self.weights = np.zeros((len(self.vocabulary),k),dtype=np.float32)
+        self.bias = np.zeros(k,dtype=np.float32)
+        parameters = (self.weights,self.bias)
+        moments = [(np.zeros_like(p),np.zeros_like(p)) for p in parameters]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for step in range(1,self.epochs+1):
+            error = ((_softmax(self._scores(features))-targets)/n).astype(np.float32)
+            weight_gradient = self.l2*self.weights
+            if len(starts):
+                weight_gradient[present] += np.add.reduceat(feature_data*error[feature_rows],starts,axis=0)
+            gradients = (weight_gradient,error.sum(axis=0))
+            for parameter, gradient, (m, v) in zip(parameters,gradients,moments):
+                m *= beta1
+                m += (1-beta1)*gradient
+                v *= beta2
+                v += (1-beta2)*gradient*gradient
+                parameter -= self.learning_rate*(m/(1-beta1**step))/(np.sqrt(v/(1-beta2**step))+eps)
+
+    # Inference
+
+    def predict_proba(self,documents):
+        """document x label probabilities, columns in the order of labels."""
+        assert self.weights is not None, "The classifier hasn't been fitted."
+        return _softmax(self._scores(self.transform(documents)))
+
+    def predict(self,documents):
+        """(labels, confidences) arrays: the most probable label of each document and its probability."""
+        probabilities = self.predict_proba(documents)
+        best = probabilities.argmax(axis=1)
+        return self.labels[best], probabilities[np.arange(len(best)),best]
+
+    def response(self,probabilities,top=None):
+        """A /intent style response for one row of predict_proba."""
+        order = np.argsort(-probabilities,kind='stable')[:top]
+        return {'probabilities': [{'label': str(self.labels[i]), 'probability': float(probabilities[i])}
+                                  for i in order],
+                'object': 'predictresponse', 'source': 'shadow'}
+
+    def classify(self,document,top=None):
+        """Classify one document locally, answering like Model.predict."""
+        return self.response(self.predict_proba([document])[0],top), 200
+
+    # Persistence
+
+    def save(self,path):
+        assert self.weights is not None, "The classifier hasn't been fitted."
+        tokens = sorted(self.vocabulary,key=self.vocabulary.get)
+        np.savez_compressed(path,labels=self.labels,tokens=np.asarray(tokens,dtype=str),idf=self.idf,
+                            weights=self.weights,bias=self.bias,
+                            options=np.asarray([self.ngrams,self.min_df,self.max_features]))
+
+    @classmethod
+    def load(cls,path):
+        with np.load(path) as saved:
+            ngrams, min_df, max_features = (int(x) for x in saved['options'])
+            classifier = cls(ngrams=ngrams,min_df=min_df,max_features=max_features)
+            classifier.labels = saved['labels']
+            classifier.vocabulary = dict((str(token),i) for i, token in enumerate(saved['tokens']))
+            classifier.idf = saved['idf']
+            classifier.weights = saved['weights']
+            classifier.bias = saved['bias']
+        return classifier
+
+
+class ShadowRouter:
+
+    def __init__(self,model,shadow,threshold=0.9,top=None):
+        """Answers confident documents with a ShadowClassifier and sends the rest to a Model.
+
+        Args:
+            model (Model): Trained remote model, used below threshold.
+            shadow (ShadowClassifier): Local classifier of the same dataset.
+            threshold (float, default = 0.9): Local confidence from which the local
+                answer is used. Pick it with agreement_report.
+            top (int, optional): Probabilities kept in local answers, all by default.
+
+        Attributes:
+            counts (dict): Documents answered 'local' and 'remote'.
+        """
+        self.model = model
+        self.shadow = shadow
+        self.threshold = threshold
+        self.top = top
+        self.counts = {'local': 0, 'remote': 0}
+
+    def __repr__(self):
+        return '<%s threshold=%s %s>'%(self.__class__.__name__,self.threshold,self.counts)
+
+    def predict(self,document):
+        """Classify one document, returning (response, status_code) like Model.predict."""
+        probabilities = self.shadow.predict_proba([document])[0]
+        if probabilities.max() >= self.threshold:
+            self.counts['local'] += 1
+            return self.shadow.response(probabilities,self.top), 200
+        self.counts['remote'] += 1
+        return self.model.predict(document)
+
+    def predict_many(self,documents,batch_size=256,max_workers=8):
+        """Classify many documents, yielding PredictionResults in input order.
+
+        Note:
+            Each batch is classified locally in one vectorized pass; only its documents
+            below threshold are sent to Model.predict_many. Local answers carry
+            'source': 'shadow'.
+        """
+        documents = iter(documents)
+        start = 0
+        while True:
+            batch = list(islice(documents,batch_size))
+            if not batch:
+                return
+            probabilities = self.shadow.predict_proba(batch)
+            remote = np.flatnonzero(probabilities.max(axis=1) < self.threshold)
+            answers = {}
+            if len(remote):
+                for result in self.model.predict_many([batch[i] for i in remote],max_workers=max_workers):
+                    i = remote[result.index]
+                    answers[i] = result._replace(index=start+i)
+            self.counts['remote'] += len(remote)
+            self.counts['local'] += len(batch)-len(remote)
+            for i, document in enumerate(batch):
+                if i in answers:
+                    yield answers[i]
+                else:
+                    yield PredictionResult(start+i,document,self.shadow.response(probabilities[i],self.top),200,None)
+            start += len(batch)
+
+
+def agreement_report(model,shadow,documents,thresholds=DEFAULT_THRESHOLDS,max_workers=8):
+    """Compare the local classifier with the remote model on documents.
+
+    Every document is sent to the remote model once. For each threshold, coverage is
+    the fraction of documents a ShadowRouter with that threshold would answer locally,
+    and agreement the fraction of those where the local label is the remote one.
+
+    Returns:
+        dict with 'documents', 'compared' (documents the remote model answered),
+        'agreement' overall, 'by_label' (remote label: documents, agreement),
+        'thresholds' (list of threshold, coverage, agreement), and 'disagreements'
+        ('<remote label> -> <local label>': count).
+    """
+    documents = list(documents)
+    local_labels, confidences = shadow.predict(documents)
+    remote_labels = np.full(len(documents),'',dtype=object)
+    answered = np.zeros(len(documents),bool)
+    for result in model.predict_many(documents,max_workers=max_workers):
+        if result.ok:
+            remote_labels[result.index] = result.response['probabilities'][0]['label']
+            answered[result.index] = True
+    local_labels = local_labels.astype(object)[answered]
+    remote_labels = remote_labels[answered]
+    confidences = confidences[answered]
+    agree = local_labels == remote_labels
+
+    by_label = {}
+    for label in sorted(set(remote_labels)):
+        mask = remote_labels == label
+        by_label[label] = {'documents': int(mask.sum()), 'agreement': float(agree[mask].mean())}
+    levels = []
+    for threshold in thresholds:
+        local = confidences >= threshold
+        levels.append({'threshold': threshold,
+                       'coverage': float(local.mean()) if len(local) else 0.0,
+                       'agreement': float(agree[local].mean()) if local.any() else None})
+    disagreements = Counter('%s -> %s'%pair for pair in zip(remote_labels[~agree],local_labels[~agree]))
+    return {'documents': len(documents), 'compared': int(answered.sum()),
+            'agreement': float(agree.mean()) if len(agree) else None,
+            'by_label': by_label, 'thresholds': levels,
+            'disagreements': dict(disagreements.most_common())}
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-flight coalescing: concurrent identical idempotent calls of a session
+share one HTTP call and all receive its response.
+
+@author: andrewcarroll
+"""
+
+import threading
+
+# POST endpoints that only read, so identical concurrent calls can share a response
+IDEMPOTENT_POST_PATHS = ('/intent',)
+# Call options that do not change the response
+NEUTRAL_OPTIONS = ('timeout',)
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _frozen(items):
+    """Sorted tuple of (name, value) pairs, or None if a value is not a plain scalar."""
+    frozen = []
+    for name, value in sorted((items or {}).items()):
+        if not isinstance(value,_SCALARS):
+            return None
+        frozen.append((name,value))
+    return tuple(frozen)
+
+
+def flight_key(method,url,fields=None,token=None,post_paths=IDEMPOTENT_POST_PATHS,**kwargs):
+    """Key identifying identical calls, or None if the call must not be shared.
+
+    GET calls and POST calls to one of post_paths are shared when their form fields
+    and params are plain values. Calls with a raw body, files, callable fields or
+    any option other than a timeout are always sent on their own. The token is part
+    of the key, so calls made with different tokens never share a response.
+    """
+    if method == 'GET':
+        pass
+    elif method != 'POST' or not url.split('?',1)[0].endswith(post_paths):
+        return None
+    if callable(fields) or any(name not in NEUTRAL_OPTIONS+('params',) for name in kwargs):
+        return None
+    frozen_fields = _frozen(fields)
+    frozen_params = _frozen(kwargs.get('params'))
+    if frozen_fields is None or frozen_params is None:
+        return None
+    return (method, url, frozen_fields, frozen_params, token)
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.waiters = 0
+
+
+class _LeaderCancelled(Exception):
+    """Tells the callers waiting on a coroutine call that its sender was cancelled."""
+
+
+class SingleFlight:
+
+    def __init__(self,post_paths=IDEMPOTENT_POST_PATHS):
+        """Shares one call among concurrent callers asking for the same thing.
+
+        Note:
+            The first caller of a key sends the call; callers arriving with the
+            same key while it is in flight wait for it and receive the same
+            response object, or the same exception. Nothing is kept once the call
+            completes, so this is not a cache: a call made afterwards is sent again.
+            A waiter can get a response sent shortly before it asked, which is what
+            makes a burst of status polls cost a single call.
+
+        Args:
+            post_paths (tuple, default = IDEMPOTENT_POST_PATHS): Endpoints, by path
+                suffix, whose POST calls may be shared besides every GET call.
+        Attributes:
+            sent (int): Calls sent by a leading caller.
+            shared (int): Calls answered with the response of another caller's call.
+        """
+        self.post_paths = tuple(post_paths)
+        self.sent = 0
+        self.shared = 0
+        self._flights = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s sent=%s shared=%s>'%(self.__class__.__name__,self.sent,self.shared)
+
+    def key(self,method,url,fields=None,token=None,**kwargs):
+        return flight_key(method,url,fields,token,self.post_paths,**kwargs)
+
+    def do(self,key,send):
+        """Return send(), sharing it with concurrent callers of the same key.
+
+        Args:
+            key (hashable): Key of the call, see flight_key. None sends the call alone.
+            send (callable): Sends the call and returns a requests.Response.
+
+        Returns:
+            requests.Response
+        """
+        if key is None:
+            return send()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+                self.shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        try:
+            response = send()
+            # Load the body before the response is handed to other threads
+            response.content
+            flight.response = response
+            return response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                self.sent += 1
+            flight.done.set()
+
+    async def do_async(self,key,send):
+        """Coroutine counterpart of do, where send() returns an awaitable.
+
+        Note:
+            Callers sharing a call must run on the same event loop. If the caller
+            sending the call is cancelled, the others are not: one of them sends the
+            call again.
+        """
+        import asyncio
+        if key is None:
+            return await send()
+        while True:
+            with self._lock:
+                future = self._futures.get(key)
+                leader = future is None
+                if leader:
+                    future = self._futures[key] = asyncio.get_event_loop().create_future()
+                else:
+                    self.shared += 1
+            if leader:
+                break
+            try:
+                # A waiter being cancelled must not cancel the call of the others
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+        try:
+            response = await send()
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved, as there may be no waiter to see it
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._futures[key]
+                self.sent += 1
+
+    def stats(self):
+        with self._lock:
+            return {'sent': self.sent, 'shared': self.shared,
+                    'in_flight': len(self._flights)+len(self._futures)}
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the tests.
+
+@author: andrewcarroll
+"""
+
+
+def private_key():
+    """A fresh PEM encoded RSA key, for sessions that sign their own token requests."""
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537,key_size=2048,backend=default_backend())
+    return key.private_bytes(serialization.Encoding.PEM,serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode('utf-8')
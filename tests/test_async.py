@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the asyncio clients against a local stand-in server.
+
+Run from the repository root with: python -m unittest discover tests
+
+@author: andrewcarroll
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from einstein_async import AsyncEinsteinPlatformSession, AsyncDataset, AsyncModel
+from einstein_standin import StandinServer
+from helpers import private_key
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class AsyncClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.private_key = private_key()
+
+    def setUp(self):
+        self.server = StandinServer(seed=1)
+        self.server.start()
+        self.datasetId = str(self.server.add_dataset())
+        self.modelId = self.server.add_model(self.datasetId)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def session(self,**options):
+        options.setdefault('token',self.server.issue_token())
+        return AsyncEinsteinPlatformSession(base_url=self.server.base_url,**options)
+
+    def test_predict_all_keeps_order_and_bounds_concurrency(self):
+        documents = ['document %d'%i for i in range(50)]
+
+        async def scenario():
+            async with self.session() as session:
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                results = await model.predict_all(iter(documents),max_concurrency=4)
+                return results, session.metrics()['endpoints']['predict']
+        results, predict = run(scenario())
+        self.assertEqual(len(results),len(documents))
+        self.assertEqual(set(status for _, status in results),{200})
+        self.assertEqual(predict['calls'],len(documents))
+        self.assertEqual(predict['in_flight'],0)
+        self.assertEqual(self.server.stats()['predict']['requests'],len(documents))
+
+    def test_identical_predictions_share_one_call(self):
+        async def scenario():
+            async with self.session() as session:
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                await model.model_isReady()
+                results = await asyncio.gather(*[model.predict('same document') for _ in range(10)])
+                return results, session.connection_stats()
+        results, stats = run(scenario())
+        self.assertEqual(len(set(str(response) for response, _ in results)),1)
+        self.assertEqual(stats['coalesced'],9)
+        self.assertEqual(self.server.stats()['predict']['requests'],1)
+
+    def test_cancelling_the_first_caller_does_not_cancel_the_others(self):
+        self.server.stop()
+        self.server = StandinServer(seed=1,latency={'predict': 0.2})
+        self.server.start()
+        self.datasetId = str(self.server.add_dataset())
+        self.modelId = self.server.add_model(self.datasetId)
+
+        async def scenario():
+            async with self.session() as session:
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                await model.model_isReady()
+                first = asyncio.ensure_future(model.predict('same document'))
+                await asyncio.sleep(0.05)
+                others = asyncio.ensure_future(asyncio.gather(*[model.predict('same document')
+                                                                for _ in range(3)]))
+                await asyncio.sleep(0.05)
+                first.cancel()
+                return await others, first.cancelled()
+        results, cancelled = run(scenario())
+        self.assertTrue(cancelled)
+        self.assertEqual([status for _, status in results],[200]*3)
+        self.assertEqual(self.server.stats()['predict']['requests'],2)
+
+    def test_expired_token_is_refreshed_and_call_replayed(self):
+        async def scenario():
+            async with self.session(token=None,email='test@example.com',
+                                    private_key=self.private_key) as session:
+                first_token = session.token
+                self.server.expire_tokens()
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                response, status = await model.update_model_status()
+                return first_token, session.token, status, session.metrics()['endpoints']
+        first_token, token, status, endpoints = run(scenario())
+        self.assertEqual(status,200)
+        self.assertNotEqual(first_token,token)
+        self.assertEqual(endpoints['auth']['calls'],2)
+        self.assertEqual(endpoints['status']['status_codes'],{'200': 1, '401': 1})
+        self.assertEqual(endpoints['status']['retries'],1)
+
+    def upload(self,setup,**options):
+        """Upload a CSV of 20 examples with AsyncDataset.create_dataset, calling setup first."""
+        path = os.path.join(self.directory,'examples.csv')
+        with open(path,'w',encoding='utf-8') as f:
+            f.writelines('example %d,%s\n'%(i,label) for i in range(10) for label in ('billing','shipping'))
+
+        async def scenario():
+            async with self.session(**options) as session:
+                dataset = AsyncDataset(session)
+                before = session.token
+                setup()
+                msg, status = await dataset.create_dataset(filepath=path)
+                return msg, status, before != session.token
+        return run(scenario())
+
+    def test_file_upload_is_sent_whole_when_replayed_after_a_401(self):
+        msg, status, refreshed = self.upload(token=None,email='test@example.com',
+                                             private_key=self.private_key,
+                                             setup=self.server.expire_tokens)
+        self.assertEqual(status,200)
+        self.assertTrue(refreshed)
+        self.assertEqual(msg['totalExamples'],20)
+        self.assertEqual(self.server.stats()['status']['status_codes'],{'200': 1, '401': 1})
+
+    def test_file_upload_is_sent_whole_when_retried_after_a_429(self):
+        self.server.retry_after = 0.01
+        msg, status, _ = self.upload(setup=lambda: self.server.set_faults({'status': {'rate_limit': 0.5}}))
+        self.assertEqual(status,200)
+        self.assertGreater(self.server.stats()['status']['faults']['rate_limit'],0)
+        self.assertEqual(msg['totalExamples'],20)
+
+    def test_failed_refresh_returns_the_401_without_replaying(self):
+        async def scenario():
+            async with self.session(token=None,email='test@example.com',
+                                    private_key=self.private_key) as session:
+                self.server.expire_tokens()
+                self.server.set_faults({'auth': {'server_error': 1.0}})
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                response, status = await model.update_model_status()
+                return status, session.metrics()['endpoints']
+        status, endpoints = run(scenario())
+        self.assertEqual(status,401)
+        self.assertEqual(endpoints['status']['status_codes'],{'401': 1})
+        self.assertEqual(endpoints['auth']['status_codes'],{'200': 1, '503': 1})
+
+    def test_failed_model_is_not_polled_again(self):
+        async def scenario():
+            async with self.session() as session:
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                model.model_metadata = {'modelId': self.modelId, 'status': 'FAILED'}
+                ready = [await model.model_isReady() for _ in range(3)]
+                return ready, session.metrics()['endpoints']
+        ready, endpoints = run(scenario())
+        self.assertEqual(ready,[True]*3)
+        self.assertNotIn('status',endpoints)
+
+    def test_dataset_status_and_paged_listing(self):
+        for _ in range(4):
+            self.server.add_dataset()
+
+        async def scenario():
+            async with self.session() as session:
+                dataset = AsyncDataset(session,datasetId=self.datasetId)
+                ready = await dataset.dataset_isReady()
+                datasets = [item async for item in session.iter_datasets(page_size=2)]
+                return ready, dataset.labels, datasets
+        ready, labels, datasets = run(scenario())
+        self.assertTrue(ready)
+        self.assertTrue(labels)
+        self.assertEqual(len(datasets),5)
+
+    def test_page_size_above_the_server_maximum_lists_everything(self):
+        for _ in range(30):
+            self.server.add_dataset()
+
+        async def scenario():
+            async with self.session() as session:
+                return [item async for item in session.iter_datasets(page_size=100)]
+        self.assertEqual(len(run(scenario())),31)
+
+    def test_rate_limited_calls_are_retried_by_the_governor(self):
+        self.server.retry_after = 0.01
+
+        async def scenario():
+            async with self.session() as session:
+                model = AsyncModel(session=session,datasetId=self.datasetId,modelId=self.modelId)
+                await model.model_isReady()
+                self.server.set_faults({'predict': {'rate_limit': 0.3}})
+                results = [await model.predict('document %d'%i) for i in range(20)]
+                return results, session.governor.stats()['predict'], session.metrics()['endpoints']
+        results, governor, endpoints = run(scenario())
+        rate_limited = self.server.stats()['predict']['faults']['rate_limit']
+        self.assertGreater(rate_limited,0)
+        self.assertEqual(governor['congested'],rate_limited)
+        self.assertEqual(governor['retries'],endpoints['predict']['retries'])
+        self.assertEqual(sum(1 for _, status in results if status == 200)+
+                         sum(1 for _, status in results if status == 429),20)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the command-line entry point against a local stand-in server.
+
+Run from the repository root with: python -m unittest discover tests
+
+@author: andrewcarroll
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import dataset
+import einstein_cli
+from einstein_standin import StandinServer
+from helpers import private_key
+
+
+class CommandLineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandinServer(seed=1,dataset_seconds=0.1,train_seconds=0.2)
+        self.server.start()
+        self.datasetId = self.server.add_dataset()
+        self.modelId = self.server.add_model(self.datasetId)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self,name,text):
+        path = os.path.join(self.directory,name)
+        with open(path,'w',encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def run_cli(self,*argv,token=True):
+        """Run the command line, returning its exit code, stdout lines as JSON and stderr."""
+        options = ['--base-url',self.server.base_url]
+        if token:
+            options += ['--token',self.server.issue_token()]
+        out, err = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = einstein_cli.main(options+list(argv))
+        return code, out.getvalue().splitlines(), err.getvalue()
+
+    def test_session_from_a_certificate(self):
+        cert = self.write('einstein_platform.pem',private_key())
+        code, lines, _ = self.run_cli('--email','test@example.com','--cert',cert,
+                                      'session','--token-only',token=False)
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.assertTrue(self.server.token_valid(lines[0]))
+
+    def test_status_of_a_model_and_a_dataset(self):
+        code, lines, err = self.run_cli('status','model',self.modelId)
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.assertEqual(json.loads(lines[0])['modelId'],self.modelId)
+        self.assertNotIn('Model requires',err)
+
+        code, lines, _ = self.run_cli('status','dataset',self.datasetId)
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.assertTrue(json.loads(lines[0])['available'])
+
+    def test_status_of_a_missing_model_fails(self):
+        code, _, _ = self.run_cli('status','model','missing')
+        self.assertEqual(code,einstein_cli.EXIT_FAILED)
+
+    def test_predict_streams_results_in_order_and_reports_malformed_records(self):
+        path = self.write('docs.jsonl','{"document": "first", "id": 1}\n'
+                                       'not json\n'
+                                       '"second"\n'
+                                       '{"text": "no document field"}\n'
+                                       '{"document": "third", "id": 3}\n')
+        code, lines, err = self.run_cli('predict',self.modelId,path,'--top-only')
+        results = [json.loads(line) for line in lines]
+        self.assertEqual(code,einstein_cli.EXIT_FAILED)
+        self.assertEqual([result['index'] for result in results],[0,1,2])
+        self.assertEqual([result.get('id') for result in results],[1,None,3])
+        self.assertTrue(all('label' in result and 'probabilities' not in result for result in results))
+        self.assertIn('"line": 2',err)
+        self.assertIn('"line": 4',err)
+        self.assertNotIn('Model requires',err)
+        self.assertEqual(self.server.stats()['predict']['requests'],3)
+
+    def test_predict_reports_a_response_without_probabilities(self):
+        request_prediction = dataset.Model._request_prediction
+
+        def answer(model,document):
+            if document == 'odd':
+                return {'object': 'predictresponse'}, 200
+            return request_prediction(model,document)
+        path = self.write('docs.txt','first\nodd\nlast\n')
+        with mock.patch.object(dataset.Model,'_request_prediction',answer):
+            code, lines, _ = self.run_cli('predict',self.modelId,path,'--format','text')
+        results = [json.loads(line) for line in lines]
+        self.assertEqual(code,einstein_cli.EXIT_FAILED)
+        self.assertEqual(len(results),3)
+        self.assertIn('label',results[0])
+        self.assertIn('malformed response',results[1]['error'])
+        self.assertIn('label',results[2])
+
+    def test_predict_resumes_from_its_journal(self):
+        path = self.write('docs.txt',''.join('document %d\n'%i for i in range(12)))
+        journal = os.path.join(self.directory,'journal.sqlite')
+        first = self.run_cli('predict',self.modelId,path,'--format','text','--journal',journal)
+        second = self.run_cli('predict',self.modelId,path,'--format','text','--journal',journal)
+        self.assertEqual(first[0],einstein_cli.EXIT_OK)
+        self.assertEqual(second[0],einstein_cli.EXIT_OK)
+        self.assertEqual(first[1],second[1])
+        self.assertEqual(self.server.stats()['predict']['requests'],12)
+
+    def test_feedback_skips_unknown_labels(self):
+        path = self.write('feedback.csv','where is my parcel,shipping\n'
+                                         '"refund, please",returns\n'
+                                         'hello,no such label\n')
+        code, lines, _ = self.run_cli('feedback',self.modelId,path)
+        progress = json.loads(lines[-1])
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.assertEqual((progress['read'],progress['succeeded'],progress['invalid_label']),(3,2,1))
+        self.assertEqual(self.server.stats()['feedback']['requests'],2)
+
+    def test_training_without_a_name_replays_from_a_cassette(self):
+        cassette = os.path.join(self.directory,'train.jsonl.gz')
+        code, recorded, _ = self.run_cli('--record',cassette,'train',self.datasetId)
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.server.stop()
+        code, replayed, _ = self.run_cli('--replay',cassette,'train',self.datasetId)
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.assertEqual(replayed,recorded)
+
+    def test_upload_and_train_wait_until_ready(self):
+        rows = ''.join('example %d of %s,%s\n'%(i,label,label)
+                       for label in ('billing','shipping') for i in range(10))
+        path = self.write('examples.csv',rows)
+        code, lines, _ = self.run_cli('upload',path,'--wait','--timeout','30')
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        datasetId = str(json.loads(lines[-1])['id'])
+
+        code, lines, _ = self.run_cli('train',datasetId,'--name','intents','--wait','--timeout','30')
+        self.assertEqual(code,einstein_cli.EXIT_OK)
+        self.assertEqual(json.loads(lines[-1])['status'],'SUCCEEDED')
+
+if __name__ == '__main__':
+    unittest.main()
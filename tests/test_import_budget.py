@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import-time budget of the headless modules, checked with import_budget.
+
+Run from the repository root with: python -m unittest discover tests
+
+@author: andrewcarroll
+"""
+
+import sys
+import unittest
+
+from import_budget import FORBIDDEN_MODULES, HEADLESS_MODULES, check_budget
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime needs Python 3.7 or later')
+class ImportBudgetTest(unittest.TestCase):
+
+    def test_headless_modules_stay_within_budget(self):
+        for module, budget in sorted(HEADLESS_MODULES.items()):
+            with self.subTest(module=module):
+                elapsed, problems = check_budget(module,budget)
+                forbidden = [problem for problem in problems
+                             if problem.split()[-1] in FORBIDDEN_MODULES]
+                self.assertEqual(forbidden,[])
+                self.assertEqual(problems,[])
+
+if __name__ == '__main__':
+    unittest.main()